@@ -0,0 +1,143 @@
+#!/usr/bin/python
+'''
+Hit/miss rates of the crawler caches replaying a trace of visits: direct
+mapped (CrawlerCache), with a collision history, and set associative at
+2/4/8 ways, each at several table sizes.
+
+    python benchmarks/crawler_cache.py [--masks 6,8,10] [--trace visits.txt]
+
+The trace is one URI per line (i.e. the 'crawling' URIs of a crawler's log),
+or, without --trace, a random walk over a ChainAPI-like tree of sites ->
+devices -> sensors, moving from each resource to a random link (its
+children or its parent) like the crawler does.
+
+Each visit is replayed the way crawl_node uses the cache: check whether
+the URI is cached (a hit is a revisit the cache remembered), then put it.
+Hit rates are against a fully associative LRU table with the same number
+of slots (ideal), which only misses on URIs it has never held or had to
+evict for lack of room, so ideal - hit rate is what the cache loses to
+collisions.
+'''
+
+from collections import OrderedDict
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from globalConfig import log
+from crawlerCache import CrawlerCache, CrawlerCacheWithCollisionHistory, \
+        SetAssociativeCrawlerCache
+import logging
+
+log.setLevel(logging.WARN)
+
+
+class LruTable(object):
+    #fully associative LRU table of 'slots' URIs, the reference the caches
+    #are compared against
+
+    def __init__(self, slots):
+        self._slots = slots
+        self._table = OrderedDict()
+
+
+    def check(self, uri):
+        return uri in self._table
+
+
+    def put_and_collision(self, uri):
+        collision = False
+        if uri in self._table:
+            del self._table[uri]
+        elif len(self._table) >= self._slots:
+            self._table.popitem(last=False)
+            collision = True
+        self._table[uri] = True
+        return collision
+
+
+
+def random_walk(steps, sites, devices, sensors, seed):
+    '''URIs visited by a random walk over a tree of sites -> devices ->
+    sensors, from the entry point'''
+
+    rng = random.Random(seed)
+    base = 'http://learnair.media.mit.edu:8000'
+
+    def links(node):
+        kind, number = node
+        if kind == 'root':
+            return [('site', x) for x in range(sites)]
+        if kind == 'site':
+            return [('root', 0)] + [('device', number * devices + x) for x in range(devices)]
+        if kind == 'device':
+            return [('site', number // devices)] + \
+                    [('sensor', number * sensors + x) for x in range(sensors)]
+        return [('device', number // sensors)]
+
+    node = ('root', 0)
+    trace = []
+    for i in xrange(steps):
+        trace.append('%s/%ss/%d' % (base, node[0], node[1]))
+        node = rng.choice(links(node))
+
+    return trace
+
+
+def replay(cache, trace):
+    '''returns (hits, collisions) of cache over trace'''
+
+    hits = 0
+    collisions = 0
+
+    for uri in trace:
+        hits += cache.check(uri)
+        collisions += cache.put_and_collision(uri)
+
+    return hits, collisions
+
+
+def caches(mask_length):
+    yield 'direct mapped', CrawlerCache(mask_length)
+    yield 'collision history', CrawlerCacheWithCollisionHistory(mask_length)
+    for ways in (2, 4, 8):
+        yield '%d-way' % ways, SetAssociativeCrawlerCache(mask_length, ways)
+    yield 'ideal (LRU)', LruTable(2**mask_length)
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--masks', default='6,8,10', \
+            help='comma separated cache_table_mask_lengths')
+    parser.add_argument('--trace', help='file of visited URIs, one per line')
+    parser.add_argument('--steps', type=int, default=200000, help='random walk length')
+    parser.add_argument('--sites', type=int, default=10)
+    parser.add_argument('--devices', type=int, default=20, help='devices per site')
+    parser.add_argument('--sensors', type=int, default=10, help='sensors per device')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace) as trace_file:
+            trace = [x.strip() for x in trace_file if x.strip()]
+    else:
+        trace = random_walk(args.steps, args.sites, args.devices, args.sensors, args.seed)
+
+    print '%d visits, %d distinct URIs' % (len(trace), len(set(trace)))
+    print '%-18s %6s %10s %10s %14s %10s' % ('cache', 'slots', 'hit rate', 'miss rate', \
+            'collision rate', 'us/visit')
+
+    for mask_length in [int(x) for x in args.masks.split(',')]:
+        for name, cache in caches(mask_length):
+            start = time.time()
+            hits, collisions = replay(cache, trace)
+            elapsed = (time.time() - start) / len(trace) * 1e6
+            print '%-18s %6d %10.4f %10.4f %14.4f %10.2f' % (name, 2**mask_length, \
+                    hits / float(len(trace)), 1 - hits / float(len(trace)), \
+                    collisions / float(len(trace)), elapsed)
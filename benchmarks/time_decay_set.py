@@ -0,0 +1,141 @@
+#!/usr/bin/python
+'''
+Per-operation cost of TimeDecaySet at 10k/100k/1M entries, against the
+list based implementation it replaced (kept below as ListTimeDecaySet).
+
+    python benchmarks/time_decay_set.py [--sizes 10000,100000,1000000]
+
+For each size, the set is filled with that many distinct URIs, and then
+we time:
+    add       adding new URIs (each add also checks membership and expiry)
+    contains  in_set for URIs in the set
+    expiry    remove_timed_out_values with every entry timed out, per entry
+
+The list implementation scans every entry on each call, so filling it with
+add would take hours at 1M; it is filled directly (the same entries add
+would have made) and timed over fewer operations.
+'''
+
+from datetime import datetime
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from timeDecaySet import TimeDecaySet, clock
+
+
+class ListTimeDecaySet(object):
+    #the TimeDecaySet before the dict/queue rewrite (the methods timed here)
+
+    def __init__(self, minute_decay=1):
+        self._minute_decay = minute_decay
+        self._list = []
+
+
+    def add(self, value):
+        #only add if not in set
+        if self.in_set(value):
+            return False
+        else:
+            #push value with unix timestamp
+            self._list.append({'val':value, \
+                    'timestamp':time.mktime(datetime.now().timetuple())})
+            return True
+
+
+    def in_set(self, value):
+        self.remove_timed_out_values()
+        if (value in (x['val'] for x in self._list)):
+            return True
+        else:
+            return False
+
+
+    def remove_timed_out_values(self):
+        #since they are appended chronologically, we can simply find
+        #the index where now-time>minutes and remove everything before that
+        index = 0
+        now = time.mktime(datetime.now().timetuple())
+
+        while (index<len(self._list) and ((now - self._list[index]['timestamp'])/60 > self._minute_decay)):
+            index = index + 1
+
+        #only remove values if our minute_decay value has been set to a positive value
+        if (self._minute_decay > 0):
+            self._list = self._list[index:]
+
+
+
+MINUTE_DECAY = 720
+
+
+def uri(i):
+    return 'http://learnair.media.mit.edu:8000/sensors/%d' % i
+
+
+def fill(implementation, size, age=0):
+    '''a set of implementation holding size URIs, added age seconds ago'''
+
+    decay_set = implementation(MINUTE_DECAY)
+
+    if implementation is TimeDecaySet:
+        timestamp = clock() - age
+        for i in xrange(size):
+            entry = (timestamp, uri(i))
+            decay_set._queue.append(entry)
+            decay_set._index[entry[1]] = entry
+    else:
+        timestamp = time.mktime(datetime.now().timetuple()) - age
+        decay_set._list = [{'val':uri(i), 'timestamp':timestamp} for i in xrange(size)]
+
+    return decay_set
+
+
+def per_op(function, values):
+    '''average time of function over values, in us'''
+
+    start = time.time()
+    for value in values:
+        function(value)
+    return (time.time() - start) / len(values) * 1e6
+
+
+def benchmark(implementation, size, ops):
+
+    decay_set = fill(implementation, size)
+    add = per_op(decay_set.add, [uri(size + i) for i in xrange(ops)])
+
+    step = max(1, size // ops)
+    contains = per_op(decay_set.in_set, [uri(i) for i in xrange(0, size, step)][:ops])
+
+    decay_set = fill(implementation, size, age=MINUTE_DECAY * 60 + 120)
+    start = time.time()
+    decay_set.remove_timed_out_values()
+    expiry = (time.time() - start) / size * 1e6
+
+    return add, contains, expiry
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000', \
+            help='comma separated set sizes')
+    parser.add_argument('--ops', type=int, default=100000, \
+            help='operations to time per size (new implementation)')
+    parser.add_argument('--list-ops', type=int, default=20, \
+            help='operations to time per size (list implementation)')
+    args = parser.parse_args()
+
+    print '%-18s %10s %14s %14s %14s' % ('implementation', 'entries', \
+            'add us/op', 'contains us/op', 'expiry us/op')
+
+    for size in [int(x) for x in args.sizes.split(',')]:
+        for name, implementation, ops in [('ListTimeDecaySet', ListTimeDecaySet, args.list_ops), \
+                ('TimeDecaySet', TimeDecaySet, args.ops)]:
+            add, contains, expiry = benchmark(implementation, size, ops)
+            print '%-18s %10d %14.2f %14.2f %14.3f' % (name, size, add, contains, expiry)
@@ -0,0 +1,151 @@
+from cityhash import CityHash64
+from timeDecaySet import clock
+from globalConfig import log
+from collections import deque
+import math
+
+
+class BloomTimeDecaySet(object):
+    '''Memory-bounded stand-in for TimeDecaySet, for graphs with too many
+    resources to keep every found URI in memory.  Instead of storing values
+    it keeps a time-sliced Bloom filter over their CityHash64: the decay
+    window is cut into 'slices' equal spans, each with its own filter, plus
+    one filter for the span being filled now.  Each time a span runs out,
+    the oldest filter is wiped and reused for the new span.  A value is in
+    the set if any live filter has it, so it is remembered for at least
+    minute_decay minutes and at most one extra span.
+
+    Memory is fixed at construction: 'capacity' is how many distinct values
+    are expected per decay window, and the filters are sized so the chance
+    of a value wrongly counting as already found stays under error_rate
+    while that holds.  Adding more values than that raises the error rate.
+    As with any Bloom filter there are no false negatives, so a found URI
+    is never pushed twice within the window.
+
+    The filters can't list their values, so the last 'recent' values added
+    are also kept, with the time they were added, for asList: it returns
+    those still inside the decay window, oldest first.  That is every found
+    value as long as fewer than 'recent' were added per window, and the most
+    recent ones otherwise.  Values can't be removed (remove_from_set raises
+    TypeError), and size() is an estimate.
+
+    set minute_decay = 0 for infinite persistence (one filter, never wiped)'''
+
+
+    def __init__(self, minute_decay=1, capacity=1000000, error_rate=0.001, slices=4, \
+            recent=10000):
+
+        self._minute_decay = minute_decay
+        #(timestamp, value) of the newest values, for asList
+        self._recent = deque(maxlen=recent)
+
+        if minute_decay > 0:
+            filters = slices + 1
+            self._span = minute_decay * 60.0 / slices
+        else:
+            filters = 1
+            self._span = None
+
+        #each filter holds one span's worth of values, and a lookup can hit
+        #a false positive in any of them, so split the error rate between them
+        values_per_filter = max(capacity / float(max(filters - 1, 1)), 1)
+        filter_error_rate = error_rate / filters
+
+        self._bits = int(math.ceil(-values_per_filter * math.log(filter_error_rate) / \
+                (math.log(2) ** 2)))
+        self._bits = ((self._bits + 7) // 8) * 8
+        self._hashes = max(1, int(round(self._bits / values_per_filter * math.log(2))))
+
+        #newest filter first
+        self._filters = [bytearray(self._bits // 8) for i in range(filters)]
+        self._counts = [0] * filters
+        self._span_start = clock()
+
+        log.info( 'FOUND SET: bloom filter, %s filters of %s kB, %s hashes', \
+                filters, self._bits / 8000.0, self._hashes )
+
+
+    def positions(self, value):
+        '''bit positions of value in a filter, by double hashing its CityHash64'''
+
+        hashed = CityHash64(value)
+        first = hashed & 0xffffffff
+        step = (hashed >> 32) | 1
+        bits = self._bits
+
+        return [(first + i * step) % bits for i in range(self._hashes)]
+
+
+    def add(self, value):
+        #only add if not in set
+        positions = self.positions(value)
+
+        if self.in_filters(positions):
+            return False
+
+        bloom = self._filters[0]
+        for position in positions:
+            bloom[position >> 3] |= 1 << (position & 7)
+        self._counts[0] += 1
+        self._recent.append((clock(), value))
+
+        return True
+
+
+    def in_set(self, value):
+        return self.in_filters(self.positions(value))
+
+
+    def in_filters(self, positions):
+        self.remove_timed_out_values()
+
+        for bloom in self._filters:
+            if all(bloom[position >> 3] & (1 << (position & 7)) for position in positions):
+                return True
+
+        return False
+
+
+    def remove_from_set(self, value):
+        #clearing a value's bits would also clear them for every other value
+        #sharing any of them, which then goes missing from the set
+        raise TypeError('FOUND SET: values can not be removed from a bloom filter set, ' \
+                'they only leave it when they time out.  Use a TimeDecaySet (no ' \
+                'found_set_capacity) to remove values.')
+
+
+    def remove_timed_out_values(self):
+        #start a new span for every span that has run out since the last call,
+        #wiping the oldest filter each time
+
+        if self._span is None:
+            return
+
+        elapsed = clock() - self._span_start
+        if elapsed < self._span:
+            return
+
+        spans = int(elapsed // self._span)
+        self._span_start += spans * self._span
+
+        for i in range(min(spans, len(self._filters))):
+            bloom = self._filters.pop()
+            bloom[:] = bytearray(len(bloom))
+            self._filters.insert(0, bloom)
+            self._counts.pop()
+            self._counts.insert(0, 0)
+
+
+    def asList(self):
+        #the last 'recent' values added that haven't timed out, oldest first
+        if self._minute_decay <= 0:
+            return [entry[1] for entry in self._recent]
+
+        oldest_allowed = clock() - self._minute_decay * 60
+        return [entry[1] for entry in self._recent if entry[0] >= oldest_allowed]
+
+
+    def size(self):
+        #estimate: number of values added to the live filters
+        self.remove_timed_out_values()
+        return sum(self._counts)
@@ -42,17 +42,24 @@ expose queue of resources/links to matching rel namespace and resource type
 
 '''
 
-from crawlerCache import CrawlerCacheWithCollisionHistory
-from leakyLIFO import LeakyLIFO
+from crawlerCache import CrawlerCacheWithCollisionHistory, ResizingCrawlerCache
+from leakyLIFO import IndexedLeakyLIFO
 from timeDecaySet import TimeDecaySet
+from persistentDecaySet import PersistentTimeDecaySet
+from bloomDecaySet import BloomTimeDecaySet
+from chainFetcher import shared_fetcher
+from halCuries import curie_expander
+from linkPipeline import link_pairs, filter_keywords, flatten_links, filter_history, \
+        annotate_cache
+from chainQuery import ChainQuery, Subscription, SubscriptionIndex
+from zmqOutput import ZmqOutput
 from globalConfig import log
-import re
+import copy
+from operator import itemgetter
 import time
 import random
 import requests
 import threading
-import Queue
-import zmq
 
 
 class ChainCrawler(object):
@@ -60,14 +67,41 @@ class ChainCrawler(object):
 
     def __init__(self, entry_point='http://learnair.media.mit.edu:8000/', \
             cache_table_mask_length=8, track_search_depth=5, \
-            found_set_persistence=720, crawl_delay=1000, filter_keywords=['previous','next']):
+            found_set_persistence=720, crawl_delay=1000, filter_keywords=['previous','next'], \
+            fetcher=None, cache=None, cache_path=None, cache_max_mask_length=None, \
+            found_set_path=None, found_set_capacity=None, found_set_error_rate=0.001, \
+            emit_resources=False):
         #entry_point = starting URL for crawl
-        #search_depth = how many steps in path we save to retrace when at a dead end
+        #track_search_depth = how many steps in path we save to retrace when at a dead end
         #found_set_persistence = how long, in min,  to keep a resource URI in memory
         #       before it is allowed to be returned as a new resource again.  720= 12
         #       hours before crawler 'forgets' it has seen something and resubmits it
         #       in the queue to be processed
         #crawl_delay = how long, in ms, before accessing/crawling a new resource
+        #fetcher = ChainFetcher used to download resources, defaults to the
+        #       pooled session shared by every crawler/searcher in the process
+        #cache = CrawlerCache to use instead of making a new one (i.e. one over
+        #       a shared table, see crawlerPool), cache_table_mask_length is
+        #       ignored if given
+        #cache_path = file to keep the cache's hash table in, memory-mapped, so
+        #       the crawler resumes with its visit history after a restart
+        #cache_max_mask_length = if given, the cache starts at 2^cache_table_mask_length
+        #       entries and doubles itself (up to 2^cache_max_mask_length) whenever
+        #       its collision rate climbs.  Raises ValueError if combined with cache_path
+        #found_set_path = sqlite file to keep the found resource set in, so it
+        #       survives restarts and is shared by every crawler given the same file
+        #found_set_capacity = if given, keep the found resource set as a fixed-size
+        #       bloom filter sized for this many resources per found_set_persistence
+        #       window, instead of storing every URI (see bloomDecaySet).  The set
+        #       crawl() returns then only lists the 10000 most recently found URIs
+        #found_set_error_rate = chance a new resource is wrongly taken as already
+        #       found, with found_set_capacity
+        #emit_resources = push each found resource along with its URI, so
+        #       consumers don't download it again: (uri, resource) tuples on
+        #       queues, and a resource frame after the URI on ZMQ (see
+        #       zmqOutput).  Resources matched on a link are downloaded here
+        #       (after crawl_delay each).  Resources are emitted as served, with
+        #       their CURIES unapplied
 
         self.entry_point = entry_point #entry point URI
 
@@ -75,18 +109,52 @@ class ChainCrawler(object):
         self.current_uri = entry_point #keep track of current location
         self.current_uri_type = 'entry_point'
         self.current_uri_title = 'entry_point'
-        self.crawl_history = LeakyLIFO(track_search_depth) #keep track of past
+        self.track_search_depth = track_search_depth
+        #keep track of past, indexed on href to filter links back to where we came from
+        self.crawl_history = IndexedLeakyLIFO(track_search_depth, key=itemgetter('href'))
         self.crawl_delay = crawl_delay #in milliseconds
-        self.found_resources = TimeDecaySet(found_set_persistence) #in seconds
+
+        self.found_set_persistence = found_set_persistence
+        self.found_set_path = found_set_path
+        self.found_set_capacity = found_set_capacity
+        self.found_set_error_rate = found_set_error_rate
+        self.found_resources = self.make_found_set()
+
+        #initialize http session
+        if fetcher is not None:
+            self.fetcher = fetcher
+        else:
+            self.fetcher = shared_fetcher()
 
         #initialize cache
-        self.cache = CrawlerCacheWithCollisionHistory(cache_table_mask_length)
+        if cache_path is not None and cache_max_mask_length is not None:
+            raise ValueError('CRAWLER: cache_path and cache_max_mask_length can\'t be combined')
+
+        if cache is not None:
+            self.cache = cache
+        elif cache_max_mask_length is not None:
+            self.cache = ResizingCrawlerCache(cache_table_mask_length, \
+                    max_mask_length=cache_max_mask_length)
+        else:
+            self.cache = CrawlerCacheWithCollisionHistory(cache_table_mask_length, \
+                    path=cache_path)
 
         #initialize queue/zmq variables
         self.q = None
         self.zmq = None
+        self.emit_resources = emit_resources
+
+        #shared between concurrent walkers (see crawl_concurrent), guard the
+        #found_resources sets and the cache (and its collision history)
+        self.push_lock = threading.Lock()
+        self.cache_lock = threading.Lock()
 
         self.find_called = False
+        self.first_found = None #first new uri of the latest push that found any
+
+        #registered queries, see subscribe and crawl_subscriptions
+        self.query = None
+        self.subscriptions = SubscriptionIndex()
 
         #initialize filter word list for crawling
         self.filter_keywords = ['edit','create','self','curies','websocket']
@@ -99,6 +167,21 @@ class ChainCrawler(object):
         log.info( "-----------------------------------------------" )
 
 
+    def make_found_set(self, table='found'):
+        '''a new, empty found resource set of the kind chosen by the
+        found_set_* arguments.  In a found_set_path file the set is kept in
+        its own table, so each subscription's set can share the file.'''
+
+        if self.found_set_path is not None:
+            return PersistentTimeDecaySet(self.found_set_path, self.found_set_persistence, \
+                    table=table)
+        elif self.found_set_capacity is not None:
+            return BloomTimeDecaySet(self.found_set_persistence, \
+                    self.found_set_capacity, self.found_set_error_rate)
+        else:
+            return TimeDecaySet(self.found_set_persistence) #in minutes
+
+
     @staticmethod
     def apply_hal_curies(json, del_curies=True):
         '''Find and apply CURIES relationship shorcuts (namespace/rel
@@ -111,28 +194,10 @@ class ChainCrawler(object):
         (True), or whether to leave it in (False).'''
 
         try:
-            curies = json['_links']['curies'] #find the curies.
-
-            for curie in curies: #compare each curies name...
-                for key in json['_links']: #...with each link relationship
-
-                    #if we find a link relation that uses the curies
-                    if (key.startswith(curie['name'] + ':')):
-
-                        #combine the curies & key to make the full resource link
-                        newIndex = curie['href']
-                        replaceString = key.split(curie['name'] + ':',1)[1]
-                        newIndex = re.sub(r"\{.*\}", replaceString, newIndex)
-
-                        #move the resource to the full resource link
-                        json['_links'][newIndex] = json['_links'][key]
-                        del json['_links'][key]
-                        log.debug( 'CURIES: %s moved to %s', key, newIndex )
-
-            #delete curies section of json if desired
-            if del_curies:
-                del json['_links']['curies']
-                log.debug( 'CURIES: CURIES Resource applied fully & removed.' )
+            #expand every link relation in one pass, with the compiled
+            #(and cached) form of this resource's curies
+            json['_links'] = curie_expander.expand(json['_links'], del_curies)
+            log.debug( 'CURIES: CURIES Resource applied fully.' )
 
         except:
             log.warn( "CURIES: No CURIES found" )
@@ -142,7 +207,8 @@ class ChainCrawler(object):
 
     @staticmethod
     def pluralize_resource_name(resource_name, namespace=""):
-        return [namespace + resource_name + 's', namespace + resource_name + 'es']
+        '''see ChainQuery.pluralize_resource_name'''
+        return ChainQuery.pluralize_resource_name(resource_name, namespace)
 
 
     def flatten_filter_link_array(self, req_links):
@@ -160,53 +226,30 @@ class ChainCrawler(object):
         name to a singular one.  As such, 'from_item_list' tells us to accept the
         pluralized version of the type as indicitive of the found resource.
         '''
-        crawl_links=[]
-
-        #formulate and push link items to crawl_links array from json
-        for key, item in req_links.iteritems():
-
-            #first handle 'item' links
-            if key == 'items':
-                for items_item in item:
-                    #inherit 'type' from previous crawl step
-                    try:
-                        items_item['type'] = self.current_uri_type
-                    except:
-                        log.error('Cannot inherit type information of list from previous crawl')
-                        items_item['type'] = 'UNKNOWN'
-                    items_item['from_item_list'] = True
-                    crawl_links.append(items_item)
-
-            #now filter out links we don't want and push the rest
-            elif not any(substring in key.lower() for substring in \
-                    self.filter_keywords):
-                if item is not None:
-                    item['type']=key
-                    item['from_item_list'] = False
-                    crawl_links.append(item)
-                else:
-                    log.warn(' EXTRACT_LINK: nonetype link detected in' + \
-                            ' resource %s', key)
+        return list(self.extract_links(link_pairs(req_links)))
 
-        return crawl_links
 
+    def extract_links(self, pairs):
+        '''link records (see flatten_filter_link_array) of the (key, link)
+        pairs of a resource's '_links', yielded one at a time'''
 
-    def get_external_links(self, req_links):
+        return flatten_links(filter_keywords(pairs, self.filter_keywords), \
+                self.current_uri_type)
 
-        #call 'real' function, which (1) flattens 'items', (2) filters out
-        #create/edit forms, websockets, curies, and self, and (3) formats
-        #things nicely for us in an array:
-        crawl_links = self.flatten_filter_link_array(req_links)
 
-        #we now have a well-structured list of links with known types
-        #before returning, delete any list items that are in our crawl history
-        crawl_links = [x for x in crawl_links if x not in (y['href'] for y in self.crawl_history.asList())]
+    def iter_external_links(self, req_links):
+        '''get_external_links, yielded one link at a time'''
 
-        #for our final list, append info on whether links are in cache
-        for link in crawl_links:
-            link['in_cache'] = self.cache.check(link['href'])
+        #(1) flatten 'items', (2) filter out create/edit forms, websockets,
+        #curies, and self, (3) drop links in our crawl history, and (4) note
+        #whether each link is in the cache
+        return annotate_cache(filter_history(self.extract_links(link_pairs(req_links)), \
+                self.crawl_history), self.cache)
 
-        return crawl_links
+
+    def get_external_links(self, req_links):
+
+        return list(self.iter_external_links(req_links))
 
 
     def query_link_array(self, crawl_links):
@@ -214,131 +257,208 @@ class ChainCrawler(object):
         and decides which of these links were quieried for. Return List of
         URIs that are matched resources not in the set already discovered'''
 
-        if self.qry_resource_type is not None:
-            log.info('SEARCH_LIST: looking for singular: %s', self.qry_resource_type)
-            log.info('SEARCH_LIST: looking for plural as item_list: %s', self.qry_resource_plural)
-        if self.qry_resource_title is not None:
-            log.info('SEARCH_LIST: looking for title: %s', self.qry_resource_title)
+        return self.query.match_links(crawl_links)
+
 
-        matching_uris = []
+    def query_current_node(self, json):
+        '''returns [current uri] if the current resource matches the query
+        (including resource_extra), otherwise []'''
 
-        #(1) if resource name exists, filter items to get only items that
-        #match the singular resource name, AND (things that match the plural
-        #resource name && are from_item_list)
-        #(2) if title exists, filter items remaining for those that match the title
+        if self.query.matches_node(self.current_uri_type, self.current_uri_title, json):
+            return [self.current_uri]
+        else:
+            return []
 
-        for link_item in crawl_links:
 
-            log.debug('SEARCH_LIST: checking if %s matches query criteria', link_item['href'])
-            this_link_item_matches = True
+    def push_uris_to_queue(self, uris, topics=None, resources=None):
+        '''check uris against found_resources set, and if they're not there,
+        get resource and push URI and resource out to queue.  topics maps
+        a uri to its resource type, the topic it is published on by a pub
+        ZmqOutput.  resources maps a uri to its resource, if it has already
+        been downloaded (see emit_resources)'''
 
-            #see if it matches resource_type, if queried for
-            if self.qry_resource_type is not None:
-                if ((any(link_item['type'].lower() in x for x in self.qry_resource_plural) and link_item['from_item_list']) \
-                        or (link_item['type'].lower() == self.qry_resource_type)):
-                    #it does!
-                    log.info('SEARCH_LIST: matched search_type %s', link_item['type'])
-                else:
-                    #it doesn't, but we're searching on resource_type
-                    this_link_item_matches = False
-
-            #see if it matches resource_title, if queried for
-            if self.qry_resource_title is not None:
-                if (link_item['title'].lower() == self.qry_resource_title):
-                    #it does!
-                    log.info('SEARCH_LIST: matched search_title %s', link_item['title'])
+        with self.push_lock:
+            #if 'add' returns true, it's not in our set yet
+            new_uris = [uri for uri in uris if self.found_resources.add(uri)]
+            if len(new_uris):
+                self.first_found = new_uris[0]
+
+        for uri in new_uris:
+
+            log.info('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>><<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
+            log.info('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>><<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
+            log.info('New Resource Found!  %s', uri)
+            log.info('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>><<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
+            log.info('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>><<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
+
+            resource = None
+            if self.emit_resources:
+                resource = self.matched_resource(uri, resources)
+
+            #push uri and resource to queue!
+            if self.q is not None:
+                log.info('QUEUE: Pushing to queue')
+                if self.emit_resources:
+                    self.q.put((uri, resource))
                 else:
-                    #it doesn't, but we're searching on resource_title
-                    this_link_item_matches = False
+                    self.q.put(uri)
+            elif self.zmq is not None:
+                log.info('QUEUE: Pusing to ZMQ socket')
+                self.zmq.send(uri, topics.get(uri) if topics else None, resource)
+            else:
+                log.warn('QUEUE: Queue and ZMQ Socket undefined')
 
-            #if we made it to here and this_link_item_matches, it's a match!
-            if this_link_item_matches:
-                matching_uris.append(link_item['href'])
+        return len(new_uris) > 0
 
-        #return list of matching uris
-        return matching_uris
 
+    def matched_resource(self, uri, resources=None):
+        '''the resource at uri, to emit with it: the copy in resources if we
+        have already downloaded it, otherwise downloaded now (once, here,
+        instead of by every consumer), after crawl_delay like any other
+        download.  None if it can't be downloaded.'''
 
-    def query_current_node(self, json):
+        if resources is not None and uri in resources:
+            return resources[uri]
 
-        matching_uris = []
+        time.sleep(self.crawl_delay/1000.0)
 
-        if self.qry_resource_type is not None:
-            log.info('SEARCH_LIST: looking for singular: %s', self.qry_resource_type)
-        if self.qry_resource_title is not None:
-            log.info('SEARCH_LIST: looking for title: %s', self.qry_resource_title)
-        if self.qry_extra is not None:
-            log.info('SEARCH_LIST: looking for %s', self.qry_extra)
+        try:
+            return self.fetcher.get_json(uri)
+        except (requests.exceptions.RequestException, ValueError):
+            log.warn( 'URI "%s" unresponsive, emitting it without its resource', uri )
+            return None
 
-        this_link_item_matches = True
 
-        if self.qry_resource_type is not None:
-            if (any(self.current_uri_type.lower() in x for x in self.qry_resource_plural) \
-                    or self.current_uri_type.lower() == self.qry_resource_type):
-                #it does!
-                log.info('SEARCH_LIST: matched search_type %s', self.current_uri_type)
-            else:
-                #it doesn't, but we're searching on resource_type
-                this_link_item_matches = False
-
-        #see if it matches resource_title, if queried for
-        if self.qry_resource_title is not None:
-            if (self.current_uri_title.lower() == self.qry_resource_title):
-                #it does!
-                log.info('SEARCH_LIST: matched search_title %s', self.current_uri_title)
-            else:
-                #it doesn't, but we're searching on resource_title
-                this_link_item_matches = False
+    def subscribe(self, name, q=None, namespace="", resource_type=None, \
+            plural_resource_type=None, resource_title=None, resource_extra=None):
+        '''
+        register a query (same criteria as crawl) under 'name', to be served
+        by crawl_subscriptions.  All subscriptions share one crawl: every
+        resource crawled is matched against all of them.  Each subscription
+        gets each match once per found_set_persistence window, even if other
+        subscriptions match it too.
+
+        Matches go to q if given.  Otherwise they go out on the crawler's ZMQ
+        output published with the subscription name as topic (see
+        crawl_subscriptions_zmq), or onto the crawler's queue as a (name, uri)
+        tuple.  With emit_resources, the resource goes along with the uri:
+        (uri, resource) on q, (name, uri, resource) on the crawler's queue.
+        Subscribing again with the same name replaces that subscription.
+
+        Each subscription's found set is of the same kind as the crawler's
+        (see found_set_path and found_set_capacity): with found_set_path it
+        is kept in the same file, in a table of its own named after the
+        subscription, so it survives restarts too.  With found_set_capacity
+        every subscription gets a bloom filter of that capacity.
+        '''
 
-        if self.qry_extra is not None:
-            for key, val in self.qry_extra.iteritems():
-                try:
-                    actual_val = json[key]
-                    if actual_val == val:
-                        log.info('SEARCH_LIST: matched search_extra %s: %s', key, val)
-                    else:
-                        this_link_item_matches = False
-                except:
-                    this_link_item_matches = False
+        query = ChainQuery(namespace, resource_type, plural_resource_type, \
+                resource_title, resource_extra)
 
-        #if we made it to here and this_link_item_matches, it's a match!
-        if this_link_item_matches:
-            matching_uris.append(self.current_uri)
+        with self.push_lock:
+            self.subscriptions.add(Subscription(name, query, q, \
+                    found_resources=self.make_found_set('subscription:' + name)))
 
-        #return list of matching uris
-        return matching_uris
+        log.info( 'SUBSCRIBE: %s registered, %s subscriptions', name, self.subscriptions.size() )
 
 
-    def push_uris_to_queue(self, uris):
-        '''check uris against found_resources set, and if they're not there,
-        get resource and push URI and resource out to queue'''
-        #self.found_resources
+    def unsubscribe(self, name):
+        with self.push_lock:
+            self.subscriptions.remove(name)
 
-        found_one = False
 
-        for uri in uris:
-            #if 'add' returns true, it's not in our set yet
-            if self.found_resources.add(uri):
+    def push_subscription_matches(self, crawl_links, resource_json, original_json=None):
+        '''match the current resource and its links against every
+        subscription, and push new matches out to each subscriber.
+        original_json is the current resource as it was downloaded, to emit
+        (see emit_resources).'''
 
-                log.info('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>><<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
-                log.info('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>><<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
-                log.info('New Resource Found!  %s', uri)
-                log.info('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>><<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
-                log.info('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>><<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
+        with self.push_lock:
+            matches = self.subscriptions.match_links(crawl_links)
+            matches.extend((x, [self.current_uri]) for x in self.subscriptions.match_node( \
+                    self.current_uri_type, self.current_uri_title, resource_json))
 
-                found_one = True
+            new_matches = [(subscription, uri) for subscription, uris in matches \
+                    for uri in uris if subscription.found_resources.add(uri)]
 
-                #push uri and resource to queue!
-                if isinstance(self.q, Queue.Queue):
-                    log.info('QUEUE: Pushing to queue')
-                    self.q.put(uri)
-                elif self.zmq is not None:
-                    log.info('QUEUE: Pusing to ZMQ socket')
-                    self.zmq.send_string(uri)
+        resources = {self.current_uri:original_json}
+
+        for subscription, uri in new_matches:
+
+            log.info('New Resource Found for %s!  %s', subscription.name, uri)
+
+            resource = None
+            if self.emit_resources:
+                #download each resource once, however many subscriptions match it
+                resource = self.matched_resource(uri, resources)
+                resources[uri] = resource
+
+            if subscription.q is not None:
+                if self.emit_resources:
+                    subscription.q.put((uri, resource))
+                else:
+                    subscription.q.put(uri)
+            elif self.zmq is not None:
+                if self.zmq.topics:
+                    self.zmq.send(uri, subscription.name, resource)
+                else:
+                    #push has no topic frame, the name goes in a frame of its own
+                    self.zmq.send(uri, resource=resource, label=subscription.name)
+            elif self.q is not None:
+                if self.emit_resources:
+                    self.q.put((subscription.name, uri, resource))
                 else:
-                    log.warn('QUEUE: Queue and ZMQ Socket undefined')
+                    self.q.put((subscription.name, uri))
+            else:
+                log.warn('QUEUE: Queue and ZMQ Socket undefined')
+
+
+    def crawl_subscriptions(self):
+        '''crawl, serving every registered subscription (see subscribe)
+        instead of a single query.'''
+
+        self.query = None
 
-        return found_one
+        if not self.subscriptions.size():
+            log.warn('SUBSCRIBE: crawling with no subscriptions registered')
+
+        loop_count=0
+
+        try:
+            while(self.crawl_node()):
+
+                #delay for crawl_delay ms between calls
+                time.sleep(self.crawl_delay/1000.0)
+
+                loop_count = loop_count + 1
+                log.info( "MAIN CRAWL LOOP ITERATION %s -----------------", loop_count )
+
+        finally:
+            #however crawling ends (even ^C), keep what was found
+            self.flush_found_sets()
+
+        log.info( "--- crawling ended, %s pages crawled ---", loop_count )
+        log.info( "--- cache stats: %s ---", self.cache.stats() )
+
+
+    def crawl_subscriptions_zmq(self, socket="tcp://127.0.0.1:5557", **output_kwargs):
+        '''
+        crawl_subscriptions, publishing matches on a ZMQ PUB socket with the
+        subscription name as topic, so each consumer can SUBscribe to just
+        the subscriptions it handles.  Messages are [name, uri, ...], with
+        each uri followed by its resource if emit_resources; output_kwargs
+        (pattern, batch_size, flush_interval, hwm, overflow, compress) are
+        passed to ZmqOutput.  With pattern='push' every uri is preceded by
+        its subscription's name instead: [name, uri, ..., name, uri, ...].
+        '''
+        output_kwargs.setdefault('pattern', 'pub')
+        output_kwargs.setdefault('resources', self.emit_resources)
+        self.zmq = ZmqOutput(socket, **output_kwargs)
+
+        try:
+            self.crawl_subscriptions()
+        finally:
+            self.zmq.close()
 
 
     def crawl_thread(self, q=None, namespace="", resource_type=None, \
@@ -369,15 +489,30 @@ class ChainCrawler(object):
 
 
     def crawl_zmq(self, socket="tcp://127.0.0.1:5557", namespace="", resource_type=None, \
-            plural_resource_type=None, resource_title=None, resource_extra=None):
+            plural_resource_type=None, resource_title=None, resource_extra=None, \
+            **output_kwargs):
         '''
         socket is a link to the queue you'd like URIs of found resources pushed to.
+        output_kwargs (pattern, batch_size, flush_interval, hwm, overflow,
+        compress) are passed to ZmqOutput; pattern='pub' publishes each URI with its
+        resource type as topic.
         '''
-        context = zmq.Context()
-        self.zmq = context.socket(zmq.PUSH)
-        self.zmq.bind(socket)
+        output_kwargs.setdefault('resources', self.emit_resources)
+        self.zmq = ZmqOutput(socket, **output_kwargs)
 
-        self.crawl(namespace,resource_type,plural_resource_type,resource_title, resource_extra)
+        try:
+            self.crawl(namespace,resource_type,plural_resource_type,resource_title, resource_extra)
+        finally:
+            self.zmq.close()
+
+
+    def set_query(self, namespace="", resource_type=None, \
+            plural_resource_type=None, resource_title=None, resource_extra=None):
+        '''compile the search criteria used by query_link_array and
+        query_current_node.  See crawl() for a description of the criteria.'''
+
+        self.query = ChainQuery(namespace, resource_type, plural_resource_type, \
+                resource_title, resource_extra)
 
 
     def crawl(self, namespace="", resource_type=None, \
@@ -400,60 +535,136 @@ class ChainCrawler(object):
         criteria.
         '''
 
-        #store search criteria in lowercase form, with namespace appended
-        #add plural forms +'s', +'es' to list of plural cases to look for
+        self.set_query(namespace, resource_type, plural_resource_type, \
+                resource_title, resource_extra)
 
-        if resource_type is not None:
-            #append namespace
-            self.qry_resource_type = namespace + resource_type
-            #make all lowercase
-            self.qry_resource_type = self.qry_resource_type.lower()
-            #'pluralize' resource after adding namespace
-            self.qry_resource_plural = self.pluralize_resource_name(self.qry_resource_type)
-            #add special pluralization if given by user
-            if plural_resource_type is not None:
-                self.qry_resource_plural.append(namespace + plural_resource_type)
-            #make all plural list items lowercase
-            self.qry_resource_plural = [x.lower() for x in self.qry_resource_plural]
-        else:
-            #not searching on resource_type, just define qry_resource_type as None
-            self.qry_resource_type = None
+        loop_count=0
 
-        if resource_title is not None:
-            #make all lowercase
-            self.qry_resource_title = resource_title.lower()
-        else:
-            #not searching on title, just define qry_resource_title as None
-            self.qry_resource_title = None
+        try:
+            #keep calling crawl_node, unless it returns false, with a pause between
+            while(self.crawl_node()):
 
-        if resource_extra is not None:
-            self.qry_extra = resource_extra
-        else:
-            self.qry_extra = None
+                #delay for crawl_delay ms between calls
+                time.sleep(self.crawl_delay/1000.0)
 
-        #end initializing query variables
+                #count loop iterations
+                loop_count = loop_count + 1
+                log.info( "MAIN CRAWL LOOP ITERATION %s -----------------", loop_count )
 
-        loop_count=0
+        finally:
+            #however crawling ends (even ^C), keep what was found
+            self.flush_found_sets()
 
-        #keep calling crawl_node, unless it returns false, with a pause between
-        while(self.crawl_node()):
+        log.info( "--- crawling ended, %s pages crawled ---", loop_count )
+        log.info( "--- cache stats: %s ---", self.cache.stats() )
 
-            #delay for crawl_delay ms between calls
-            time.sleep(self.crawl_delay/1000.0)
+        return self.found_resources
 
-            #count loop iterations
-            loop_count = loop_count + 1
-            log.info( "MAIN CRAWL LOOP ITERATION %s -----------------", loop_count )
 
-        log.info( "--- crawling ended, %s pages crawled ---", loop_count )
+    def flush_found_sets(self):
+        '''write out URIs found but not yet stored by found_set_path sets
+        (the crawler's and every subscription's), which otherwise only get
+        written in batches.  Called whenever a crawl ends.'''
+
+        with self.push_lock:
+            found_sets = [self.found_resources] + \
+                    [x.found_resources for x in self.subscriptions.subscriptions]
+
+        for found_set in found_sets:
+            if isinstance(found_set, PersistentTimeDecaySet):
+                found_set.flush()
+
+
+    def spawn_walker(self):
+        '''returns a shallow copy of this crawler that starts its own random
+        walk from the entry point.  The walker gets its own crawl_history and
+        current location, but shares the cache, found_resources, query and
+        queue/zmq output with this crawler (and every other walker).'''
+
+        walker = copy.copy(self)
+
+        walker.current_uri = self.entry_point
+        walker.current_uri_type = 'entry_point'
+        walker.current_uri_title = 'entry_point'
+        walker.crawl_history = IndexedLeakyLIFO(self.track_search_depth, key=itemgetter('href'))
+
+        return walker
+
+
+    def crawl_concurrent(self, walkers=4, namespace="", resource_type=None, \
+            plural_resource_type=None, resource_title=None, resource_extra=None):
+        '''
+        crawl with several random walks running at once, so 'walkers' requests
+        are in flight instead of one.  Each walker follows the same
+        crawl_node random-walk/backtrack rules as crawl() (and waits
+        crawl_delay between its own requests), but they all share one
+        CrawlerCache (used under cache_lock, one walker at a time), so
+        walkers steer away from regions another walker has just visited.
+        Matches go through push_uris_to_queue as usual.
+
+        If any walker stops (find() succeeded, the entry point is down, or
+        there is nothing to crawl), all walkers stop.  Query arguments are the
+        same as crawl().
+        '''
+
+        self.set_query(namespace, resource_type, plural_resource_type, \
+                resource_title, resource_extra)
+
+        stop = threading.Event()
+        threads = []
+
+        for walker_id in range(walkers):
+            walker = self.spawn_walker()
+            thread = threading.Thread(target=self.walk, args=(walker, walker_id, stop))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        try:
+            #join with a timeout so the main thread still sees KeyboardInterrupt
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(1)
+
+        finally:
+            stop.set()
+            self.flush_found_sets()
+
+        log.info( "--- concurrent crawling ended ---" )
+        log.info( "--- cache stats: %s ---", self.cache.stats() )
 
         return self.found_resources
 
 
+    @staticmethod
+    def walk(walker, walker_id, stop):
+        '''crawl loop for a single walker of crawl_concurrent.'''
+
+        loop_count=0
+
+        try:
+            while(not stop.is_set() and walker.crawl_node()):
+
+                #delay for crawl_delay ms between calls
+                time.sleep(walker.crawl_delay/1000.0)
+
+                loop_count = loop_count + 1
+                log.info( "WALKER %s CRAWL LOOP ITERATION %s -----------------", \
+                        walker_id, loop_count )
+
+        finally:
+            #stop every walker, even if this one raised
+            stop.set()
+
+        log.info( "--- walker %s ended, %s pages crawled ---", walker_id, loop_count )
+
+
     def crawl_node(self):
 
         #put uri in cache now that we're crawling it, make a note of collisions
-        if self.cache.put_and_collision(self.current_uri):
+        with self.cache_lock:
+            collision = self.cache.put_and_collision(self.current_uri)
+        if collision:
             log.info( 'HASH COLLISION: value overwritten in hash table.' )
 
         #debug: print state of cache after updating
@@ -461,11 +672,10 @@ class ChainCrawler(object):
 
         #download the current resource
         try:
-            req = requests.get(self.current_uri)
-            log.info( '%s downloaded.', self.current_uri )
+            resource_json = self.fetcher.get_json(self.current_uri)
 
         #downloading the current resource failed
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
 
             log.warn( 'URI "%s" unresponsive, moving back to previous link...',\
                     self.current_uri )
@@ -494,12 +704,25 @@ class ChainCrawler(object):
 
         #end downloading resource
 
-        #put request in JSON form, apply CURIES, get links
-        resource_json = req.json()
+        #apply CURIES, get links
         log.debug('HAL/JSON RAW RESOURCE: %s', resource_json)
 
+        #apply_hal_curies replaces '_links', so a shallow copy keeps the
+        #resource as it was served, to emit with its uri
+        original_json = None
+        if self.emit_resources:
+            original_json = dict(resource_json)
+
         req_links = self.apply_hal_curies(resource_json)['_links']
-        crawl_links = self.get_external_links(req_links)
+
+        #keep every link, and the ones not in the cache to pick from
+        crawl_links = []
+        uncached_links = []
+        with self.cache_lock:
+            for link in self.iter_external_links(req_links):
+                crawl_links.append(link)
+                if not link['in_cache']:
+                    uncached_links.append(link)
 
         #crawl_links is a 'flat' list list[:][fields]
         #fields are href, type, title, in_cache, from_item_list
@@ -508,21 +731,31 @@ class ChainCrawler(object):
                 'self, create/edit, ws, itemlist flattened): %s', crawl_links)
 
         #find the uris/resources that match search criteria!
-        if self.qry_extra is None:
-            #we don't need to actually download the link to see if it matches
-            matching_uris = self.query_link_array(crawl_links)
+        if self.query is None:
+            #no single query, match and send out for every subscription
+            self.push_subscription_matches(crawl_links, resource_json, original_json)
+
         else:
-            #we only have enough information to tell if the current node matches
-            matching_uris = self.query_current_node(resource_json)
+            topics = None
+            resources = None
+
+            if self.query.extra is None:
+                #we don't need to actually download the link to see if it matches
+                matching_uris = self.query_link_array(crawl_links)
+                if self.zmq is not None and self.zmq.topics and len(matching_uris):
+                    topics = dict((x['href'], x['type']) for x in crawl_links)
+            else:
+                #we only have enough information to tell if the current node matches
+                matching_uris = self.query_current_node(resource_json)
+                topics = {self.current_uri:self.current_uri_type}
+                resources = {self.current_uri:original_json}
 
-        #... and send them out!!
-        if (self.push_uris_to_queue(matching_uris) and self.find_called):
-            return False #end crawl if we found one and 'find' was called
+            #... and send them out!!
+            if (self.push_uris_to_queue(matching_uris, topics, resources) and self.find_called):
+                return False #end crawl if we found one and 'find' was called
 
         #select next link!!!!
 
-        #get uncached links
-        uncached_links = [x for x in crawl_links if not x['in_cache']]
         log.info('CRAWL: %s LINKS UNCACHED OF %s LINKS FOUND', \
                 len(uncached_links), len(crawl_links) )
 
@@ -545,7 +778,8 @@ class ChainCrawler(object):
                 if (len(crawl_links) > 0):
 
                     log.info('CRAWL: no uncached links from entrypoint, resetting cache')
-                    self.cache.clear() # clear cache
+                    with self.cache_lock:
+                        self.cache.clear() # clear cache
 
                     #randomly select node from crawl_links
                     random_index = random.randrange(0,len(crawl_links))
@@ -586,14 +820,14 @@ class ChainCrawler(object):
         '''crawls, and when finds a match returns it immediately'''
 
         self.find_called = True
+        self.first_found = None
 
-        uris= self.crawl(namespace=namespace, resource_type=resource_type, \
+        self.crawl(namespace=namespace, resource_type=resource_type, \
             plural_resource_type=plural_resource_type, resource_title=resource_title, resource_extra=resource_extra)
 
-        if uris.size() >= 1:
-            return uris.asList()[0]
-        else:
-            return None
+        #the found set may not list its values (see bloomDecaySet), so return
+        #the uri push_uris_to_queue recorded
+        return self.first_found
 
 
 if __name__=="__main__":
@@ -640,6 +874,26 @@ if __name__=="__main__":
     #time.sleep(5)
 
 
+    #######SUBSCRIPTION EXAMPLE######
+
+    #crawler = ChainCrawler(found_set_persistence=2, crawl_delay=500)
+
+    #crawler.subscribe('o3_sensors', namespace='http://learnair.media.mit.edu:8000/rels/', \
+    #        resource_type='sensor', resource_extra={'sensor_type':'AlphasenseO3-A4'})
+    #crawler.subscribe('devices', namespace='http://learnair.media.mit.edu:8000/rels/', \
+    #        resource_type='device')
+    #crawler.crawl_subscriptions_zmq()
+
+
+    #######CONCURRENT CRAWL EXAMPLE######
+
+    #crawler = ChainCrawler(found_set_persistence=2, crawl_delay=500)
+
+    #crawler.crawl_concurrent(walkers=8, \
+    #        namespace='http://learnair.media.mit.edu:8000/rels/', \
+    #        resource_type='sensor')
+
+
     #######ZMQ EXAMPLES######
 
     #crawler = ChainCrawler(found_set_persistence=2, crawl_delay=500)
@@ -647,6 +901,10 @@ if __name__=="__main__":
     #crawler.crawl_zmq(namespace='http://learnair.media.mit.edu:8000/rels/', \
     #        resource_title='a')
 
+    #publish sensors in batches of 50, by type, without waiting on slow subscribers
+    #crawler.crawl_zmq(namespace='http://learnair.media.mit.edu:8000/rels/', \
+    #        resource_type='sensor', pattern='pub', batch_size=50, overflow='drop')
+
     #######FIND EXAMPLE######
     '''
     crawler = ChainCrawler(found_set_persistence=2, crawl_delay=500)
@@ -0,0 +1,223 @@
+'''
+Shared HTTP fetch layer for ChainCrawler and ChainSearch.
+
+Every download goes through one pooled requests.Session, so connections to
+the ChainAPI server are kept alive and reused instead of being opened for each
+resource.  The session asks for gzip'd responses, limits how many connections
+it keeps open per host, retries failed connections with a backoff, and always
+downloads with a (connect, read) timeout so an unresponsive server can't hang
+a crawler forever.
+
+Given an http_cache_path, the fetcher also keeps an on-disk HttpValidatorCache
+and makes conditional GETs (If-None-Match / If-Modified-Since) for URIs it has
+downloaded before.  On a 304 the stored body is reused, so recrawls of static
+resources cost the server almost nothing.
+
+get_chunks downloads a resource as a stream instead, for parsing it as it
+arrives (see halStream).
+
+Download failures (unresponsive host, timeout, retries used up) raise
+requests.exceptions.RequestException, which callers treat the same way they
+treat an unresponsive URI.
+'''
+
+from httpCache import HttpValidatorCache
+from globalConfig import log
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+
+class ChainFetcher(object):
+
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, connect_timeout=5, \
+            read_timeout=30, retries=3, backoff_factor=0.5, http_cache_path=None):
+        #pool_connections = how many hosts to keep a connection pool for
+        #pool_maxsize = max number of open connections to a single host.  A
+        #       download waits for a free connection if all are in use
+        #connect_timeout = how long, in s, to wait to connect to the server
+        #read_timeout = how long, in s, to wait on the server between bytes
+        #retries = how many times to retry a failed connection/read or a
+        #       502/503/504 response before giving up
+        #backoff_factor = sleep between retries is backoff_factor*(2^retry) s
+        #http_cache_path = sqlite file to keep ETag/Last-Modified validators in
+        #       for conditional GETs.  None disables conditional GETs
+
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(total=retries, connect=retries, read=retries, \
+                backoff_factor=backoff_factor, status_forcelist=[502, 503, 504])
+
+        adapter = HTTPAdapter(pool_connections=pool_connections, \
+                pool_maxsize=pool_maxsize, max_retries=retry, pool_block=True)
+
+        self.session = requests.Session()
+        self.session.headers.update({'Accept':'application/hal+json, application/json', \
+                'Accept-Encoding':'gzip, deflate', 'Connection':'keep-alive'})
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        if http_cache_path is not None:
+            self.validator_cache = HttpValidatorCache(http_cache_path)
+        else:
+            self.validator_cache = None
+
+        log.debug( 'FETCH: session set up, %s connections per host, timeout %s', \
+                pool_maxsize, self.timeout )
+
+
+    def get(self, uri):
+        '''download uri with the pooled session, returns the response.'''
+
+        return self.session.get(uri, timeout=self.timeout)
+
+
+    def get_json(self, uri):
+        '''download uri and return the resource in JSON form.  If we have
+        validators for uri, makes a conditional GET and returns the stored
+        resource when the server says it is not modified.'''
+
+        if self.validator_cache is None:
+            req = self.get(uri)
+            log.info( '%s downloaded.', uri )
+            return req.json()
+
+        headers = {}
+        cached = self.validator_cache.get(uri)
+
+        if cached is not None:
+            etag, last_modified, body = cached
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+
+        req = self.session.get(uri, timeout=self.timeout, headers=headers)
+
+        #not modified, reuse the stored body.  It is parsed again rather than
+        #kept parsed, since callers modify the resource they are given
+        if req.status_code == 304:
+            if cached is not None:
+                log.info( '%s not modified, using cached copy.', uri )
+                return json.loads(body)
+            req = self.get_unconditional(uri)
+
+        log.info( '%s downloaded.', uri )
+        resource_json = req.json()
+
+        etag = req.headers.get('ETag')
+        last_modified = req.headers.get('Last-Modified')
+
+        if req.status_code == 200 and (etag is not None or last_modified is not None):
+            self.validator_cache.put(uri, etag, last_modified, req.text)
+        elif cached is not None:
+            self.validator_cache.remove(uri)
+
+        return resource_json
+
+
+    def get_unconditional(self, uri, stream=False):
+        '''download uri again, without validators.  For a 304 we have no
+        stored body for (it was removed, or the server or a proxy answered
+        validators we didn't send), which has nothing to parse.'''
+
+        log.warn( '%s not modified but no cached copy, downloading again', uri )
+
+        return self.session.get(uri, timeout=self.timeout, stream=stream, \
+                headers={'Cache-Control':'no-cache'})
+
+
+    def get_chunks(self, uri, chunk_size=16384):
+        '''download uri as a stream, yielding the body in chunks as they
+        arrive.  Closing the generator (or letting it go) before the end
+        closes the response, so the rest of the body isn't downloaded.
+
+        With a validator cache the same conditional GET as get_json is made,
+        and the body is stored for next time.  To store it, closing the
+        generator early still reads the rest of the body (but doesn't yield
+        it); without a validator cache the rest is never downloaded.'''
+
+        headers = {}
+        cached = None
+
+        if self.validator_cache is not None:
+            cached = self.validator_cache.get(uri)
+            if cached is not None:
+                etag, last_modified, body = cached
+                if etag is not None:
+                    headers['If-None-Match'] = etag
+                if last_modified is not None:
+                    headers['If-Modified-Since'] = last_modified
+
+        req = self.session.get(uri, timeout=self.timeout, headers=headers, stream=True)
+
+        try:
+            if req.status_code == 304:
+                if cached is not None:
+                    log.info( '%s not modified, using cached copy.', uri )
+                    yield body.encode('utf-8')
+                    return
+                req.close()
+                req = self.get_unconditional(uri, stream=True)
+
+            log.info( '%s downloading.', uri )
+
+            etag = req.headers.get('ETag')
+            last_modified = req.headers.get('Last-Modified')
+            keep = self.validator_cache is not None and req.status_code == 200 and \
+                    (etag is not None or last_modified is not None)
+            chunks = []
+            body_chunks = req.iter_content(chunk_size)
+
+            try:
+                for chunk in body_chunks:
+                    if keep:
+                        chunks.append(chunk)
+                    yield chunk
+
+            except GeneratorExit:
+                #closed early (i.e. once '_links' has been read), finish
+                #reading so the whole body can be stored
+                if not keep:
+                    raise
+                chunks.extend(body_chunks)
+                self.validator_cache.put(uri, etag, last_modified, \
+                        ''.join(chunks).decode('utf-8'))
+                raise
+
+            if keep:
+                self.validator_cache.put(uri, etag, last_modified, \
+                        ''.join(chunks).decode('utf-8'))
+            elif cached is not None:
+                self.validator_cache.remove(uri)
+
+        finally:
+            req.close()
+
+
+    def close(self):
+        '''close all pooled connections.'''
+        self.session.close()
+        if self.validator_cache is not None:
+            self.validator_cache.close()
+
+
+
+_shared_fetcher = None
+_shared_fetcher_lock = threading.Lock()
+
+
+def shared_fetcher():
+    '''returns the process-wide ChainFetcher, created on first use.  Crawlers
+    and searchers use this one unless they are given their own fetcher.'''
+
+    global _shared_fetcher
+
+    with _shared_fetcher_lock:
+        if _shared_fetcher is None:
+            _shared_fetcher = ChainFetcher()
+
+    return _shared_fetcher
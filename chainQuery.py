@@ -0,0 +1,272 @@
+from timeDecaySet import TimeDecaySet
+from globalConfig import log
+
+
+class ChainQuery(object):
+    '''Search criteria for ChainCrawler and ChainSearch, compiled once.
+
+    Query strings are lowercased and pluralized up front, and whether a link
+    type matches the resource_type is worked out once per distinct type and
+    remembered, so matching a big collection page (where every item shares
+    the type it inherited) is a dict lookup per link.
+
+    Criteria are ANDed; a query with no criteria matches everything.
+
+    resource_type matches links of that type (namespace prepended), and
+    links from an 'items' collection whose type is (part of) one of its
+    plural forms: +'s', +'es' and plural_resource_type if given.
+    resource_type='createForm' matches createForm links instead, and if
+    createform_type is given (a list of lowercase types), only those on a
+    resource of one of those types.
+
+    resource_title matches titles, ignoring case.
+
+    resource_extra is a dict of fields the resource itself must have with
+    exactly those values.  It can only be checked on a downloaded resource
+    (matches_node), not on a link.
+    '''
+
+
+    def __init__(self, namespace="", resource_type=None, plural_resource_type=None, \
+            resource_title=None, resource_extra=None, createform_type=None):
+
+        #store search criteria in lowercase form, with namespace appended
+        #add plural forms +'s', +'es' to list of plural cases to look for
+
+        if resource_type == 'createForm':
+            self.resource_type = 'createform'
+            self.resource_plural = []
+        elif resource_type is not None:
+            self.resource_type = (namespace + resource_type).lower()
+            self.resource_plural = self.pluralize_resource_name(self.resource_type)
+            #add special pluralization if given by user
+            if plural_resource_type is not None:
+                self.resource_plural.append((namespace + plural_resource_type).lower())
+        else:
+            #not searching on resource_type
+            self.resource_type = None
+            self.resource_plural = []
+
+        if resource_title is not None:
+            self.resource_title = resource_title.lower()
+        else:
+            self.resource_title = None
+
+        self.extra = resource_extra
+        self.createform_type = createform_type
+
+        #link type -> (matches singular, matches plural), filled in as types are seen
+        self._type_matches = {}
+
+        if self.resource_type is not None:
+            log.info('SEARCH_LIST: looking for singular: %s', self.resource_type)
+            log.info('SEARCH_LIST: looking for plural as item_list: %s', self.resource_plural)
+        if self.resource_title is not None:
+            log.info('SEARCH_LIST: looking for title: %s', self.resource_title)
+        if self.extra is not None:
+            log.info('SEARCH_LIST: looking for %s', self.extra)
+
+
+    @staticmethod
+    def pluralize_resource_name(resource_name, namespace=""):
+        return [namespace + resource_name + 's', namespace + resource_name + 'es']
+
+
+    def type_matches(self, link_type):
+        '''returns (link_type is the singular type, link_type is in a plural type)'''
+
+        try:
+            return self._type_matches[link_type]
+        except KeyError:
+            lower_type = link_type.lower()
+            matches = (lower_type == self.resource_type, \
+                    any(lower_type in x for x in self.resource_plural))
+            self._type_matches[link_type] = matches
+            return matches
+
+
+    def match_links(self, crawl_links, current_uri_type=None):
+        '''takes a crawl_link array (which has links and types of objects)
+        and returns the list of hrefs that match the query, in order.
+        current_uri_type is the type of the resource the links are from,
+        needed to check createForm parents.'''
+
+        resource_type = self.resource_type
+        resource_title = self.resource_title
+        type_matches = self.type_matches
+
+        if resource_type is None and resource_title is None:
+            return [link['href'] for link in crawl_links]
+
+        #createForm links only count on resources of the right type
+        createform_ok = (self.createform_type is None or current_uri_type is None or \
+                current_uri_type.lower() in self.createform_type)
+
+        matching_uris = []
+
+        for link in crawl_links:
+
+            if resource_type is not None:
+                singular, plural = type_matches(link['type'])
+                if not (singular or (plural and link['from_item_list'])):
+                    continue
+                if resource_type == 'createform' and not createform_ok:
+                    continue
+
+            if resource_title is not None:
+                if link.get('title', '').lower() != resource_title:
+                    continue
+
+            matching_uris.append(link['href'])
+
+        log.debug('SEARCH_LIST: %s of %s links match', len(matching_uris), len(crawl_links))
+
+        return matching_uris
+
+
+    def matches_node(self, uri_type, uri_title, resource_json):
+        '''True if a downloaded resource itself (of type uri_type, with title
+        uri_title and contents resource_json) matches the query.'''
+
+        if self.resource_type is not None:
+            singular, plural = self.type_matches(uri_type)
+            if not (singular or plural):
+                return False
+
+        if self.resource_title is not None:
+            if uri_title.lower() != self.resource_title:
+                return False
+
+        if self.extra is not None:
+            for key, val in self.extra.iteritems():
+                if key not in resource_json or resource_json[key] != val:
+                    return False
+
+        log.info('SEARCH_LIST: resource matches query')
+
+        return True
+
+
+
+
+class Subscription(object):
+    '''a named ChainQuery registered on a crawler, with its own found set
+    (so each subscription gets every match once per persistence window) and
+    optionally its own queue to receive matches on.  found_resources is the
+    found set to use, instead of a TimeDecaySet of found_set_persistence
+    minutes (i.e. one from ChainCrawler.make_found_set).'''
+
+
+    def __init__(self, name, query, q=None, found_set_persistence=720, found_resources=None):
+        self.name = name
+        self.query = query
+        self.q = q
+
+        if found_resources is not None:
+            self.found_resources = found_resources
+        else:
+            self.found_resources = TimeDecaySet(found_set_persistence)
+
+
+
+
+class SubscriptionIndex(object):
+    '''Many subscriptions evaluated together against each crawled resource.
+
+    Subscriptions are indexed so a link is only checked against the ones it
+    could match: those on a resource_type are looked up by link type (which
+    of them a type matches is worked out once per distinct type), those on
+    just a title are looked up by lowercase title, and those with neither
+    get every link.  Subscriptions with resource_extra can only match the
+    downloaded resource itself, so they are only checked by match_node.'''
+
+
+    def __init__(self):
+        self.subscriptions = []
+        self.reindex()
+
+
+    def add(self, subscription):
+        self.subscriptions = [x for x in self.subscriptions if x.name != subscription.name]
+        self.subscriptions.append(subscription)
+        self.reindex()
+
+
+    def remove(self, name):
+        self.subscriptions = [x for x in self.subscriptions if x.name != name]
+        self.reindex()
+
+
+    def reindex(self):
+
+        self._typed = []
+        self._by_title = {}
+        self._match_all = []
+        self._node_only = []
+
+        for subscription in self.subscriptions:
+            query = subscription.query
+            if query.extra is not None:
+                self._node_only.append(subscription)
+            elif query.resource_type is not None:
+                self._typed.append(subscription)
+            elif query.resource_title is not None:
+                self._by_title.setdefault(query.resource_title, []).append(subscription)
+            else:
+                self._match_all.append(subscription)
+
+        #link type -> [(subscription, matches singular, matches plural)]
+        self._by_type = {}
+
+
+    def typed_candidates(self, link_type):
+
+        try:
+            return self._by_type[link_type]
+        except KeyError:
+            candidates = []
+            for subscription in self._typed:
+                singular, plural = subscription.query.type_matches(link_type)
+                if singular or plural:
+                    candidates.append((subscription, singular, plural))
+            self._by_type[link_type] = candidates
+            return candidates
+
+
+    def match_links(self, crawl_links):
+        '''returns a list of (subscription, [matching hrefs]) for every
+        subscription that matches at least one of crawl_links'''
+
+        matches = {}
+
+        for link in crawl_links:
+
+            title = link.get('title', '').lower()
+
+            for subscription, singular, plural in self.typed_candidates(link['type']):
+                if not (singular or (plural and link['from_item_list'])):
+                    continue
+                if subscription.query.resource_title is not None and \
+                        subscription.query.resource_title != title:
+                    continue
+                matches.setdefault(subscription, []).append(link['href'])
+
+            for subscription in self._by_title.get(title, ()):
+                matches.setdefault(subscription, []).append(link['href'])
+
+            for subscription in self._match_all:
+                matches.setdefault(subscription, []).append(link['href'])
+
+        return [(x, matches[x]) for x in self.subscriptions if x in matches]
+
+
+    def match_node(self, uri_type, uri_title, resource_json):
+        '''returns the subscriptions with resource_extra that the downloaded
+        resource itself matches'''
+
+        return [x for x in self._node_only if \
+                x.query.matches_node(uri_type, uri_title, resource_json)]
+
+
+    def size(self):
+        return len(self.subscriptions)
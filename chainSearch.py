@@ -11,27 +11,36 @@ first match.  find_degrees_all will do an exhaustive breadth first search
 of x degrees, and when completed will return a list of all matches.
 find_create_link will do a similar exhaustive search and return a create link
 for a particular type of object related to the starting resource.
+find_batch runs several of these at once, sharing one search (and one
+download of each resource) between them.
 
 '''
 
 from crawlerCache import CrawlerCacheWithCollisionHistory
 from leakyLIFO import LeakyLIFO
 from timeDecaySet import TimeDecaySet
+from chainFetcher import shared_fetcher
+from halCuries import curie_expander
+from chainQuery import ChainQuery
+from halStream import iter_hal_links
+from linkPipeline import link_pairs, expand_curies, filter_keywords, flatten_links
 from globalConfig import log
-import re
+import copy
 import time
 import random
 import requests
 import threading
 import Queue
 import zmq
+from multiprocessing.pool import ThreadPool
 
 
 class ChainSearch(object):
 
 
     def __init__(self, entry_point='http://learnair.media.mit.edu:8000/', \
-            crawl_delay=1000, filter_keywords=['previous','next']):
+            crawl_delay=1000, filter_keywords=['previous','next'], concurrency=1, \
+            fetcher=None, stream=False):
         #entry_point = starting URL for crawl
         #search_depth = how many steps in path we save to retrace when at a dead end
         #found_set_persistence = how long, in min,  to keep a resource URI in memory
@@ -39,6 +48,16 @@ class ChainSearch(object):
         #       hours before crawler 'forgets' it has seen something and resubmits it
         #       in the queue to be processed
         #crawl_delay = how long, in ms, before accessing/crawling a new resource
+        #concurrency = how many resources of one BFS depth level to download at
+        #       once.  1 downloads one at a time; >1 uses bfs_parallel
+        #fetcher = ChainFetcher used to download resources, defaults to the
+        #       pooled session shared by every crawler/searcher in the process
+        #stream = parse resources as they download, matching each link as soon
+        #       as it is read (see stream_links).  Only used with concurrency=1.
+        #       find_first then returns as soon as one match is read, so it
+        #       returns just that match rather than every match of the resource.
+        #       With a validator cache (see ChainFetcher) each body is still read
+        #       to the end, to be stored for conditional GETs
 
         self.entry_point = entry_point #entry point URI
 
@@ -46,12 +65,20 @@ class ChainSearch(object):
         self.current_uri = entry_point #keep track of current location
         self.current_uri_type = 'entry_point'
         self.crawl_delay = crawl_delay #in milliseconds
+        self.concurrency = concurrency
+        self.stream = stream
         self.degrees = 0
         self.return_if_found = False
         self.createform_type = None
 
         self.found_resources = TimeDecaySet(0)
 
+        #initialize http session
+        if fetcher is not None:
+            self.fetcher = fetcher
+        else:
+            self.fetcher = shared_fetcher()
+
         #initialize filter word list for crawling
         self.filter_keywords = ['edit','create','self','curies','websocket']
         [self.filter_keywords.append(x) for x in filter_keywords]
@@ -85,28 +112,10 @@ class ChainSearch(object):
         (True), or whether to leave it in (False).'''
 
         try:
-            curies = json['_links']['curies'] #find the curies.
-
-            for curie in curies: #compare each curies name...
-                for key in json['_links']: #...with each link relationship
-
-                    #if we find a link relation that uses the curies
-                    if (key.startswith(curie['name'] + ':')):
-
-                        #combine the curies & key to make the full resource link
-                        newIndex = curie['href']
-                        replaceString = key.split(curie['name'] + ':',1)[1]
-                        newIndex = re.sub(r"\{.*\}", replaceString, newIndex)
-
-                        #move the resource to the full resource link
-                        json['_links'][newIndex] = json['_links'][key]
-                        del json['_links'][key]
-                        log.debug( 'CURIES: %s moved to %s', key, newIndex )
-
-            #delete curies section of json if desired
-            if del_curies:
-                del json['_links']['curies']
-                log.debug( 'CURIES: CURIES Resource applied fully & removed.' )
+            #expand every link relation in one pass, with the compiled
+            #(and cached) form of this resource's curies
+            json['_links'] = curie_expander.expand(json['_links'], del_curies)
+            log.debug( 'CURIES: CURIES Resource applied fully.' )
 
         except:
             log.warn( "CURIES: No CURIES found" )
@@ -117,7 +126,8 @@ class ChainSearch(object):
 
     @staticmethod
     def pluralize_resource_name(resource_name, namespace=""):
-        return [namespace + resource_name + 's', namespace + resource_name + 'es']
+        '''see ChainQuery.pluralize_resource_name'''
+        return ChainQuery.pluralize_resource_name(resource_name, namespace)
 
 
     def flatten_filter_link_array(self, req_links):
@@ -135,35 +145,15 @@ class ChainSearch(object):
         name to a singular one.  As such, 'from_item_list' tells us to accept the
         pluralized version of the type as indicitive of the found resource.
         '''
-        crawl_links=[]
-
-        #formulate and push link items to crawl_links array from json
-        for key, item in req_links.iteritems():
-
-            #first handle 'item' links
-            if key == 'items':
-                for items_item in item:
-                    #inherit 'type' from previous crawl step
-                    try:
-                        items_item['type'] = self.current_uri_type
-                    except:
-                        log.error('Cannot inherit type information of list from previous crawl')
-                        items_item['type'] = 'UNKNOWN'
-                    items_item['from_item_list'] = True
-                    crawl_links.append(items_item)
-
-            #now filter out links we don't want and push the rest
-            elif not any(substring in key.lower() for substring in \
-                    self.filter_keywords):
-                if item is not None:
-                    item['type']=key
-                    item['from_item_list'] = False
-                    crawl_links.append(item)
-                else:
-                    log.warn(' EXTRACT_LINK: nonetype link detected in' + \
-                            ' resource %s', key)
-
-        return crawl_links
+        return list(self.extract_links(link_pairs(req_links)))
+
+
+    def extract_links(self, pairs):
+        '''link records (see flatten_filter_link_array) of the (key, link)
+        pairs of a resource's '_links', yielded one at a time'''
+
+        return flatten_links(filter_keywords(pairs, self.filter_keywords), \
+                self.current_uri_type)
 
 
     def query_link_array(self, crawl_links):
@@ -171,58 +161,7 @@ class ChainSearch(object):
         and decides which of these links were quieried for. Return List of
         URIs that are matched resources not in the set already discovered'''
 
-        if self.qry_resource_type is not None:
-            log.info('SEARCH_LIST: looking for singular: %s', self.qry_resource_type)
-            log.info('SEARCH_LIST: looking for plural as item_list: %s', self.qry_resource_plural)
-        if self.qry_resource_title is not None:
-            log.info('SEARCH_LIST: looking for title: %s', self.qry_resource_title)
-
-        matching_uris = []
-
-        #(1) if resource name exists, filter items to get only items that
-        #match the singular resource name, AND (things that match the plural
-        #resource name && are from_item_list)
-        #(2) if title exists, filter items remaining for those that match the title
-
-        for link_item in crawl_links:
-
-            log.debug('SEARCH_LIST: checking if %s matches query criteria', link_item['href'])
-            this_link_item_matches = True
-
-            #see if it matches resource_type, if queried for
-            if self.qry_resource_type is not None:
-                if ((any(link_item['type'].lower() in x for x in self.qry_resource_plural) and link_item['from_item_list']) \
-                        or (link_item['type'].lower() == self.qry_resource_type)):
-                    #it does!
-
-                    #double check for createForms the parent is correct
-                    if ('createform' == link_item['type'].lower() and self.createform_type is not None):
-                        if (self.current_uri_type.lower() not in self.createform_type):
-                            this_link_item_matches = False
-                        else:
-                            log.info('SEARCH_LIST: matched search_type %s', link_item['type'])
-                    else:
-                        log.info('SEARCH_LIST: matched search_type %s', link_item['type'])
-
-                else:
-                    #it doesn't, but we're searching on resource_type
-                    this_link_item_matches = False
-
-            #see if it matches resource_title, if queried for
-            if self.qry_resource_title is not None:
-                if (link_item['title'].lower() == self.qry_resource_title):
-                    #it does!
-                    log.info('SEARCH_LIST: matched search_title %s', link_item['title'])
-                else:
-                    #it doesn't, but we're searching on resource_title
-                    this_link_item_matches = False
-
-            #if we made it to here and this_link_item_matches, it's a match!
-            if this_link_item_matches:
-                matching_uris.append(link_item['href'])
-
-        #return list of matching uris
-        return matching_uris
+        return self.query.match_links(crawl_links, self.current_uri_type)
 
 
     def push_uris_to_queue(self, uris):
@@ -266,36 +205,10 @@ class ChainSearch(object):
         criteria.
         '''
 
-        #store search criteria in lowercase form, with namespace appended
-        #add plural forms +'s', +'es' to list of plural cases to look for
-
-        if resource_type is not None and resource_type != 'createForm':
-            #append namespace
-            self.qry_resource_type = namespace + resource_type
-            #make all lowercase
-            self.qry_resource_type = self.qry_resource_type.lower()
-            #'pluralize' resource after adding namespace
-            self.qry_resource_plural = self.pluralize_resource_name(self.qry_resource_type)
-            #add special pluralization if given by user
-            if plural_resource_type is not None:
-                self.qry_resource_plural.append(namespace + plural_resource_type)
-            #make all plural list items lowercase
-            self.qry_resource_plural = [x.lower() for x in self.qry_resource_plural]
-        #check if we're searching for a createForm
-        elif resource_type == 'createForm':
-            #use this search criteria
-            self.qry_resource_type = 'createform'
-            self.qry_resource_plural = 'createform'
-        else:
-            #not searching on resource_type, just define qry_resource_type as None
-            self.qry_resource_type = None
-
-        if resource_title is not None:
-            #make all lowercase
-            self.qry_resource_title = resource_title.lower()
-        else:
-            #not searching on title, just define qry_resource_title as None
-            self.qry_resource_title = None
+        #compile the search criteria, createForm parents are checked against
+        #createform_type (set by find_create_link)
+        self.query = ChainQuery(namespace, resource_type, plural_resource_type, \
+                resource_title, createform_type=self.createform_type)
 
         #end initializing query variables
 
@@ -308,56 +221,114 @@ class ChainSearch(object):
         return self.found_resources
 
 
+    def fetch_resource(self, uri):
+        '''wait crawl_delay, then download uri and return it in JSON form.
+        Returns None if the resource is unresponsive.'''
+
+        time.sleep(self.crawl_delay/1000.0)
+
+        try:
+            resource_json = self.fetcher.get_json(uri)
+            log.debug('HAL/JSON RAW RESOURCE: %s', resource_json)
+
+        except requests.exceptions.RequestException:
+            log.warn( 'URI "%s" unresponsive, ignoring', uri )
+            return None
+
+        return resource_json
+
+
+    def stream_links(self, uri):
+        '''wait crawl_delay, then download uri and yield its link records (as
+        flatten_filter_link_array would return them) while it downloads.
+        Close the generator to stop downloading.'''
+
+        time.sleep(self.crawl_delay/1000.0)
+
+        return self.extract_links(expand_curies( \
+                iter_hal_links(self.fetcher.get_chunks(uri))))
+
+
+    def bfs_stream_resource(self):
+        '''download, match and push the links of the current resource while it
+        downloads, stopping as soon as a match is pushed if return_if_found.
+        Returns (links read, whether to stop searching).  Links read before a
+        download fails are kept.'''
+
+        crawl_links = []
+        links = self.stream_links(self.current_uri)
+
+        try:
+            for link in links:
+                crawl_links.append(link)
+                #find the uris/resources that match search criteria, and send them out!!
+                if (self.push_uris_to_queue(self.query_link_array([link])) and \
+                        self.return_if_found):
+                    return crawl_links, True
+
+        except requests.exceptions.RequestException:
+            log.warn( 'URI "%s" unresponsive, ignoring', self.current_uri )
+
+            #if we failed to download the entry point, give up
+            if self.current_uri == self.entry_point:
+                log.error( 'URI is entry point, no previous link.  Try again when' \
+                        + ' the entry point URI is available.' )
+                return crawl_links, True
+
+        finally:
+            links.close()
+
+        return crawl_links, False
+
+
     def bfs(self):
 
+        if self.concurrency > 1:
+            return self.bfs_parallel()
+
         current_depth = 0
         visited = set()
         link_tree = [[] for k in range(self.degrees)]
 
         while True:
 
-            time.sleep(self.crawl_delay/1000.0)
-
-            #download the current resource
-            try:
-                req = requests.get(self.current_uri)
-                log.info( '%s downloaded.', self.current_uri )
-
-                #put request in JSON form, apply CURIES, get links
-                resource_json = req.json()
-                log.debug('HAL/JSON RAW RESOURCE: %s', resource_json)
+            if self.stream:
+                crawl_links, finished = self.bfs_stream_resource()
+                if finished:
+                    return
 
-            #downloading the current resource failed
-            except requests.exceptions.ConnectionError:
+            else:
+                #download the current resource
+                resource_json = self.fetch_resource(self.current_uri)
 
-                log.warn( 'URI "%s" unresponsive, ignoring',\
-                        self.current_uri )
+                #downloading the current resource failed
+                if resource_json is None:
 
-                resource_json = {'_links':[]}
+                    resource_json = {'_links':[]}
 
-                #if we failed to download the entry point, give up
-                if self.current_uri == self.entry_point:
-                    log.error( 'URI is entry point, no previous link.  Try again when' \
-                            + ' the entry point URI is available.' )
-                    return
+                    #if we failed to download the entry point, give up
+                    if self.current_uri == self.entry_point:
+                        log.error( 'URI is entry point, no previous link.  Try again when' \
+                                + ' the entry point URI is available.' )
+                        return
 
-            #end downloading resource
+                #end downloading resource
 
-            #get links from this resource
-            req_links = self.apply_hal_curies(resource_json)['_links']
-            crawl_links = self.flatten_filter_link_array(req_links)
+                #get links from this resource
+                req_links = self.apply_hal_curies(resource_json)['_links']
+                crawl_links = self.flatten_filter_link_array(req_links)
 
-            #crawl_links is a 'flat' list list[:][fields]
-            #fields are href, type, title, in_cache, from_item_list
+                #crawl_links is a 'flat' list list[:][fields]
+                #fields are href, type, title, in_cache, from_item_list
 
-            log.debug('HAL/JSON LINKS CURIES APPLIED, FILTERED (for history,' + \
-                    'self, create/edit, ws, itemlist flattened): %s', crawl_links)
+                log.debug('HAL/JSON LINKS CURIES APPLIED, FILTERED (for history,' + \
+                        'self, create/edit, ws, itemlist flattened): %s', crawl_links)
 
-            #find the uris/resources that match search criteria!
-            matching_uris = self.query_link_array(crawl_links)
-            #... and send them out!!
-            if (self.push_uris_to_queue(matching_uris) and self.return_if_found):
-                return #return if we are using find_first and we found one
+                #find the uris/resources that match search criteria!
+                matching_uris = self.query_link_array(crawl_links)
+                #... and send them out!!
+                if (self.push_uris_to_queue(matching_uris) and self.return_if_found):
+                    return #return if we are using find_first and we found one
 
             #push all uris that don't match visited to proper depth list
             visited.add(self.current_uri)
@@ -395,6 +366,190 @@ class ChainSearch(object):
             log.debug('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>><<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
 
 
+    def bfs_parallel(self):
+        '''same search as bfs, but every resource at one depth is downloaded
+        at once (at most self.concurrency at a time) before that depth is
+        processed.  Resources are still processed one at a time in the exact
+        order bfs would visit them, so find_first returns the same (shallowest)
+        match.  A uri listed more than once at a depth is only downloaded once.'''
+
+        visited = set()
+        level = [{'href':self.entry_point, 'type':'entry_point'}]
+        current_depth = 0
+
+        pool = ThreadPool(self.concurrency)
+
+        try:
+            while len(level):
+
+                #download every distinct uri of this depth in parallel
+                level_uris = []
+                [level_uris.append(x['href']) for x in level if x['href'] not in level_uris]
+                log.info('CRAWL: downloading %s resources at depth %s', \
+                        len(level_uris), current_depth)
+
+                downloaded = dict(zip(level_uris, pool.map(self.fetch_resource, level_uris)))
+
+                processed = set()
+                processed_uris = set()
+                next_level = []
+
+                for link in level:
+
+                    self.current_uri = link['href']
+                    self.current_uri_type = link['type']
+
+                    #processing the same uri with the same type again changes nothing
+                    if (self.current_uri, self.current_uri_type) in processed:
+                        continue
+
+                    resource_json = downloaded[self.current_uri]
+
+                    #downloading the current resource failed
+                    if resource_json is None:
+
+                        resource_json = {'_links':[]}
+
+                        #if we failed to download the entry point, give up
+                        if self.current_uri == self.entry_point:
+                            log.error( 'URI is entry point, no previous link.  Try again when' \
+                                    + ' the entry point URI is available.' )
+                            return
+
+                    #processing modifies the resource, so repeats of a uri
+                    #(reached with a different type) get a clean copy
+                    elif self.current_uri in processed_uris:
+                        resource_json = copy.deepcopy(resource_json)
+
+                    processed.add((self.current_uri, self.current_uri_type))
+                    processed_uris.add(self.current_uri)
+
+                    #get links from this resource
+                    req_links = self.apply_hal_curies(resource_json)['_links']
+                    crawl_links = self.flatten_filter_link_array(req_links)
+
+                    #find the uris/resources that match search criteria!
+                    matching_uris = self.query_link_array(crawl_links)
+                    #... and send them out!!
+                    if (self.push_uris_to_queue(matching_uris) and self.return_if_found):
+                        return #return if we are using find_first and we found one
+
+                    visited.add(self.current_uri)
+
+                    if current_depth < self.degrees:
+                        [next_level.append(x) for x in crawl_links \
+                                if not x['href'] in visited]
+
+                level = next_level
+                current_depth = current_depth + 1
+
+                log.debug('BFS Level: %s', level)
+                log.debug('VISITED: %s', visited)
+
+        finally:
+            pool.terminate()
+
+
+    def bfs_batch(self, searches, downloaded):
+        '''one breadth first search for several find_batch queries at once,
+        out to the deepest of their degrees.  Each query only looks at links
+        of resources within its own degrees, and a query that stops at its
+        first match stops looking once it has one, so each ends up with what
+        bfs would have found for it alone.  The search stops early once no
+        query is still looking.
+
+        downloaded maps uri -> downloaded JSON (None if it failed) and is
+        shared between searches, so a resource is only downloaded once.'''
+
+        degrees = max(x['degrees'] for x in searches)
+        visited = set()
+        level = [{'href':self.entry_point, 'type':'entry_point'}]
+        current_depth = 0
+
+        pool = None
+        if self.concurrency > 1:
+            pool = ThreadPool(self.concurrency)
+
+        try:
+            while len(level):
+
+                #queries still looking at this depth
+                active = [x for x in searches if current_depth <= x['degrees'] \
+                        and not x['done']]
+                if not len(active):
+                    return
+
+                #download every distinct new uri of this depth in parallel
+                if pool is not None:
+                    level_uris = []
+                    [level_uris.append(x['href']) for x in level if x['href'] not in \
+                            downloaded and x['href'] not in level_uris]
+                    log.info('CRAWL: downloading %s resources at depth %s', \
+                            len(level_uris), current_depth)
+                    downloaded.update(zip(level_uris, pool.map(self.fetch_resource, level_uris)))
+
+                next_level = []
+
+                for link in level:
+
+                    self.current_uri = link['href']
+                    self.current_uri_type = link['type']
+
+                    if self.current_uri not in downloaded:
+                        downloaded[self.current_uri] = self.fetch_resource(self.current_uri)
+
+                    resource_json = downloaded[self.current_uri]
+
+                    #downloading the current resource failed
+                    if resource_json is None:
+
+                        resource_json = {'_links':[]}
+
+                        #if we failed to download the entry point, give up
+                        if self.current_uri == self.entry_point:
+                            log.error( 'URI is entry point, no previous link.  Try again when' \
+                                    + ' the entry point URI is available.' )
+                            return
+
+                    #processing modifies the resource, keep the download clean
+                    #for repeats and later searches
+                    else:
+                        resource_json = copy.deepcopy(resource_json)
+
+                    #get links from this resource
+                    req_links = self.apply_hal_curies(resource_json)['_links']
+                    crawl_links = self.flatten_filter_link_array(req_links)
+
+                    #find the uris/resources that match each query
+                    for search in active:
+                        if search['done']:
+                            continue
+                        self.found_resources = search['found']
+                        matching_uris = search['query'].match_links(crawl_links, \
+                                self.current_uri_type)
+                        if (self.push_uris_to_queue(matching_uris) and search['first']):
+                            search['done'] = True
+
+                    if all(x['done'] for x in active):
+                        return
+
+                    visited.add(self.current_uri)
+
+                    if current_depth < degrees:
+                        [next_level.append(x) for x in crawl_links \
+                                if not x['href'] in visited]
+
+                level = next_level
+                current_depth = current_depth + 1
+
+                log.debug('BFS Level: %s', level)
+                log.debug('VISITED: %s', visited)
+
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+
     def find_degrees_all(self, namespace="", resource_type=None, \
             plural_resource_type=None, resource_title=None, degrees=1):
         '''only looks at 'degrees' degree away for the resources exhaustively,
@@ -446,6 +601,85 @@ class ChainSearch(object):
         return found_link
 
 
+    def batch_query(self, find='first', namespace="", resource_type=None, \
+            plural_resource_type=None, resource_title=None, degrees=1, max_degrees=3):
+        '''compile one find_batch query: its ChainQuery, how many degrees it
+        looks, whether it stops at its first match and whether it needs
+        createForm links, plus its own found set'''
+
+        search = {'found':TimeDecaySet(0), 'done':False, 'first':False, \
+                'create':False, 'degrees':degrees}
+
+        if find == 'first':
+            search['query'] = ChainQuery(namespace, resource_type, plural_resource_type, \
+                    resource_title)
+            search['degrees'] = max_degrees
+            search['first'] = True
+
+        elif find == 'degrees_all':
+            search['query'] = ChainQuery(namespace, resource_type, plural_resource_type, \
+                    resource_title)
+
+        elif find == 'create_link':
+            createform_type = None
+            if resource_type is not None:
+                #append namespace, make all lowercase, and 'pluralize'
+                createform_type = [(namespace + resource_type).lower()]
+                createform_type.extend(self.pluralize_resource_name(createform_type[0]))
+            search['query'] = ChainQuery(namespace, 'createForm', plural_resource_type, \
+                    createform_type=createform_type)
+            search['create'] = True
+
+        else:
+            raise ValueError('find_batch: unknown find "%s"' % find)
+
+        return search
+
+
+    def find_batch(self, queries):
+        '''runs several finds in one breadth first search, so the resources
+        around the entry point are downloaded once instead of once per find.
+        queries is a list of dicts, each with 'find' set to 'first',
+        'degrees_all' or 'create_link' and the arguments of find_first,
+        find_degrees_all or find_create_link, i.e.
+
+            searcher.find_batch([
+                {'find':'first', 'namespace':ns, 'resource_type':'site'},
+                {'find':'degrees_all', 'namespace':ns, 'resource_type':'device',
+                        'degrees':2},
+                {'find':'create_link', 'namespace':ns, 'resource_type':'sensor'}])
+
+        returns a list with the result of each query, in order, which is the
+        same as calling those finds one at a time.
+
+        create_link queries follow the createForm links the other finds filter
+        out, so they get a second search, over the resources already downloaded
+        by the first.'''
+
+        self.reinit()
+
+        searches = [self.batch_query(**x) for x in queries]
+        downloaded = {}
+
+        filter_keywords = self.filter_keywords
+
+        try:
+            searches_links = [x for x in searches if not x['create']]
+            if len(searches_links):
+                self.bfs_batch(searches_links, downloaded)
+
+            searches_create = [x for x in searches if x['create']]
+            if len(searches_create):
+                self.filter_keywords = [x for x in filter_keywords if x != 'create']
+                self.bfs_batch(searches_create, downloaded)
+
+        finally:
+            self.filter_keywords = filter_keywords
+            self.reinit()
+
+        return [x['found'].asList() for x in searches]
+
+
     def reset_entrypoint(self, new_entrypoint = 'http://learnair.media.mit.edu:8000/'):
         self.entry_point = new_entrypoint #entry point URI
         self.current_uri = new_entrypoint #keep track of current location
@@ -1,6 +1,10 @@
 from cityhash import CityHash64
 import array
-from leakyLIFO import LeakyLIFO
+import ctypes
+import mmap
+import os
+import multiprocessing
+from leakyLIFO import IndexedLeakyLIFO
 from globalConfig import log
 import sys
 
@@ -8,7 +12,7 @@ import sys
 
 class CrawlerCache(object):
 
-    def __init__(self, mask_length=8):
+    def __init__(self, mask_length=8, table=None, path=None):
         '''initializes fixed size hash table (2^mask_length entries), preallocates
         using C for speed and size.  Each stored value in the table is a cityHash64
         value (64 bits), so the hash table can support (theoretically) up to 2^64
@@ -23,22 +27,46 @@ class CrawlerCache(object):
 
         ex:  'http://test.com' hashes to '0x1234567887654321', and the cache table
         size is 2^8, or 256, so we apply an 8 bit mask of 0xff (& 255) to the hash.
-        This gives us hashtable[0x21] = 0x1234567887654321.'''
+        This gives us hashtable[0x21] = 0x1234567887654321.
+
+        table lets the caller supply the storage for the hash table instead,
+        any 2^mask_length long array of 64 bit unsigned values (e.g. one made
+        by shared_cache_table, which several crawler processes can share).
+
+        path instead keeps the table in a file, memory-mapped, so the cache
+        survives restarts with nothing to load: a crawler opening an existing
+        file picks up where the last one left off.  Other processes can map
+        the same file and will see every write.  The file is 8*2^mask_length
+        bytes, and opening it with a different mask_length raises ValueError.'''
 
         log.info( "-----------------------------------------------" )
         log.info( "---- Setting up cache ----" )
 
         self._cache_table_mask_length = mask_length
         self._cache_mask = (2**self._cache_table_mask_length) - 1
-        self._cache = array.array('L',(0 for i in range (self._cache_mask+1)))
+        self._mmap = None
+
+        if path is not None:
+            self._mmap = map_cache_file(path, self._cache_mask+1)
+            table = (ctypes.c_uint64 * (self._cache_mask+1)).from_buffer(self._mmap)
 
-        if (self._cache.itemsize < 8):
-            log.error("Cache Item Size is too small to represent 64 bit CityHash Value")
-            raise TypeError("Cache Item Size is too small to represent 64 bit CityHash Value")
+        if table is not None:
+            if len(table) != self._cache_mask+1:
+                log.error("Cache table length doesn't match mask_length")
+                raise ValueError("Cache table length doesn't match mask_length")
+            self._cache = table
+        else:
+            self._cache = array.array('L',(0 for i in range (self._cache_mask+1)))
+
+            if (self._cache.itemsize < 8):
+                log.error("Cache Item Size is too small to represent 64 bit CityHash Value")
+                raise TypeError("Cache Item Size is too small to represent 64 bit CityHash Value")
 
         log.info( 'cache length = %s, size = %s kB, mask = b{0:b}'.format(self._cache_mask), \
                 len(self._cache), (sys.getsizeof(self._cache)/1000.0) )
 
+        self.reset_stats()
+
         log.info( "-----------------------------------------------" )
 
 
@@ -55,6 +83,9 @@ class CrawlerCache(object):
         if (self._cache[index] and not overwrite):
             return False
         else:
+            self._puts += 1
+            if (self._cache[index] and self._cache[index] != hashed_uri):
+                self._collisions += 1
             self._cache[index] = hashed_uri
             return True
 
@@ -65,8 +96,10 @@ class CrawlerCache(object):
 
         hashed_uri = self.hash_uri(uri_string)
         index = hashed_uri & self._cache_mask
+        self._puts += 1
 
         if (self._cache[index] and self._cache[index] != hashed_uri):
+            self._collisions += 1
             self._cache[index] = hashed_uri
             return True
         else:
@@ -79,8 +112,10 @@ class CrawlerCache(object):
 
         hashed_uri = self.hash_uri(uri_string)
         index = hashed_uri & self._cache_mask
+        self._checks += 1
 
         if (self._cache[index] == hashed_uri):
+            self._hits += 1
             return True
         else:
             return False
@@ -92,16 +127,59 @@ class CrawlerCache(object):
 
         hashed_uri = self.hash_uri(uri_string)
         index = hashed_uri & self._cache_mask
+        self._checks += 1
 
         if (self._cache[index] != hashed_uri):
+            self._puts += 1
+            if (self._cache[index]):
+                self._collisions += 1
             self._cache[index] = hashed_uri
             return True
         else:
+            self._hits += 1
             return False
 
 
+    def check_many(self, uri_strings):
+        '''check a whole list of uris at once, returns a list of booleans
+        (True if that uri was found in cache), in the same order.  Does the
+        same as calling check() on each, without the per-call overhead.'''
+
+        cache = self._cache
+        mask = self._cache_mask
+
+        found = [cache[hashed_uri & mask] == hashed_uri \
+                for hashed_uri in self.hash_uris(uri_strings)]
+
+        self._checks += len(found)
+        self._hits += found.count(True)
+
+        return found
+
+
+    def put_many(self, uri_strings):
+        '''put_and_collision for a whole list of uris at once, returns a list
+        of booleans (True if that put overwrote a different value), in the
+        same order.'''
+
+        cache = self._cache
+        mask = self._cache_mask
+        collisions = []
+
+        for hashed_uri in self.hash_uris(uri_strings):
+            index = hashed_uri & mask
+            collisions.append(bool(cache[index]) and cache[index] != hashed_uri)
+            cache[index] = hashed_uri
+
+        self._puts += len(collisions)
+        self._collisions += collisions.count(True)
+
+        return collisions
+
+
     def clear(self):
         '''clear cache values back to initialized '0' in each location'''
+        self._clears += 1
         for index in range(len(self._cache)):
             self._cache[index] = 0
 
@@ -111,6 +189,51 @@ class CrawlerCache(object):
         return len(self._cache)
 
 
+    def occupancy(self):
+        '''return number of indices currently holding a value.  Walks the
+        whole table, so meant for occasional polling (see stats).'''
+        return sum(1 for value in self._cache if value)
+
+
+    def stats(self):
+        '''snapshot of the cache counters, as a dict, for polling/exporting:
+        checks, hits, misses, history_hits (hits that came from a collision
+        history, if the cache has one), puts, collisions (puts that overwrote
+        or evicted a different value) and clears, all since the cache was made
+        or reset_stats was called; plus the current table occupancy and the
+        hit/collision rates.  Counters are per process, even when the table
+        itself is shared.'''
+
+        slots = len(self._cache)
+        occupied = self.occupancy()
+
+        return {'checks':self._checks, 'hits':self._hits, \
+                'misses':self._checks - self._hits, \
+                'history_hits':self._history_hits, 'puts':self._puts, \
+                'collisions':self._collisions, 'clears':self._clears, \
+                'slots':slots, 'occupied':occupied, \
+                'occupancy':occupied / float(slots), \
+                'hit_rate':self._hits / float(max(self._checks, 1)), \
+                'collision_rate':self._collisions / float(max(self._puts, 1))}
+
+
+    def reset_stats(self):
+        '''zero the counters reported by stats'''
+        self._checks = 0
+        self._hits = 0
+        self._history_hits = 0
+        self._puts = 0
+        self._collisions = 0
+        self._clears = 0
+
+
+    def flush(self):
+        '''if the cache is kept in a file, write changes out to disk now
+        (the OS will otherwise write them back on its own schedule)'''
+        if self._mmap is not None:
+            self._mmap.flush()
+
+
     @staticmethod
     def hash_uri(uri_string):
         '''broken out 64bit hashing function, so it's easy to replace. Right
@@ -119,15 +242,61 @@ class CrawlerCache(object):
         return CityHash64(uri_string)
 
 
+    def hash_uris(self, uri_strings):
+        '''hash_uri over a list of uri strings, returns a list of hashes.
+        Goes through self.hash_uri, so a subclass that replaces hash_uri
+        gets the same slots from the batched calls as from check/put.'''
+        return map(self.hash_uri, uri_strings)
+
+
+
+
+def map_cache_file(path, entries):
+    '''memory-map the cache file at path, creating it zeroed (all slots empty)
+    if it doesn't exist yet.  Returns the shared, writeable mmap.'''
+
+    length = entries * ctypes.sizeof(ctypes.c_uint64)
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        file_length = os.fstat(fd).st_size
+
+        if file_length == 0:
+            os.ftruncate(fd, length)
+        elif file_length != length:
+            log.error("Cache file %s is %s bytes, expected %s", path, file_length, length)
+            raise ValueError("Cache file size doesn't match mask_length")
+
+        cache_map = mmap.mmap(fd, length)
+    finally:
+        os.close(fd)
+
+    log.info( 'cache mapped to file %s', path )
+
+    return cache_map
+
+
+def shared_cache_table(mask_length=8):
+    '''allocate a zeroed 2^mask_length table of 64 bit values in shared memory,
+    to pass as 'table' to CrawlerCache in several processes.  The hash values
+    all live in this table, so every process sees the others' visits.  Note
+    that the collision history of CrawlerCacheWithCollisionHistory stays
+    local to each process.'''
+    return multiprocessing.RawArray(ctypes.c_uint64, 2**mask_length)
+
+
 
 
 class CrawlerCacheWithCollisionHistory(CrawlerCache):
-    '''add a history of collisions using a leakyLIFO of length collision_history'''
+    '''add a history of collisions using a leakyLIFO of length collision_history.
+    The history is indexed, so checking it costs the same for any length.'''
 
 
-    def __init__(self, mask_length=8, collision_history=10):
-        self._collision_history = LeakyLIFO(collision_history)
-        super(CrawlerCacheWithCollisionHistory, self).__init__(mask_length)
+    def __init__(self, mask_length=8, collision_history=10, table=None, path=None):
+        '''see CrawlerCache.  With a path, only the hash table is kept in the
+        file; the collision history starts empty on every restart.'''
+        self._collision_history = IndexedLeakyLIFO(collision_history)
+        super(CrawlerCacheWithCollisionHistory, self).__init__(mask_length, table, path)
 
 
     def put_and_collision(self, uri_string):
@@ -137,8 +306,10 @@ class CrawlerCacheWithCollisionHistory(CrawlerCache):
 
         hashed_uri = self.hash_uri(uri_string)
         index = hashed_uri & self._cache_mask
+        self._puts += 1
 
         if (self._cache[index] and self._cache[index] != hashed_uri):
+            self._collisions += 1
             self._collision_history.push(self._cache[index])
             self._cache[index] = hashed_uri
             return True
@@ -152,16 +323,64 @@ class CrawlerCacheWithCollisionHistory(CrawlerCache):
 
         hashed_uri = self.hash_uri(uri_string)
 
-        if (hashed_uri in self._collision_history.asList()):
+        if (self._collision_history.contains(hashed_uri)):
+            self._checks += 1
+            self._hits += 1
+            self._history_hits += 1
             return True
         else:
             return super(CrawlerCacheWithCollisionHistory, self).check(uri_string)
 
 
+    def check_many(self, uri_strings):
+        '''check a whole list of uris at once, see CrawlerCache.check_many'''
+
+        cache = self._cache
+        mask = self._cache_mask
+        history = self._collision_history
+        found = []
+        history_hits = 0
+
+        for hashed_uri in self.hash_uris(uri_strings):
+            if history.contains(hashed_uri):
+                history_hits += 1
+                found.append(True)
+            else:
+                found.append(cache[hashed_uri & mask] == hashed_uri)
+
+        self._checks += len(found)
+        self._hits += found.count(True)
+        self._history_hits += history_hits
+
+        return found
+
+
+    def put_many(self, uri_strings):
+        '''put_and_collision for a whole list of uris at once, see
+        CrawlerCache.put_many'''
+
+        cache = self._cache
+        mask = self._cache_mask
+        collisions = []
+
+        for hashed_uri in self.hash_uris(uri_strings):
+            index = hashed_uri & mask
+            if (cache[index] and cache[index] != hashed_uri):
+                self._collision_history.push(cache[index])
+                collisions.append(True)
+            else:
+                collisions.append(False)
+            cache[index] = hashed_uri
+
+        self._puts += len(collisions)
+        self._collisions += collisions.count(True)
+
+        return collisions
+
+
     def clear(self):
         '''clear cache values back to initialized '0' in each location'''
-        while (self._collision_history.size()):
-            self._collision_history.pop()
+        self._collision_history.clear()
 
         super(CrawlerCacheWithCollisionHistory, self).clear()
 
@@ -169,3 +388,456 @@ class CrawlerCacheWithCollisionHistory(CrawlerCache):
     def collision_history_as_list(self):
         return self._collision_history.asList()
 
+
+
+
+
+class SetAssociativeCrawlerCache(CrawlerCache):
+    '''k-way set-associative version of CrawlerCache.  The same 2^mask_length
+    slots are grouped into buckets of 'ways' slots, and a hash can live in any
+    slot of its bucket (picked by the low bits of the hash, as before).  Two
+    URIs that share those bits no longer evict each other until the bucket is
+    full; then the least recently put hash in the bucket is evicted.
+
+    Each bucket is kept in recency order, most recently put first, so LRU
+    replacement needs no extra storage.  check() doesn't change the order,
+    only putting a value (visiting the URI) does.'''
+
+
+    def __init__(self, mask_length=8, ways=4, table=None, path=None):
+
+        if ways < 1 or (ways & (ways - 1)) or ways > 2**mask_length:
+            log.error("ways must be a power of 2 no larger than 2^mask_length")
+            raise ValueError("ways must be a power of 2 no larger than 2^mask_length")
+
+        super(SetAssociativeCrawlerCache, self).__init__(mask_length, table, path)
+
+        self._ways = ways
+        self._bucket_mask = ((self._cache_mask + 1) // ways) - 1
+
+        log.info( 'cache is %s-way set associative, %s buckets', ways, self._bucket_mask+1 )
+
+
+    def find(self, hashed_uri):
+        '''returns (first slot of bucket, position of hashed_uri in bucket).
+        The position is -1 if hashed_uri isn't in the bucket.'''
+
+        base = (hashed_uri & self._bucket_mask) * self._ways
+
+        for position in range(self._ways):
+            value = self._cache[base + position]
+            if value == hashed_uri:
+                return base, position
+            if not value: #buckets fill from the front, the rest are empty
+                break
+
+        return base, -1
+
+
+    def free_or_lru(self, base):
+        '''position of the first empty slot in the bucket, or of the least
+        recently used one if the bucket is full'''
+
+        for position in range(self._ways):
+            if not self._cache[base + position]:
+                return position
+
+        return self._ways - 1
+
+
+    def move_to_front(self, base, position, hashed_uri):
+        '''shift bucket slots [0, position) back by one and write hashed_uri
+        to the front.  Whatever was at position is overwritten.'''
+
+        for slot in range(base + position, base, -1):
+            self._cache[slot] = self._cache[slot - 1]
+        self._cache[base] = hashed_uri
+
+
+    def put(self, uri_string, overwrite=True):
+        '''adds a value to the cache, as the most recent in its bucket.  If the
+        bucket is full it evicts the least recent value if overwrite is True,
+        or fails and returns False if overwrite is False.'''
+
+        hashed_uri = self.hash_uri(uri_string)
+        base, position = self.find(hashed_uri)
+
+        if position < 0:
+            position = self.free_or_lru(base)
+            if self._cache[base + position] and not overwrite:
+                return False
+            if self._cache[base + position]:
+                self._collisions += 1
+
+        self._puts += 1
+        self.move_to_front(base, position, hashed_uri)
+        return True
+
+
+    def put_and_collision(self, uri_string):
+        '''adds a value to the cache.  If it has to evict a different value
+        from a full bucket, it returns 'True' to indicate a collision.
+        Otherwise returns False.'''
+
+        hashed_uri = self.hash_uri(uri_string)
+        base, position = self.find(hashed_uri)
+        collision = False
+
+        if position < 0:
+            position = self.free_or_lru(base)
+            collision = bool(self._cache[base + position])
+
+        self._puts += 1
+        self._collisions += collision
+        self.move_to_front(base, position, hashed_uri)
+        return collision
+
+
+    def check(self, uri_string):
+        '''returns True if value found in cache, False if not found.'''
+
+        base, position = self.find(self.hash_uri(uri_string))
+        self._checks += 1
+
+        if position >= 0:
+            self._hits += 1
+            return True
+        else:
+            return False
+
+
+    def check_and_put(self, uri_string):
+        '''If value not in cache, updates cache with value and returns True.
+        Otherwise, if the value is already in the table, it returns False.'''
+
+        hashed_uri = self.hash_uri(uri_string)
+        base, position = self.find(hashed_uri)
+        self._checks += 1
+
+        if position >= 0:
+            self._hits += 1
+            return False
+
+        position = self.free_or_lru(base)
+        self._puts += 1
+        self._collisions += bool(self._cache[base + position])
+        self.move_to_front(base, position, hashed_uri)
+        return True
+
+
+    def check_many(self, uri_strings):
+        '''check a whole list of uris at once, see CrawlerCache.check_many'''
+
+        find = self.find
+        found = [find(hashed_uri)[1] >= 0 for hashed_uri in self.hash_uris(uri_strings)]
+
+        self._checks += len(found)
+        self._hits += found.count(True)
+
+        return found
+
+
+    def put_many(self, uri_strings):
+        '''put_and_collision for a whole list of uris at once, see
+        CrawlerCache.put_many'''
+
+        collisions = []
+
+        for hashed_uri in self.hash_uris(uri_strings):
+            base, position = self.find(hashed_uri)
+            collision = False
+
+            if position < 0:
+                position = self.free_or_lru(base)
+                collision = bool(self._cache[base + position])
+
+            self.move_to_front(base, position, hashed_uri)
+            collisions.append(collision)
+
+        self._puts += len(collisions)
+        self._collisions += collisions.count(True)
+
+        return collisions
+
+
+
+
+class EpochCrawlerCache(CrawlerCache):
+    '''CrawlerCache with O(1) clears.  Every slot has a generation tag next to
+    its hash, set to the cache's current generation when the slot is written.
+    A slot only counts as holding a value if its tag is at least the oldest
+    live generation, so clear() just starts a new generation and moves the
+    oldest live generation up to it; stale slots read as empty and are
+    overwritten as the crawl goes on.
+
+    age_out() is a partial clear: it starts a new generation but keeps slots
+    written during the last 'keep' generations.  Calling it periodically
+    forgets the oldest visits while keeping recent ones.
+
+    The tags live in process memory, so this cache doesn't take a shared
+    table or file.'''
+
+
+    def __init__(self, mask_length=8):
+
+        super(EpochCrawlerCache, self).__init__(mask_length)
+
+        #tag 0 is never a live generation, so unwritten slots read as empty
+        self._tags = array.array('I', (0 for i in range(self._cache_mask+1)))
+        self._generation = 1
+        self._oldest_generation = 1
+
+
+    def live(self, index):
+        '''True if the slot at index holds a value of a live generation'''
+        return self._tags[index] >= self._oldest_generation
+
+
+    def write(self, index, hashed_uri):
+        self._cache[index] = hashed_uri
+        self._tags[index] = self._generation
+
+
+    def put(self, uri_string, overwrite=True):
+        '''see CrawlerCache.put, stale slots count as empty'''
+
+        hashed_uri = self.hash_uri(uri_string)
+        index = hashed_uri & self._cache_mask
+        occupied = self.live(index)
+
+        if (occupied and not overwrite):
+            return False
+        else:
+            self._puts += 1
+            if (occupied and self._cache[index] != hashed_uri):
+                self._collisions += 1
+            self.write(index, hashed_uri)
+            return True
+
+
+    def put_and_collision(self, uri_string):
+        '''see CrawlerCache.put_and_collision, stale slots count as empty'''
+
+        hashed_uri = self.hash_uri(uri_string)
+        index = hashed_uri & self._cache_mask
+        self._puts += 1
+
+        collision = self.live(index) and self._cache[index] != hashed_uri
+        self._collisions += collision
+        self.write(index, hashed_uri)
+
+        return collision
+
+
+    def check(self, uri_string):
+        '''returns True if value found in cache, False if not found.'''
+
+        hashed_uri = self.hash_uri(uri_string)
+        index = hashed_uri & self._cache_mask
+        self._checks += 1
+
+        if (self._cache[index] == hashed_uri and self.live(index)):
+            self._hits += 1
+            return True
+        else:
+            return False
+
+
+    def check_and_put(self, uri_string):
+        '''see CrawlerCache.check_and_put, stale slots count as empty'''
+
+        hashed_uri = self.hash_uri(uri_string)
+        index = hashed_uri & self._cache_mask
+        self._checks += 1
+        occupied = self.live(index)
+
+        if (occupied and self._cache[index] == hashed_uri):
+            self._hits += 1
+            return False
+        else:
+            self._puts += 1
+            self._collisions += occupied
+            self.write(index, hashed_uri)
+            return True
+
+
+    def check_many(self, uri_strings):
+        '''check a whole list of uris at once, see CrawlerCache.check_many'''
+
+        cache = self._cache
+        tags = self._tags
+        mask = self._cache_mask
+        oldest = self._oldest_generation
+
+        found = [cache[hashed_uri & mask] == hashed_uri and tags[hashed_uri & mask] >= oldest \
+                for hashed_uri in self.hash_uris(uri_strings)]
+
+        self._checks += len(found)
+        self._hits += found.count(True)
+
+        return found
+
+
+    def put_many(self, uri_strings):
+        '''put_and_collision for a whole list of uris at once, see
+        CrawlerCache.put_many'''
+
+        cache = self._cache
+        tags = self._tags
+        mask = self._cache_mask
+        oldest = self._oldest_generation
+        generation = self._generation
+        collisions = []
+
+        for hashed_uri in self.hash_uris(uri_strings):
+            index = hashed_uri & mask
+            collisions.append(tags[index] >= oldest and cache[index] != hashed_uri)
+            cache[index] = hashed_uri
+            tags[index] = generation
+
+        self._puts += len(collisions)
+        self._collisions += collisions.count(True)
+
+        return collisions
+
+
+    def clear(self):
+        '''forget every value, by starting a new generation.  O(1), except
+        once every 2^32 generations when the tags have to be reset.'''
+
+        self._clears += 1
+        self.next_generation()
+        self._oldest_generation = self._generation
+
+
+    def age_out(self, keep=1):
+        '''start a new generation, forgetting values written before the last
+        'keep' generations.  age_out(0) is the same as clear().  Counted in
+        stats as a clear.'''
+
+        self._clears += 1
+        self.next_generation()
+        self._oldest_generation = max(self._oldest_generation, self._generation - keep)
+
+
+    def next_generation(self):
+
+        if self._generation >= 2**32 - 1:
+            #out of tag values, really wipe the table and start over
+            log.info( 'cache generation counter wrapped, resetting table' )
+            for index in range(len(self._tags)):
+                self._cache[index] = 0
+                self._tags[index] = 0
+            self._generation = 0
+            self._oldest_generation = 1
+
+        self._generation += 1
+
+
+    def occupancy(self):
+        '''return number of indices currently holding a live value'''
+        oldest = self._oldest_generation
+        return sum(1 for tag in self._tags if tag >= oldest)
+
+
+
+
+class ResizingCrawlerCache(CrawlerCacheWithCollisionHistory):
+    '''CrawlerCacheWithCollisionHistory that grows itself.  Every 'window'
+    puts it looks at the fraction of those puts that collided, and if that
+    is above collision_threshold it doubles the table (up to
+    2^max_mask_length entries).
+
+    The table stores full 64 bit hashes, so growing needs no URIs: each
+    stored hash moves to index (hash & new mask).  Doubling only adds one
+    bit to the mask, so hashes that had different slots still do and
+    nothing is lost.  Hashes in the collision history get their slot back
+    if it's free in the bigger table.
+
+    Resizing replaces the table, so this cache is always in process memory
+    and doesn't take a shared table or file.'''
+
+
+    def __init__(self, mask_length=8, collision_history=10, max_mask_length=20, \
+            collision_threshold=0.1, window=256):
+
+        super(ResizingCrawlerCache, self).__init__(mask_length, collision_history)
+
+        self._max_mask_length = max_mask_length
+        self._collision_threshold = collision_threshold
+        self._window = window
+        self._window_puts = 0
+        self._window_collisions = 0
+
+
+    def put(self, uri_string, overwrite=True):
+        result = super(ResizingCrawlerCache, self).put(uri_string, overwrite)
+        self.check_collision_rate()
+        return result
+
+
+    def put_and_collision(self, uri_string):
+        result = super(ResizingCrawlerCache, self).put_and_collision(uri_string)
+        self.check_collision_rate()
+        return result
+
+
+    def check_and_put(self, uri_string):
+        result = super(ResizingCrawlerCache, self).check_and_put(uri_string)
+        self.check_collision_rate()
+        return result
+
+
+    def put_many(self, uri_strings):
+        result = super(ResizingCrawlerCache, self).put_many(uri_strings)
+        self.check_collision_rate()
+        return result
+
+
+    def check_collision_rate(self):
+        '''once a window of puts has gone by, grow the table if too many of
+        them collided'''
+
+        puts = self._puts - self._window_puts
+        if puts < self._window:
+            return
+
+        rate = (self._collisions - self._window_collisions) / float(puts)
+        self._window_puts = self._puts
+        self._window_collisions = self._collisions
+
+        if rate > self._collision_threshold:
+            if self._cache_table_mask_length < self._max_mask_length:
+                log.info( 'CACHE: collision rate %.2f over last %s puts, growing table', \
+                        rate, puts )
+                self.grow()
+            else:
+                log.debug( 'CACHE: collision rate %.2f, but table is at max size', rate )
+
+
+    def reset_stats(self):
+        '''zero the counters, and the collision rate window that counts from them'''
+        super(ResizingCrawlerCache, self).reset_stats()
+        self._window_puts = 0
+        self._window_collisions = 0
+
+
+    def grow(self):
+        '''double the table, rehashing the stored hashes into it'''
+
+        old_cache = self._cache
+
+        self._cache_table_mask_length += 1
+        self._cache_mask = (2**self._cache_table_mask_length) - 1
+        self._cache = array.array('L', (0 for i in range(self._cache_mask+1)))
+
+        for hashed_uri in old_cache:
+            if hashed_uri:
+                self._cache[hashed_uri & self._cache_mask] = hashed_uri
+
+        for hashed_uri in self._collision_history.asList():
+            if not self._cache[hashed_uri & self._cache_mask]:
+                self._cache[hashed_uri & self._cache_mask] = hashed_uri
+
+        log.info( 'CACHE: grown to %s entries, mask_length %s', \
+                len(self._cache), self._cache_table_mask_length )
@@ -0,0 +1,214 @@
+#!/usr/bin/python
+'''
+Launcher for several ChainCrawler processes crawling from one entry point.
+
+Every worker process runs a normal ChainCrawler random walk, but their
+CrawlerCaches are all built over one hash table in shared memory (see
+crawlerCache.shared_cache_table), so a walker steers away from whatever any
+of the walkers has recently visited.  Each worker still keeps its own
+crawl_history, collision history and found_resources set.
+
+Workers push their matches onto one multiprocessing queue.  The pool reads
+that queue, drops URIs another worker already reported (using its own
+TimeDecaySet with the same persistence), and emits a single merged stream of
+matches to a Queue or a ZMQ socket, the same way ChainCrawler does.
+
+Workers download with their own pooled session (each process makes its own
+shared_fetcher), so build the pool before downloading anything in the parent.
+'''
+
+from chainCrawler import ChainCrawler
+from crawlerCache import CrawlerCacheWithCollisionHistory, shared_cache_table
+from timeDecaySet import TimeDecaySet
+from zmqOutput import ZmqOutput
+from globalConfig import log
+import multiprocessing
+import threading
+import Queue
+
+
+def run_worker(worker_id, table, results, entry_point, cache_table_mask_length, \
+        crawler_kwargs, query):
+    '''entry point of a worker process: crawl with a cache over the shared
+    table, pushing matches onto the results queue.'''
+
+    cache = CrawlerCacheWithCollisionHistory(cache_table_mask_length, table=table)
+
+    crawler = ChainCrawler(entry_point, cache=cache, **crawler_kwargs)
+    crawler.q = results
+
+    log.info( 'POOL: worker %s starting', worker_id )
+
+    try:
+        crawler.crawl(**query)
+    except KeyboardInterrupt:
+        pass
+
+    log.info( 'POOL: worker %s ended', worker_id )
+
+
+class ChainCrawlerPool(object):
+
+
+    def __init__(self, entry_point='http://learnair.media.mit.edu:8000/', workers=4, \
+            cache_table_mask_length=8, found_set_persistence=720, **crawler_kwargs):
+        #entry_point = starting URL for every worker's crawl
+        #workers = how many crawler processes to run
+        #cache_table_mask_length = size of the shared hash table (2^x entries)
+        #found_set_persistence = how long, in min, a URI is kept in the merged
+        #       output's found set (and in each worker's) before it is resubmitted
+        #crawler_kwargs = any other ChainCrawler arguments (crawl_delay,
+        #       track_search_depth, filter_keywords, emit_resources), passed to every worker
+
+        self.entry_point = entry_point
+        self.workers = workers
+        self.cache_table_mask_length = cache_table_mask_length
+
+        crawler_kwargs['found_set_persistence'] = found_set_persistence
+        self.crawler_kwargs = crawler_kwargs
+
+        #shared cache table, and queue of matches from every worker
+        self.table = shared_cache_table(cache_table_mask_length)
+        self.results = multiprocessing.Queue()
+        self.processes = []
+
+        #merged output
+        self.found_resources = TimeDecaySet(found_set_persistence)
+        self.q = None
+        self.zmq = None
+        self.emit_resources = crawler_kwargs.get('emit_resources', False)
+
+        log.info( "-----------------------------------------------" )
+        log.info( "Crawler Pool Initialized, %s workers.", workers )
+        log.info( "Entry Point: %s", self.entry_point )
+        log.info( "-----------------------------------------------" )
+
+
+    def push_uris_to_queue(self, uris, topic=None, resources=None):
+        '''check uris against the merged found_resources set, and if they're
+        not there, push them out to the queue/zmq socket (published on topic,
+        with a pub ZmqOutput).  resources maps a uri to the resource a worker
+        sent with it, with emit_resources'''
+
+        found_one = False
+
+        for uri in uris:
+            if self.found_resources.add(uri):
+
+                log.info('POOL: New Resource Found!  %s', uri)
+                found_one = True
+
+                if self.q is not None:
+                    if self.emit_resources:
+                        self.q.put((uri, resources.get(uri)))
+                    else:
+                        self.q.put(uri)
+                elif self.zmq is not None:
+                    self.zmq.send(uri, topic, resources.get(uri) if resources else None)
+                else:
+                    log.warn('QUEUE: Queue and ZMQ Socket undefined')
+
+        return found_one
+
+
+    def crawl_thread(self, q=None, namespace="", resource_type=None, \
+            plural_resource_type=None, resource_title=None, resource_extra=None):
+        '''
+        q is a link to the queue you'd like URIs of found resources pushed to.
+        '''
+        if q is not None:
+            self.q = q
+
+        kwargs = {'namespace':namespace, 'resource_type':resource_type, \
+                'plural_resource_type':plural_resource_type, \
+                'resource_title':resource_title, 'resource_extra':resource_extra}
+
+        self.thread = threading.Thread(target=self.crawl, kwargs=kwargs)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def crawl_zmq(self, socket="tcp://127.0.0.1:5557", namespace="", resource_type=None, \
+            plural_resource_type=None, resource_title=None, resource_extra=None, \
+            **output_kwargs):
+        '''
+        socket is a link to the queue you'd like URIs of found resources pushed to.
+        output_kwargs are passed to ZmqOutput.  Workers only report URIs, so
+        with pattern='pub' everything is published on the queried type
+        (namespace + resource_type), or '' if there is none.
+        '''
+        output_kwargs.setdefault('resources', self.emit_resources)
+        self.zmq = ZmqOutput(socket, **output_kwargs)
+
+        try:
+            self.crawl(namespace,resource_type,plural_resource_type,resource_title, resource_extra)
+        finally:
+            self.zmq.close()
+
+
+    def crawl(self, namespace="", resource_type=None, \
+            plural_resource_type=None, resource_title=None, resource_extra=None):
+        '''start the worker processes crawling with the given query (see
+        ChainCrawler.crawl), and merge their matches into one output stream
+        until every worker has stopped.'''
+
+        query = {'namespace':namespace, 'resource_type':resource_type, \
+                'plural_resource_type':plural_resource_type, \
+                'resource_title':resource_title, 'resource_extra':resource_extra}
+
+        self.processes = []
+
+        if resource_type is not None:
+            topic = namespace + resource_type
+        else:
+            topic = None
+
+        for worker_id in range(self.workers):
+            process = multiprocessing.Process(target=run_worker, args=(worker_id, \
+                    self.table, self.results, self.entry_point, \
+                    self.cache_table_mask_length, self.crawler_kwargs, query))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+        try:
+            while True:
+                try:
+                    result = self.results.get(timeout=1)
+                except Queue.Empty:
+                    if not any(p.is_alive() for p in self.processes):
+                        break
+                    continue
+
+                if self.emit_resources:
+                    uri, resource = result
+                    self.push_uris_to_queue([uri], topic, {uri:resource})
+                else:
+                    self.push_uris_to_queue([result], topic)
+
+        finally:
+            self.stop()
+
+        log.info( "--- crawler pool ended ---" )
+
+        return self.found_resources
+
+
+    def stop(self):
+        '''terminate any worker processes still running'''
+
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+if __name__=="__main__":
+
+    #######POOL CRAWL EXAMPLE######
+
+    pool = ChainCrawlerPool(workers=4, cache_table_mask_length=10, \
+            found_set_persistence=2, crawl_delay=500)
+
+    pool.crawl_zmq(namespace='http://learnair.media.mit.edu:8000/rels/', \
+            resource_type='sensor')
@@ -0,0 +1,609 @@
+#!/usr/bin/python
+'''
+Distributed crawl of one ChainAPI deployment, by worker processes on one
+machine or several, run by a coordinator over ZMQ.
+
+URIs are partitioned between the workers by their CityHash64 (the same hash
+the CrawlerCache keys on; the high 32 bits pick the worker).  A worker owns
+its partition: it keeps the set of those URIs visited this round and the
+found_resources set for them, keeps the frontier of its URIs still to crawl,
+and is the only one that downloads them.  Links a worker finds to URIs of
+other partitions are sent to their owners in batches, tagged with whether
+they matched the query, and the owner decides whether they are new.
+
+Instead of ChainCrawler's random walk, each worker crawls the resources of
+its frontier in order, so together the workers crawl everything reachable
+from the entry point once per round.  Unlike a CrawlerCache, the visited
+sets never forget a URI during a round (an evicted URI would go back on the
+frontier, and the round might never end), so each worker holds a 64 bit
+hash (about 80 bytes with its set entry) for every URI of its partition it
+has seen that round.
+
+The coordinator seeds the entry point, forwards the matches workers report
+to a Queue or ZMQ socket, the same way ChainCrawler does, and watches the
+workers' counters to tell when a round is over: every frontier empty and
+every batch sent also received, twice in a row.  It then clears the workers'
+visited sets and seeds the next round (or stops, after the given number of
+rounds).  found_resources sets persist across rounds, so a resource is only
+reported again once found_set_persistence has passed.
+
+Sockets:
+    each worker binds a PULL socket (its address in worker_addresses) for
+        link batches, and connects a PUSH socket to every other worker
+    the coordinator binds a PULL socket at results_address for workers'
+        matches and status, and a PUB socket at control_address for seeds,
+        'clear' and 'stop'
+
+Start local workers (start_local_workers) before creating any ZMQ socket or
+downloading anything in the parent process.
+'''
+
+from chainCrawler import ChainCrawler
+from crawlerCache import CrawlerCache
+from timeDecaySet import TimeDecaySet, clock
+from chainFetcher import shared_fetcher
+from chainQuery import ChainQuery
+from linkPipeline import link_pairs, filter_keywords, flatten_links
+from zmqOutput import ZmqOutput
+from globalConfig import log
+from collections import deque
+import multiprocessing
+import threading
+import requests
+import json
+import time
+import zmq
+
+
+def partition(uri, partitions):
+    '''which of partitions workers owns uri'''
+    return (CrawlerCache.hash_uri(uri) >> 32) % partitions
+
+
+def run_worker(worker_id, worker_addresses, worker_kwargs):
+    '''entry point of a local worker process'''
+
+    worker = ChainCrawlWorker(worker_id, worker_addresses, **worker_kwargs)
+
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+
+
+
+class ChainCrawlWorker(object):
+
+
+    def __init__(self, worker_id, worker_addresses, results_address="tcp://127.0.0.1:5570", \
+            control_address="tcp://127.0.0.1:5571", found_set_persistence=720, \
+            crawl_delay=1000, filter_keywords=['previous','next'], batch_size=50, \
+            flush_interval=0.5, status_interval=0.5, fetcher=None):
+        #worker_id = this worker's index in worker_addresses
+        #worker_addresses = ZMQ address of every worker's link socket, in order.
+        #       Every worker (and the coordinator's worker count) must agree on it
+        #results_address, control_address = the coordinator's sockets
+        #found_set_persistence = how long, in min, to keep a found URI of this
+        #       partition before it can be reported again
+        #crawl_delay = how long, in ms, before downloading each resource
+        #batch_size = how many links to send another worker in one message
+        #flush_interval = longest time, in s, a link waits for its batch to fill
+        #status_interval = how often, in s, to report counters to the coordinator
+        #fetcher = ChainFetcher used to download resources
+
+        self.worker_id = worker_id
+        self.workers = len(worker_addresses)
+        self.crawl_delay = crawl_delay
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.status_interval = status_interval
+
+        #hashes of the URIs of our partition seen this round
+        self.visited = set()
+        self.found_resources = TimeDecaySet(found_set_persistence)
+        self.frontier = deque()
+        self.query = None
+        self.query_criteria = None
+
+        if fetcher is not None:
+            self.fetcher = fetcher
+        else:
+            self.fetcher = shared_fetcher()
+
+        self.filter_keywords = ['edit','create','self','curies','websocket']
+        [self.filter_keywords.append(x) for x in filter_keywords]
+
+        #links waiting to go to each worker, and when the oldest was added
+        self.outgoing = [[] for i in range(self.workers)]
+        self.outgoing_since = [None] * self.workers
+
+        #batches sent to and received from other workers, and resources crawled
+        self.sent = 0
+        self.received = 0
+        self.crawled = 0
+        self.status_count = 0
+        self.stopped = False
+
+        context = zmq.Context.instance()
+
+        self.inbox = context.socket(zmq.PULL)
+        self.inbox.bind(worker_addresses[worker_id])
+
+        #no high water mark between workers: two workers blocked sending to
+        #each other would never read their inboxes again
+        self.peers = []
+        for peer_id, address in enumerate(worker_addresses):
+            if peer_id == worker_id:
+                self.peers.append(None)
+            else:
+                peer = context.socket(zmq.PUSH)
+                peer.setsockopt(zmq.SNDHWM, 0)
+                peer.connect(address)
+                self.peers.append(peer)
+
+        self.results = context.socket(zmq.PUSH)
+        self.results.connect(results_address)
+
+        self.control = context.socket(zmq.SUB)
+        self.control.setsockopt(zmq.SUBSCRIBE, '')
+        self.control.connect(control_address)
+
+        log.info( 'DISTRIBUTED: worker %s of %s on %s', worker_id, self.workers, \
+                worker_addresses[worker_id] )
+
+
+    def run(self):
+        '''crawl the frontier and serve other workers' links until the
+        coordinator says stop'''
+
+        poller = zmq.Poller()
+        poller.register(self.inbox, zmq.POLLIN)
+        poller.register(self.control, zmq.POLLIN)
+
+        next_status = 0
+
+        try:
+            while not self.stopped:
+
+                #don't wait for messages while there is crawling to do
+                if len(self.frontier):
+                    timeout = 0
+                else:
+                    timeout = int(self.status_interval * 500)
+
+                events = dict(poller.poll(timeout))
+
+                if self.control in events:
+                    self.receive_control()
+                if self.inbox in events:
+                    self.receive_batches()
+
+                if len(self.frontier) and self.query is not None:
+                    self.crawl_next()
+
+                #send partly filled batches once they are old, or right away
+                #if we have nothing else to do
+                if len(self.frontier):
+                    self.flush(self.flush_interval)
+                else:
+                    self.flush()
+
+                if clock() >= next_status:
+                    self.send_status()
+                    next_status = clock() + self.status_interval
+
+        finally:
+            self.close()
+
+        log.info( 'DISTRIBUTED: worker %s ended, %s resources crawled', \
+                self.worker_id, self.crawled )
+
+
+    def receive_control(self):
+
+        while True:
+            try:
+                message = self.control.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+
+            if message[0] == 'seed':
+                seed = json.loads(message[1])
+                self.set_query(seed['query'])
+                if partition(seed['entry_point'], self.workers) == self.worker_id:
+                    log.info( 'DISTRIBUTED: seeding %s', seed['entry_point'] )
+                    self.receive_links([[seed['entry_point'], 'entry_point', \
+                            'entry_point', False]])
+
+            elif message[0] == 'clear':
+                log.info( 'DISTRIBUTED: new round, clearing %s visited URIs', len(self.visited) )
+                self.visited.clear()
+
+            elif message[0] == 'stop':
+                self.stopped = True
+
+
+    def set_query(self, criteria):
+        '''compile the query criteria sent by the coordinator, if they changed'''
+
+        if criteria != self.query_criteria:
+            self.query_criteria = criteria
+            self.query = ChainQuery(**criteria)
+
+
+    def receive_batches(self):
+
+        while True:
+            try:
+                batch = self.inbox.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+
+            self.received += 1
+            self.receive_links(json.loads(batch))
+
+
+    def receive_links(self, links):
+        '''links of this partition, each [href, type, title, matched].  Report
+        matches not found before, and add links not visited this round to
+        the frontier.'''
+
+        for href, link_type, title, matched in links:
+
+            if matched:
+                self.report_found(href, link_type)
+
+            hashed_uri = CrawlerCache.hash_uri(href)
+            if hashed_uri not in self.visited:
+                self.visited.add(hashed_uri)
+                self.frontier.append((href, link_type, title))
+
+
+    def report_found(self, uri, uri_type):
+
+        #if 'add' returns true, it's not in our set yet
+        if self.found_resources.add(uri):
+            log.info('DISTRIBUTED: New Resource Found!  %s', uri)
+            self.results.send_multipart(['found', json.dumps([uri, uri_type])])
+
+
+    def crawl_next(self):
+        '''download the next resource of the frontier, and send its links to
+        their owners'''
+
+        uri, uri_type, uri_title = self.frontier.popleft()
+
+        time.sleep(self.crawl_delay/1000.0)
+
+        try:
+            resource_json = self.fetcher.get_json(uri)
+        except (requests.exceptions.RequestException, ValueError):
+            log.warn( 'URI "%s" unresponsive, ignoring', uri )
+            return
+
+        self.crawled += 1
+
+        req_links = ChainCrawler.apply_hal_curies(resource_json).get('_links', {})
+        crawl_links = list(flatten_links(filter_keywords(link_pairs(req_links), \
+                self.filter_keywords), uri_type))
+
+        if self.query.extra is None:
+            #we don't need to actually download the link to see if it matches
+            matching = set(self.query.match_links(crawl_links, uri_type))
+        else:
+            #we only have enough information to tell if the current node matches
+            matching = set()
+            if self.query.matches_node(uri_type, uri_title, resource_json):
+                self.report_found(uri, uri_type)
+
+        for link in crawl_links:
+            self.route([link['href'], link['type'], link.get('title', ''), \
+                    link['href'] in matching])
+
+
+    def route(self, link):
+        '''handle a link here if it is ours, otherwise add it to the batch for
+        its owner'''
+
+        owner = partition(link[0], self.workers)
+
+        if owner == self.worker_id:
+            self.receive_links([link])
+            return
+
+        if not len(self.outgoing[owner]):
+            self.outgoing_since[owner] = clock()
+        self.outgoing[owner].append(link)
+
+        if len(self.outgoing[owner]) >= self.batch_size:
+            self.send_batch(owner)
+
+
+    def send_batch(self, owner):
+
+        self.peers[owner].send(json.dumps(self.outgoing[owner]))
+        self.sent += 1
+        self.outgoing[owner] = []
+        self.outgoing_since[owner] = None
+
+
+    def flush(self, older_than=None):
+        '''send every partly filled batch, or only those whose oldest link has
+        waited at least older_than seconds'''
+
+        now = clock()
+
+        for owner in range(self.workers):
+            if len(self.outgoing[owner]):
+                if older_than is None or now - self.outgoing_since[owner] >= older_than:
+                    self.send_batch(owner)
+
+
+    def send_status(self):
+
+        self.status_count += 1
+
+        status = {'worker':self.worker_id, 'count':self.status_count, \
+                'sent':self.sent, 'received':self.received, 'crawled':self.crawled, \
+                'frontier':len(self.frontier), \
+                'outgoing':sum(len(x) for x in self.outgoing)}
+
+        self.results.send_multipart(['status', json.dumps(status)])
+
+
+    def close(self):
+
+        for socket in [self.inbox, self.results, self.control] + \
+                [x for x in self.peers if x is not None]:
+            socket.close(0)
+
+
+
+class ChainCrawlCoordinator(object):
+
+
+    def __init__(self, entry_point='http://learnair.media.mit.edu:8000/', workers=4, \
+            results_address="tcp://127.0.0.1:5570", control_address="tcp://127.0.0.1:5571", \
+            rounds=0, check_interval=1):
+        #entry_point = starting URL for the crawl
+        #workers = how many workers take part (len of their worker_addresses)
+        #results_address, control_address = addresses to bind the coordinator's
+        #       sockets to, workers connect to these
+        #rounds = how many rounds to crawl before stopping, 0 to crawl forever
+        #check_interval = how often, in s, to check whether a round is over
+
+        self.entry_point = entry_point
+        self.workers = workers
+        self.results_address = results_address
+        self.control_address = control_address
+        self.rounds = rounds
+        self.check_interval = check_interval
+
+        self.q = None
+        self.zmq = None
+        self.processes = []
+
+        log.info( "-----------------------------------------------" )
+        log.info( "Distributed Crawl Coordinator Initialized, %s workers.", workers )
+        log.info( "Entry Point: %s", self.entry_point )
+        log.info( "-----------------------------------------------" )
+
+
+    def start_local_workers(self, base_port=5580, **worker_kwargs):
+        '''start every worker as a process on this machine, with link sockets
+        on consecutive ports from base_port.  worker_kwargs are passed to
+        ChainCrawlWorker.'''
+
+        worker_addresses = ['tcp://127.0.0.1:%s' % (base_port + i) for i in range(self.workers)]
+
+        worker_kwargs['results_address'] = self.results_address
+        worker_kwargs['control_address'] = self.control_address
+
+        for worker_id in range(self.workers):
+            process = multiprocessing.Process(target=run_worker, \
+                    args=(worker_id, worker_addresses, worker_kwargs))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+        return worker_addresses
+
+
+    def push_uris_to_queue(self, uris, topic=None):
+        '''push URIs workers found out to the queue/zmq socket.  Each worker
+        only reports URIs of its own partition, and only once per
+        found_set_persistence, so there are no duplicates to drop.'''
+
+        for uri in uris:
+            if self.q is not None:
+                self.q.put(uri)
+            elif self.zmq is not None:
+                self.zmq.send(uri, topic)
+            else:
+                log.warn('QUEUE: Queue and ZMQ Socket undefined')
+
+
+    def crawl_thread(self, q=None, namespace="", resource_type=None, \
+            plural_resource_type=None, resource_title=None, resource_extra=None):
+        '''
+        q is a link to the queue you'd like URIs of found resources pushed to.
+        '''
+        if q is not None:
+            self.q = q
+
+        kwargs = {'namespace':namespace, 'resource_type':resource_type, \
+                'plural_resource_type':plural_resource_type, \
+                'resource_title':resource_title, 'resource_extra':resource_extra}
+
+        self.thread = threading.Thread(target=self.crawl, kwargs=kwargs)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def crawl_zmq(self, socket="tcp://127.0.0.1:5557", namespace="", resource_type=None, \
+            plural_resource_type=None, resource_title=None, resource_extra=None, \
+            **output_kwargs):
+        '''
+        socket is a link to the queue you'd like URIs of found resources pushed to.
+        output_kwargs are passed to ZmqOutput; with pattern='pub' each URI is
+        published with its resource type as topic.
+        '''
+        self.zmq = ZmqOutput(socket, **output_kwargs)
+
+        try:
+            self.crawl(namespace,resource_type,plural_resource_type,resource_title, resource_extra)
+        finally:
+            self.zmq.close()
+
+
+    def crawl(self, namespace="", resource_type=None, \
+            plural_resource_type=None, resource_title=None, resource_extra=None):
+        '''crawl with the given query (see ChainCrawler.crawl) over every
+        worker, pushing out the matches they find, for self.rounds rounds
+        (forever if 0).  Returns the number of rounds crawled.'''
+
+        query = {'namespace':namespace, 'resource_type':resource_type, \
+                'plural_resource_type':plural_resource_type, \
+                'resource_title':resource_title, 'resource_extra':resource_extra}
+        seed = json.dumps({'entry_point':self.entry_point, 'query':query})
+
+        context = zmq.Context.instance()
+        results = context.socket(zmq.PULL)
+        results.bind(self.results_address)
+        control = context.socket(zmq.PUB)
+        control.bind(self.control_address)
+
+        #latest status of each worker
+        statuses = {}
+        last_check = None
+        round_crawled = None
+        rounds_done = 0
+        next_check = clock() + self.check_interval
+
+        try:
+            while True:
+
+                if results.poll(int(self.check_interval * 1000)):
+                    while True:
+                        try:
+                            message = results.recv_multipart(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+
+                        if message[0] == 'found':
+                            uri, uri_type = json.loads(message[1])
+                            self.push_uris_to_queue([uri], uri_type)
+                        elif message[0] == 'status':
+                            status = json.loads(message[1])
+                            statuses[status['worker']] = status
+
+                if clock() < next_check:
+                    continue
+                next_check = clock() + self.check_interval
+
+                #wait for every worker before seeding
+                if len(statuses) < self.workers:
+                    log.info( 'DISTRIBUTED: %s of %s workers ready', len(statuses), self.workers )
+                    continue
+
+                check = self.quiescent(statuses)
+                if check is None or not self.settled(last_check, check):
+                    last_check = check
+                    continue
+                last_check = None
+
+                #every worker idle, and idle on their last check too
+                crawled = check[2]
+
+                if round_crawled is not None and crawled > round_crawled:
+                    rounds_done += 1
+                    log.info( 'DISTRIBUTED: round %s done, %s resources crawled', \
+                            rounds_done, crawled - round_crawled )
+                    if self.rounds and rounds_done >= self.rounds:
+                        break
+                    control.send_multipart(['clear'])
+                elif round_crawled is not None:
+                    log.warn( 'DISTRIBUTED: nothing crawled since seeding, seeding again' )
+
+                round_crawled = crawled
+                control.send_multipart(['seed', seed])
+
+        finally:
+            control.send_multipart(['stop'])
+            time.sleep(0.5)
+            results.close(0)
+            control.close(0)
+            self.stop()
+
+        log.info( "--- distributed crawl ended ---" )
+
+        return rounds_done
+
+
+    def quiescent(self, statuses):
+        '''(status count of each worker, batches sent, resources crawled) if
+        every worker is idle and every batch sent has been received, otherwise
+        None'''
+
+        statuses = statuses.values()
+
+        if any(x['frontier'] or x['outgoing'] for x in statuses):
+            return None
+
+        sent = sum(x['sent'] for x in statuses)
+        if sent != sum(x['received'] for x in statuses):
+            return None
+
+        return (dict((x['worker'], x['count']) for x in statuses), sent, \
+                sum(x['crawled'] for x in statuses))
+
+
+    @staticmethod
+    def settled(last_check, check):
+        '''True if the workers were quiescent on both checks, with nothing
+        sent or crawled in between, and every worker has reported since the
+        last check.  Workers report at different times, so one quiescent check
+        can be made of statuses from before and after a batch was passed on.'''
+
+        if last_check is None or check is None:
+            return False
+
+        if check[1:] != last_check[1:]:
+            return False
+
+        return all(count > last_check[0][worker] for worker, count in check[0].iteritems())
+
+
+    def stop(self):
+        '''wait for (then terminate) any local worker processes'''
+
+        for process in self.processes:
+            process.join(2)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+
+
+if __name__=="__main__":
+
+    #######LOCAL DISTRIBUTED CRAWL EXAMPLE######
+
+    coordinator = ChainCrawlCoordinator(workers=4, rounds=1)
+    coordinator.start_local_workers(crawl_delay=500)
+
+    coordinator.crawl_zmq(namespace='http://learnair.media.mit.edu:8000/rels/', \
+            resource_type='sensor')
+
+    #######SEVERAL MACHINES######
+
+    #on each worker machine, i = 0..3:
+    #addresses = ['tcp://10.0.0.%s:5580' % (10 + x) for x in range(4)]
+    #ChainCrawlWorker(i, addresses, results_address='tcp://10.0.0.1:5570', \
+    #        control_address='tcp://10.0.0.1:5571').run()
+
+    #on the coordinator machine:
+    #coordinator = ChainCrawlCoordinator(workers=4, \
+    #        results_address='tcp://*:5570', control_address='tcp://*:5571')
+    #coordinator.crawl_zmq(namespace='http://learnair.media.mit.edu:8000/rels/', \
+    #        resource_type='sensor')
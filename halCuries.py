@@ -0,0 +1,108 @@
+'''
+CURIES expansion for HAL/JSON links, shared by ChainCrawler and ChainSearch.
+
+A HAL resource defines CURIES (i.e. name "ch", href
+"http://learnair.media.mit.edu/rels/{rel}") that shorten its link relations
+('ch:sites' for "http://learnair.media.mit.edu/rels/sites").  ChainAPI serves
+the same few CURIES on every page, so each distinct set of CURIES is compiled
+once into a dict of name -> the href split around its '{...}' placeholder,
+and kept in a small LRU cache keyed by its (name, href) pairs.  Expanding a
+link relation is then a dict lookup and a string join.
+'''
+
+from collections import OrderedDict
+from globalConfig import log
+import re
+import threading
+
+
+class CurieExpander(object):
+
+
+    def __init__(self, max_size=64):
+        #max_size = how many distinct sets of CURIES to keep compiled
+
+        self._max_size = max_size
+        self._compiled = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def compile(self, curies):
+        '''returns the compiled form of a resource's CURIES list: a dict of
+        curie name -> (href before '{...}', href after it), or -> (href, None)
+        if the href has no placeholder'''
+
+        key = tuple((curie['name'], curie['href']) for curie in curies)
+
+        with self._lock:
+            try:
+                #most recently used last
+                templates = self._compiled.pop(key)
+                self._compiled[key] = templates
+                return templates
+            except KeyError:
+                pass
+
+        templates = {}
+        for name, href in key:
+            #the first curie with a name wins, as it did when applied in order
+            if name in templates:
+                continue
+            placeholder = re.search(r"\{.*\}", href)
+            if placeholder is not None:
+                templates[name] = (href[:placeholder.start()], href[placeholder.end():])
+            else:
+                templates[name] = (href, None)
+
+        with self._lock:
+            self._compiled[key] = templates
+            while len(self._compiled) > self._max_size:
+                self._compiled.popitem(last=False)
+
+        log.debug( 'CURIES: compiled %s', key )
+
+        return templates
+
+
+    @staticmethod
+    def expand_key(templates, key):
+        '''full link relation of key, given compiled CURIES'''
+
+        name, colon, rel = key.partition(':')
+
+        if colon:
+            try:
+                before, after = templates[name]
+            except KeyError:
+                return key
+            if after is None:
+                return before
+            return before + rel + after
+
+        return key
+
+
+    def expand(self, links, del_curies=True):
+        '''returns a new '_links' dict with the CURIES of links applied to its
+        link relations.  The 'curies' entry is left out if del_curies.
+        Raises KeyError if links has no CURIES.'''
+
+        templates = self.compile(links['curies'])
+        expand_key = self.expand_key
+
+        expanded = {}
+        for key, item in links.iteritems():
+            if key == 'curies':
+                if not del_curies:
+                    expanded[key] = item
+                continue
+            newIndex = expand_key(templates, key)
+            if newIndex != key:
+                log.debug( 'CURIES: %s moved to %s', key, newIndex )
+            expanded[newIndex] = item
+
+        return expanded
+
+
+
+curie_expander = CurieExpander()
@@ -0,0 +1,214 @@
+'''
+Incremental parsing of HAL/JSON resources, for ChainSearch.
+
+ChainAPI collection pages can list thousands of resources in '_links'/'items'
+(i.e. all data points of a sensor).  Instead of loading the whole response
+into dicts before looking at it, iter_hal_links reads the body chunk by chunk
+as it arrives and yields the links of '_links' one at a time, each 'items'
+entry separately, as soon as it has been read.  Nothing outside '_links' is
+decoded, and reading stops once '_links' is closed, so the rest of the body
+isn't even downloaded.  Stopping early (i.e. on the first match) just means
+not asking the generator for more.
+
+Links come out as (key, link) pairs, in document order, the same as
+linkPipeline.link_pairs gives for a decoded resource, and go through the same
+extraction pipeline from there.
+'''
+
+import json
+import re
+
+
+#next character that can start/end a string or container, or start an escape
+_STRUCTURE = re.compile(r'["{}\[\]]')
+_STRING_END = re.compile(r'["\\]')
+_SCALAR = re.compile(r'[^\s,\]}]+')
+_WHITESPACE = re.compile(r'\s*')
+
+
+class JsonStreamReader(object):
+    '''reads JSON text from an iterable of chunks (as given by requests'
+    Response.iter_content), one token or value at a time.  Only the part of
+    the text not read yet (plus the value being read) is kept in memory.'''
+
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = ''
+        self._pos = 0
+
+
+    def fill(self):
+        '''read the next chunk into the buffer, dropping what has been read.
+        Returns False at the end of the text.'''
+
+        for chunk in self._chunks:
+            if chunk:
+                self._buf = self._buf[self._pos:] + chunk
+                self._pos = 0
+                return True
+
+        return False
+
+
+    def peek(self):
+        '''next non whitespace character, without reading it ('' at the end)'''
+
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self.fill():
+                return ''
+
+
+    def expect(self, chars):
+        '''read the next non whitespace character, which must be one of chars'''
+
+        char = self.peek()
+        if char == '' or char not in chars:
+            raise ValueError('JSON stream: expected %s, got "%s"' % (chars, char))
+        self._pos += 1
+        return char
+
+
+    def read_value(self):
+        '''read and decode the next value'''
+        return json.loads(self.scan_value(keep=True))
+
+
+    def skip_value(self):
+        '''read past the next value without decoding (or keeping) it'''
+        self.scan_value(keep=False)
+
+
+    def scan_value(self, keep):
+        '''move past the next value, returning its text if keep is True.
+        Strings and containers are scanned by jumping between the characters
+        that can end them, so long values cost little more than a regex
+        search.'''
+
+        char = self.peek()
+
+        if char == '':
+            raise ValueError('JSON stream: unexpected end of text')
+
+        start = self._pos
+
+        #numbers, true, false, null
+        if char not in '{["':
+            while True:
+                end = _SCALAR.match(self._buf, start).end()
+                if end < len(self._buf) or not self.fill():
+                    break
+                start = self._pos
+            self._pos = end
+            return self._buf[start:end]
+
+        depth = 0
+        in_string = False
+        pos = start
+
+        while True:
+
+            if in_string:
+                match = _STRING_END.search(self._buf, pos)
+                if match is None:
+                    pos = len(self._buf)
+                elif match.group() == '\\':
+                    if match.end() < len(self._buf):
+                        pos = match.end() + 1
+                        continue
+                    #need the escaped character too
+                    pos = match.start()
+                else:
+                    in_string = False
+                    pos = match.end()
+                    if depth == 0:
+                        break
+                    continue
+
+            else:
+                match = _STRUCTURE.search(self._buf, pos)
+                if match is None:
+                    pos = len(self._buf)
+                else:
+                    char = match.group()
+                    pos = match.end()
+                    if char == '"':
+                        in_string = True
+                    elif char in '{[':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            break
+                    continue
+
+            #ran out of text in the middle of the value, get more
+            if keep:
+                self._pos = start
+            else:
+                self._pos = pos
+            pos -= self._pos
+            if not self.fill():
+                raise ValueError('JSON stream: unexpected end of text')
+            start = 0
+
+        self._pos = pos
+
+        if keep:
+            return self._buf[start:pos]
+
+
+
+def iter_hal_links(chunks):
+    '''yield (key, link) pairs of the top level '_links' of the HAL/JSON
+    text in chunks, as they are read.  Each entry of an 'items' collection
+    is yielded on its own, as ('items', entry).  Yields nothing if there is
+    no '_links'.'''
+
+    reader = JsonStreamReader(chunks)
+    reader.expect('{')
+
+    if reader.peek() == '}':
+        return
+
+    while True:
+
+        key = reader.read_value()
+        reader.expect(':')
+
+        if key != '_links' or reader.peek() != '{':
+            reader.skip_value()
+
+        else:
+            reader.expect('{')
+            if reader.peek() == '}':
+                return
+
+            while True:
+
+                link_key = reader.read_value()
+                reader.expect(':')
+
+                if link_key == 'items' and reader.peek() == '[':
+                    reader.expect('[')
+                    if reader.peek() != ']':
+                        while True:
+                            yield link_key, reader.read_value()
+                            if reader.expect(',]') == ']':
+                                break
+                    else:
+                        reader.expect(']')
+
+                else:
+                    yield link_key, reader.read_value()
+
+                if reader.expect(',}') == '}':
+                    #nothing else in the resource is needed
+                    return
+
+        if reader.expect(',}') == '}':
+            return
+
@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+from globalConfig import log
+
+
+class HttpValidatorCache(object):
+    '''On-disk store of HTTP validators (ETag / Last-Modified) and the body
+    they validate, keyed by URI.  ChainFetcher sends the validators back with
+    If-None-Match / If-Modified-Since when it recrawls a URI, and reuses the
+    stored body if the server answers 304 Not Modified.
+
+    Backed by sqlite, so it survives restarts and several crawler processes
+    can share the same file.'''
+
+
+    def __init__(self, path='chain_http_cache.sqlite'):
+
+        self._path = path
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS validators (uri TEXT PRIMARY KEY, ' + \
+                'etag TEXT, last_modified TEXT, body TEXT)')
+        self._db.commit()
+
+        log.info( 'HTTP CACHE: using validator cache %s', path )
+
+
+    def get(self, uri):
+        '''returns (etag, last_modified, body) stored for uri, or None if
+        we have nothing stored for it.'''
+
+        with self._lock:
+            row = self._db.execute('SELECT etag, last_modified, body FROM validators ' + \
+                    'WHERE uri = ?', (uri,)).fetchone()
+
+        return row
+
+
+    def put(self, uri, etag, last_modified, body):
+        '''store the validators and body of a fresh (200) response for uri.'''
+
+        with self._lock:
+            with self._db:
+                self._db.execute('INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?)', \
+                        (uri, etag, last_modified, body))
+
+
+    def remove(self, uri):
+        with self._lock:
+            with self._db:
+                self._db.execute('DELETE FROM validators WHERE uri = ?', (uri,))
+
+
+    def size(self):
+        '''return number of uris stored'''
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM validators').fetchone()[0]
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
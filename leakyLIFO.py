@@ -1,3 +1,5 @@
+import threading
+
 
 class LeakyLIFO(object):
     #Simple, leaky LIFO queue.  Pushing when LIFO is full simply pushes the
@@ -5,26 +7,109 @@ class LeakyLIFO(object):
     #can get the full queue as a list, and can 'peek' at any index to get
     #its value
 
+    #values are kept in a fixed size ring buffer, so pushing when full just
+    #overwrites the oldest value in place instead of shifting the whole queue
+
     def __init__(self, max_size=0):
         self._max_size = max_size
-        self._stack = []
+        self.clear()
 
     def push(self, value):
-        if len(self._stack) >= self._max_size:
-            del self._stack[0]
-        self._stack.append(value)
+        if self._max_size <= 0:
+            return
+        if self._count >= self._max_size:
+            #overwrite the oldest value
+            self._ring[self._start] = value
+            self._start = (self._start + 1) % self._max_size
+        else:
+            self._ring[(self._start + self._count) % self._max_size] = value
+            self._count += 1
 
     def pop(self):
-        if (len(self._stack) > 0):
-            return self._stack.pop()
+        if (self._count > 0):
+            position = (self._start + self._count - 1) % self._max_size
+            value = self._ring[position]
+            self._ring[position] = None
+            self._count -= 1
+            return value
         else:
             return None
 
     def peek(self, index):
-        return self._stack[index]
+        #same indexing as the list from asList: 0 is the oldest, -1 the newest
+        if index < 0:
+            index += self._count
+        if index < 0 or index >= self._count:
+            raise IndexError('LeakyLIFO index out of range')
+        return self._ring[(self._start + index) % self._max_size]
 
     def asList(self):
-        return self._stack
+        return [self._ring[(self._start + i) % self._max_size] for i in range(self._count)]
 
     def size(self):
-        return len(self._stack)
+        return self._count
+
+    def clear(self):
+        self._ring = [None] * max(self._max_size, 0)
+        self._start = 0
+        self._count = 0
+
+
+class IndexedLeakyLIFO(LeakyLIFO):
+    #Leaky LIFO queue with constant time membership checks, for large
+    #max_size.  Alongside the ring buffer it keeps a dict counting how many
+    #times each value is in the queue.  Values must be hashable, or a key
+    #function can be given to index on (i.e. key=lambda x: x['href']).
+
+    #the ring buffer and the index are updated together under a lock, so one
+    #queue can be shared between threads (i.e. concurrent crawl walkers
+    #sharing a cache's collision history)
+
+    def __init__(self, max_size=0, key=None):
+        self._key = key
+        self._lock = threading.Lock()
+        super(IndexedLeakyLIFO, self).__init__(max_size)
+
+    def push(self, value):
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            if self._count >= self._max_size:
+                self._unindex(self._ring[self._start])
+            super(IndexedLeakyLIFO, self).push(value)
+            self._index_value(value)
+
+    def pop(self):
+        with self._lock:
+            if (self._count > 0):
+                value = super(IndexedLeakyLIFO, self).pop()
+                self._unindex(value)
+                return value
+            else:
+                return None
+
+    def contains(self, key):
+        #True if a value with this key (the value itself, if there is no key
+        #function) is in the queue
+        with self._lock:
+            return key in self._index
+
+    def asList(self):
+        with self._lock:
+            return super(IndexedLeakyLIFO, self).asList()
+
+    def clear(self):
+        with self._lock:
+            super(IndexedLeakyLIFO, self).clear()
+            self._index = {}
+
+    def _index_value(self, value):
+        key = value if self._key is None else self._key(value)
+        self._index[key] = self._index.get(key, 0) + 1
+
+    def _unindex(self, value):
+        key = value if self._key is None else self._key(value)
+        if self._index[key] > 1:
+            self._index[key] -= 1
+        else:
+            del self._index[key]
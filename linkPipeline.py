@@ -0,0 +1,171 @@
+'''
+Link extraction for ChainCrawler and ChainSearch, as a pipeline of lazy
+generator stages.  Each stage takes an iterable and yields as it goes, so
+links flow through one at a time and no stage builds its own copy of the
+link list:
+
+    (key, link) pairs          link_pairs, or halStream.iter_hal_links
+    -> CURIES expanded         expand_curies
+    -> keywords filtered out   filter_keywords
+    -> flattened link records  flatten_links
+    -> crawl history removed   filter_history
+    -> cache state annotated   annotate_cache
+
+Link records are new dicts: the link's own fields plus 'type' (its link
+relation, or for an 'items' entry the type of the resource listing it) and
+'from_item_list', so the downloaded resource isn't modified.
+'''
+
+from halCuries import curie_expander
+from globalConfig import log
+import re
+
+
+def link_pairs(req_links):
+    '''(key, link) pairs of a decoded '_links' dict, with each entry of an
+    'items' collection on its own as ('items', entry)'''
+
+    for key, item in req_links.iteritems():
+        if key == 'items':
+            for items_item in item:
+                yield key, items_item
+        else:
+            yield key, item
+
+
+
+def expand_curies(pairs):
+    '''apply the CURIES of a stream of (key, link) pairs to the keys of the
+    others, the same way ChainSearch.apply_hal_curies does, and drop the
+    'curies' pair itself.  Pairs that come before the 'curies' pair are held
+    back until it arrives; as with apply_hal_curies, a resource without
+    CURIES has no links at all.'''
+
+    held = []
+    templates = None
+    expand_key = curie_expander.expand_key
+
+    for key, item in pairs:
+
+        if key == 'curies':
+            templates = curie_expander.compile(item)
+            for held_key, held_item in held:
+                yield expand_key(templates, held_key), held_item
+            held = None
+
+        elif templates is None:
+            held.append((key, item))
+
+        else:
+            yield expand_key(templates, key), item
+
+    if templates is None:
+        log.warn( "CURIES: No CURIES found" )
+
+
+
+_keyword_matchers = {}
+
+
+def keyword_matcher(keywords):
+    '''compiled regex matching a (lowercase) link relation that contains any
+    of keywords, or None for no keywords.  Compiled once per keyword list.'''
+
+    keywords = tuple(keywords)
+
+    try:
+        return _keyword_matchers[keywords]
+    except KeyError:
+        if len(keywords):
+            matcher = re.compile('|'.join(re.escape(x) for x in keywords))
+        else:
+            matcher = None
+        _keyword_matchers[keywords] = matcher
+        return matcher
+
+
+def filter_keywords(pairs, keywords):
+    '''drop (key, link) pairs whose key contains any of keywords (ignoring the
+    case of the key).  'items' entries are always kept.'''
+
+    matcher = keyword_matcher(keywords)
+
+    if matcher is None:
+        for pair in pairs:
+            yield pair
+        return
+
+    search = matcher.search
+
+    for key, item in pairs:
+        if key == 'items' or search(key.lower()) is None:
+            yield key, item
+
+
+
+def flatten_links(pairs, current_uri_type):
+    '''turn (key, link) pairs into link records.  'items' entries are listed
+    by a resource of current_uri_type, and inherit that as their type; their
+    type is likely plural even though they are singular, and there is no
+    generalizable way to go from a plural resource name to a singular one,
+    so 'from_item_list' tells queries to accept the plural type for them.'''
+
+    for key, item in pairs:
+
+        if item is None:
+            log.warn(' EXTRACT_LINK: nonetype link detected in' + \
+                    ' resource %s', key)
+            continue
+
+        try:
+            link = dict(item)
+        except (TypeError, ValueError):
+            log.error('EXTRACT_LINK: link %s is not an object, ignoring', key)
+            continue
+
+        if key == 'items':
+            #inherit 'type' from previous crawl step
+            link['type'] = current_uri_type
+            link['from_item_list'] = True
+        else:
+            link['type'] = key
+            link['from_item_list'] = False
+
+        yield link
+
+
+
+def filter_history(links, history):
+    '''drop links whose href is in history (an IndexedLeakyLIFO keyed on href)'''
+
+    contains = history.contains
+
+    for link in links:
+        if not contains(link['href']):
+            yield link
+
+
+
+def annotate_cache(links, cache, batch_size=64):
+    '''set 'in_cache' on each link, checking the cache batch_size links at a
+    time (so hashing and lookups stay batched without waiting for them all)'''
+
+    batch = []
+
+    for link in links:
+        batch.append(link)
+        if len(batch) >= batch_size:
+            for cached_link in _annotate_batch(batch, cache):
+                yield cached_link
+            batch = []
+
+    for cached_link in _annotate_batch(batch, cache):
+        yield cached_link
+
+
+def _annotate_batch(batch, cache):
+
+    if len(batch):
+        for link, cached in zip(batch, cache.check_many([x['href'] for x in batch])):
+            link['in_cache'] = cached
+            yield link
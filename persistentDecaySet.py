@@ -0,0 +1,134 @@
+from globalConfig import log
+import sqlite3
+import threading
+import time
+
+
+class PersistentTimeDecaySet(object):
+    '''TimeDecaySet kept in a sqlite file, so the set of found resources
+    survives restarts and can be shared by several crawler processes pointed
+    at the same file.  Same interface as TimeDecaySet; values are expected to
+    be URI strings.
+
+    The file is opened in WAL mode, so readers never wait on a writer.  New
+    values are written in batches: add() records them in memory (where they
+    already count as in the set for this process) and they are written out
+    together once batch_size have piled up or flush_interval seconds have
+    passed, or on flush()/close().  Another process can therefore report the
+    same value in that short window before the batch is written.
+
+    Timestamps are wall clock (time.time), since they have to mean the same
+    thing to every process and across restarts.  Expired rows are deleted on
+    each batch write, using an index on the timestamp.
+
+    Several sets can share one file, each in its own table.
+
+    set minute_decay = 0 for infinite persistence'''
+
+
+    def __init__(self, path='chain_found_resources.sqlite', minute_decay=1, \
+            batch_size=100, flush_interval=5, table='found'):
+
+        self._table = '"%s"' % table.replace('"', '""')
+        self._minute_decay = minute_decay
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+
+        self._pending = {}
+        self._last_flush = time.time()
+        self._lock = threading.RLock()
+
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS %s (value TEXT PRIMARY KEY, ' \
+                'timestamp REAL)' % self._table)
+        self._db.execute('CREATE INDEX IF NOT EXISTS "%s_timestamp" ON %s (timestamp)' % \
+                (self._table[1:-1], self._table))
+        self._db.commit()
+
+        log.info( 'FOUND SET: using %s, table %s', path, table )
+
+
+    def oldest_allowed(self):
+        #timestamp values must be newer than to still be in the set
+        if (self._minute_decay > 0):
+            return time.time() - self._minute_decay * 60
+        else:
+            return 0
+
+
+    def add(self, value):
+        #only add if not in set
+        with self._lock:
+            if self.in_set(value):
+                return False
+
+            self._pending[value] = time.time()
+
+            if (len(self._pending) >= self._batch_size or \
+                    time.time() - self._last_flush >= self._flush_interval):
+                self.flush()
+
+            return True
+
+
+    def in_set(self, value):
+        with self._lock:
+            if value in self._pending:
+                return True
+
+            row = self._db.execute('SELECT 1 FROM %s WHERE value = ? AND timestamp >= ?' % \
+                    self._table, (value, self.oldest_allowed())).fetchone()
+
+            return row is not None
+
+
+    def remove_from_set(self, value):
+        with self._lock:
+            self._pending.pop(value, None)
+            with self._db:
+                self._db.execute('DELETE FROM %s WHERE value = ?' % self._table, (value,))
+
+
+    def remove_timed_out_values(self):
+        #remove all expired values from the file
+        if (self._minute_decay > 0):
+            with self._lock:
+                with self._db:
+                    self._db.execute('DELETE FROM %s WHERE timestamp < ?' % self._table, \
+                            (self.oldest_allowed(),))
+
+
+    def flush(self):
+        #write pending values out in one transaction, and drop expired ones
+        with self._lock:
+            if self._pending:
+                with self._db:
+                    self._db.executemany('INSERT OR REPLACE INTO %s VALUES (?, ?)' % self._table, \
+                            self._pending.iteritems())
+                log.debug( 'FOUND SET: wrote %s values', len(self._pending) )
+                self._pending = {}
+
+            self.remove_timed_out_values()
+            self._last_flush = time.time()
+
+
+    def asList(self):
+        with self._lock:
+            self.flush()
+            return [row[0] for row in self._db.execute('SELECT value FROM %s ' \
+                    'WHERE timestamp >= ? ORDER BY timestamp' % self._table, \
+                    (self.oldest_allowed(),))]
+
+
+    def size(self):
+        with self._lock:
+            self.flush()
+            return self._db.execute('SELECT COUNT(*) FROM %s WHERE timestamp >= ?' % \
+                    self._table, (self.oldest_allowed(),)).fetchone()[0]
+
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._db.close()
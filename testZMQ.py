@@ -1,18 +1,35 @@
+'''
+prints what a crawler sends on its ZMQ output (see zmqOutput).
+
+    python testZMQ.py                  PULL from a pattern='push' crawler
+    python testZMQ.py pub [topic ...]  SUBscribe to a pattern='pub' crawler,
+                                       to every topic if none are given
+
+Messages are multipart, so every frame of each message is printed: with pub
+the topic comes first, then the URIs (each followed by its resource frame
+with emit_resources, or preceded by a label frame for push subscriptions).
+'''
+
+import sys
 import zmq
 
+pattern = sys.argv[1] if len(sys.argv) > 1 else 'push'
+topics = sys.argv[2:]
+
 context = zmq.Context()
-testReceive = context.socket(zmq.PULL)
-testReceive.connect("tcp://127.0.0.1:5557")
+
+if pattern == 'pub':
+    testReceive = context.socket(zmq.SUB)
+    testReceive.connect("tcp://127.0.0.1:5557")
+    for topic in topics or ['']:
+        testReceive.setsockopt(zmq.SUBSCRIBE, topic)
+else:
+    testReceive = context.socket(zmq.PULL)
+    testReceive.connect("tcp://127.0.0.1:5557")
 
 while True:
-    uri = testReceive.recv_string()
-    print "+++++++++++++++++++++++++"
-    print "+++++++++++++++++++++++++"
-    print "+++++++++++++++++++++++++"
-    print "+++++++++++++++++++++++++"
-    print uri
-    print "+++++++++++++++++++++++++"
-    print "+++++++++++++++++++++++++"
-    print "+++++++++++++++++++++++++"
+    frames = testReceive.recv_multipart()
     print "+++++++++++++++++++++++++"
+    for frame in frames:
+        print frame
     print "+++++++++++++++++++++++++"
@@ -0,0 +1,216 @@
+'''
+Local stand-in for a ChainAPI server, for tests: a HAL/JSON graph of
+sites -> devices -> sensors, served from a thread.
+
+    /                       ch:sites
+    /sites/                 items: each site, createForm
+    /sites/<s>              ch:devices
+    /devices/?site=<s>      items: the site's devices, createForm
+    /devices/<d>            ch:sensors
+    /sensors/?device=<d>    items: the device's sensors, createForm
+    /sensors/<k>            ch:device, back up to its device
+
+Resources are titled site<s>/device<d>/sensor<k>, and odd numbered sensors
+have sensor_type 'O3' (the others 'NO2').  Link relations are given with
+the 'ch' CURIE, for the namespace <base>/rels/.
+'''
+
+import BaseHTTPServer
+import SocketServer
+import json
+import re
+import socket
+import threading
+
+
+def free_port():
+    '''a TCP port nothing is listening on right now'''
+
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+
+class HalGraph(object):
+    '''the resources of the stand-in server, by path'''
+
+
+    def __init__(self, base, sites=3, devices_per_site=4, sensors_per_device=3):
+        self.base = base
+        self.namespace = base + '/rels/'
+        self.sites = sites
+        self.devices_per_site = devices_per_site
+        self.sensors_per_device = sensors_per_device
+        self.curies = [{'name':'ch', 'href':base + '/rels/{rel}', 'templated':True}]
+
+
+    def links(self, path, **links):
+        links['self'] = {'href':self.base + path}
+        links['curies'] = self.curies
+        return links
+
+
+    def items(self, path, collection, ids):
+        return {'_links':self.links(path, items=[{'href':self.uri(collection, x), \
+                'title':'%s%d' % (collection[:-1], x)} for x in ids], \
+                createForm={'href':'%s/%s/create' % (self.base, collection), \
+                'title':'Create %s' % collection[:-1]})}
+
+
+    def uri(self, collection, number):
+        return '%s/%s/%d' % (self.base, collection, number)
+
+
+    def resource(self, path):
+
+        if path == '/':
+            return {'_links':self.links(path, **{'ch:sites':{'href':self.base + '/sites/', \
+                    'title':'Sites'}})}
+
+        if path == '/sites/':
+            return self.items(path, 'sites', range(self.sites))
+
+        match = re.match(r'^/sites/(\d+)$', path)
+        if match:
+            site = int(match.group(1))
+            return {'name':'site%d' % site, '_links':self.links(path, \
+                    **{'ch:devices':{'href':'%s/devices/?site=%d' % (self.base, site), \
+                    'title':'Devices'}})}
+
+        match = re.match(r'^/devices/\?site=(\d+)$', path)
+        if match:
+            site = int(match.group(1))
+            return self.items(path, 'devices', range(site * self.devices_per_site, \
+                    (site + 1) * self.devices_per_site))
+
+        match = re.match(r'^/devices/(\d+)$', path)
+        if match:
+            device = int(match.group(1))
+            return {'name':'device%d' % device, '_links':self.links(path, \
+                    **{'ch:sensors':{'href':'%s/sensors/?device=%d' % (self.base, device), \
+                    'title':'Sensors'}})}
+
+        match = re.match(r'^/sensors/\?device=(\d+)$', path)
+        if match:
+            device = int(match.group(1))
+            return self.items(path, 'sensors', range(device * self.sensors_per_device, \
+                    (device + 1) * self.sensors_per_device))
+
+        match = re.match(r'^/sensors/(\d+)$', path)
+        if match:
+            sensor = int(match.group(1))
+            return {'name':'sensor%d' % sensor, 'sensor_type':'O3' if sensor % 2 else 'NO2', \
+                    '_links':self.links(path, **{'ch:device':{'href':self.uri('devices', \
+                    sensor // self.sensors_per_device), 'title':'device%d' % \
+                    (sensor // self.sensors_per_device)}})}
+
+        if path.endswith('/create'):
+            return {'_links':self.links(path)}
+
+        return None
+
+
+    def devices(self):
+        return set(self.uri('devices', x) for x in range(self.sites * self.devices_per_site))
+
+
+    def sensors(self):
+        return set(self.uri('sensors', x) for x in \
+                range(self.sites * self.devices_per_site * self.sensors_per_device))
+
+
+
+class HalHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    #write headers and body out together, not as separate small packets
+    wbufsize = -1
+
+
+    def do_GET(self):
+        self.server.count_request(self.path)
+        resource = self.server.graph.resource(self.path)
+
+        if resource is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            self.wfile.flush()
+            return
+
+        body = json.dumps(resource)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/hal+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+
+    def log_message(self, *args):
+        pass
+
+
+
+class HalServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''the stand-in server, on a free port of 127.0.0.1.  graph_kwargs size
+    the graph (see HalGraph).  requests counts GETs by path.'''
+
+    daemon_threads = True
+
+
+    def __init__(self, **graph_kwargs):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), HalHandler)
+
+        self.base = 'http://127.0.0.1:%d' % self.server_address[1]
+        self.graph = HalGraph(self.base, **graph_kwargs)
+        self.requests = {}
+        self._requests_lock = threading.Lock()
+        self._thread = None
+        #open (kept alive) connections, closed by stop so their threads end
+        self._connections = set()
+
+
+    def process_request(self, request, client_address):
+        with self._requests_lock:
+            self._connections.add(request)
+        SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+
+    def shutdown_request(self, request):
+        with self._requests_lock:
+            self._connections.discard(request)
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+
+    def handle_error(self, request, client_address):
+        #connections closed under a handler by stop are expected
+        pass
+
+
+    def count_request(self, path):
+        with self._requests_lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+        with self._requests_lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
@@ -0,0 +1,211 @@
+'''
+BloomTimeDecaySet, on a fake clock.
+
+    python -m unittest discover tests
+'''
+
+import logging
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from globalConfig import log
+import bloomDecaySet
+from bloomDecaySet import BloomTimeDecaySet
+
+log.setLevel(logging.WARN)
+
+
+
+class FakeClock(object):
+
+
+    def __init__(self):
+        self.now = 1000.0
+
+
+    def __call__(self):
+        return self.now
+
+
+
+class BloomTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+        self.clock = FakeClock()
+        clock = bloomDecaySet.clock
+        bloomDecaySet.clock = self.clock
+        self.addCleanup(setattr, bloomDecaySet, 'clock', clock)
+
+
+    def uris(self, count, prefix='http://example.com/sensors/'):
+        return ['%s%d' % (prefix, x) for x in range(count)]
+
+
+
+class TestSliceRotation(BloomTestCase):
+
+
+    def test_remembered_for_the_window_plus_at_most_one_span(self):
+        #1 minute in 4 slices: 15 s spans, 5 filters
+        found = BloomTimeDecaySet(minute_decay=1, capacity=1000, slices=4)
+        self.assertTrue(found.add('a'))
+
+        self.clock.now += 10
+        self.assertTrue(found.add('b'))
+
+        #'a' and 'b' are in the same span, so they expire together, after
+        #the whole window has passed for both
+        self.clock.now += 64.9
+        self.assertTrue(found.in_set('a'))
+        self.assertTrue(found.in_set('b'))
+        self.assertFalse(found.add('a'))
+
+        self.clock.now += 0.1
+        self.assertFalse(found.in_set('a'))
+        self.assertFalse(found.in_set('b'))
+        self.assertTrue(found.add('a'))
+
+
+    def test_rotation_wipes_one_filter_per_span(self):
+        found = BloomTimeDecaySet(minute_decay=1, capacity=1000, slices=4)
+
+        #one value per span
+        for value in 'abcde':
+            found.add(value)
+            self.clock.now += 15
+
+        #'a' has timed out, the others are still in
+        self.assertEqual([found.in_set(x) for x in 'abcde'], [False] + [True] * 4)
+        self.assertEqual(found.size(), 4)
+
+        self.clock.now += 30
+        self.assertEqual([found.in_set(x) for x in 'abcde'], [False] * 3 + [True] * 2)
+        self.assertEqual(found.size(), 2)
+
+
+    def test_gap_longer_than_the_window(self):
+        found = BloomTimeDecaySet(minute_decay=1, capacity=1000, slices=4)
+        for uri in self.uris(100):
+            found.add(uri)
+
+        self.clock.now += 3600
+        self.assertEqual(found.size(), 0)
+        self.assertFalse(any(found.in_set(x) for x in self.uris(100)))
+        self.assertEqual(found.asList(), [])
+
+        #and the filters still work afterwards
+        self.assertTrue(found.add('a'))
+        self.assertTrue(found.in_set('a'))
+
+
+    def test_infinite_persistence(self):
+        found = BloomTimeDecaySet(minute_decay=0, capacity=1000)
+        found.add('a')
+
+        self.clock.now += 10 ** 7
+        self.assertTrue(found.in_set('a'))
+        self.assertEqual(found.asList(), ['a'])
+
+
+    def test_as_list_keeps_the_window(self):
+        found = BloomTimeDecaySet(minute_decay=1, capacity=1000, slices=4, recent=3)
+        found.add('a')
+        self.clock.now += 30
+        for value in 'bcd':
+            found.add(value)
+
+        #only the 3 most recent are listed
+        self.assertEqual(found.asList(), ['b', 'c', 'd'])
+
+        self.clock.now += 31
+        self.assertEqual(found.asList(), ['b', 'c', 'd'])
+
+        self.clock.now += 30
+        self.assertEqual(found.asList(), [])
+
+
+    def test_remove_from_set(self):
+        found = BloomTimeDecaySet(capacity=1000)
+        found.add('a')
+
+        self.assertRaises(TypeError, found.remove_from_set, 'a')
+        self.assertTrue(found.in_set('a'))
+
+
+
+class TestFalsePositives(BloomTestCase):
+
+
+    def false_positive_rate(self, found, count=20000):
+        '''share of count values never added that add() takes as found'''
+
+        fresh = self.uris(count, 'http://example.com/unseen/')
+        return sum(1 for x in fresh if found.in_set(x)) / float(count)
+
+
+    def test_no_false_negatives(self):
+        found = BloomTimeDecaySet(minute_decay=1, capacity=5000, error_rate=0.01)
+        uris = self.uris(5000)
+        for uri in uris:
+            found.add(uri)
+
+        self.assertTrue(all(found.in_set(x) for x in uris))
+
+
+    def test_one_span_at_capacity(self):
+        #capacity is per window, so a span's share is capacity / slices
+        found = BloomTimeDecaySet(minute_decay=1, capacity=5000, error_rate=0.01, slices=4)
+        added = sum(1 for x in self.uris(1250) if found.add(x))
+
+        #every filter shares the error budget, so one full filter stays well
+        #under it
+        self.assertTrue(added >= 1250 * (1 - 0.01 / 5))
+        self.assertTrue(self.false_positive_rate(found) <= 0.01 / 2)
+
+
+    def test_window_at_capacity(self):
+        #capacity values spread evenly over the window, so every filter but
+        #the one filling holds a full span's share
+        found = BloomTimeDecaySet(minute_decay=1, capacity=5000, error_rate=0.01, slices=4)
+        uris = self.uris(5000)
+
+        for i in range(4):
+            for uri in uris[i * 1250:(i + 1) * 1250]:
+                found.add(uri)
+            self.clock.now += 15
+
+        self.assertTrue(all(found.in_set(x) for x in uris))
+        self.assertTrue(self.false_positive_rate(found) <= 0.01)
+
+
+    def test_every_filter_full(self):
+        #the worst case within capacity: the span being filled is full too,
+        #just before the oldest filter is wiped.  The rate is then right at
+        #error_rate, allow for sampling noise
+        found = BloomTimeDecaySet(minute_decay=1, capacity=5000, error_rate=0.01, slices=4)
+        uris = self.uris(6250)
+
+        for i in range(5):
+            for uri in uris[i * 1250:(i + 1) * 1250]:
+                found.add(uri)
+            if i < 4:
+                self.clock.now += 15
+
+        self.assertTrue(self.false_positive_rate(found) <= 0.01 * 1.25)
+
+
+    def test_over_capacity_raises_error_rate(self):
+        found = BloomTimeDecaySet(minute_decay=1, capacity=1000, error_rate=0.01)
+        for uri in self.uris(10000):
+            found.add(uri)
+
+        self.assertTrue(self.false_positive_rate(found) > 0.01)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,405 @@
+'''
+ChainCrawler against the local stand-in HAL server (see halStandIn).
+
+    python -m unittest discover tests
+'''
+
+import logging
+import os
+import Queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zmq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from globalConfig import log
+from chainCrawler import ChainCrawler
+from chainFetcher import ChainFetcher
+from halStandIn import HalServer, free_port
+from persistentDecaySet import PersistentTimeDecaySet
+from bloomDecaySet import BloomTimeDecaySet
+from timeDecaySet import TimeDecaySet
+from zmqOutput import ZmqOutput
+
+log.setLevel(logging.WARN)
+
+
+def drain(q):
+    found = []
+    while not q.empty():
+        found.append(q.get())
+    return found
+
+
+def interrupt_when(condition, calls=5000):
+    '''patch ChainCrawler.crawl_node to raise KeyboardInterrupt (like ^C) once
+    condition is true, or after calls crawl_node calls.  Returns the undo.'''
+
+    crawl_node = ChainCrawler.crawl_node
+    count = []
+
+    def interrupted_crawl_node(crawler):
+        count.append(1)
+        if condition() or len(count) > calls:
+            raise KeyboardInterrupt()
+        return crawl_node(crawler)
+
+    ChainCrawler.crawl_node = interrupted_crawl_node
+
+    def undo():
+        ChainCrawler.crawl_node = crawl_node
+
+    return undo
+
+
+def wait_for(condition, timeout=20):
+    '''poll condition until it's true or timeout s have passed'''
+
+    end = time.time() + timeout
+    while time.time() < end:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+
+class TestConcurrentCrawl(unittest.TestCase):
+
+
+    def setUp(self):
+        self.server = HalServer(sites=3, devices_per_site=4, sensors_per_device=6).start()
+        self.errors = []
+
+
+    def tearDown(self):
+        self.server.stop()
+
+
+    def test_walkers_share_cache(self):
+        #a cache smaller than the graph collides all the time, so walkers keep
+        #updating its collision history at once
+        #no retries, so walkers give up on the stopped server quickly
+        crawler = ChainCrawler(self.server.base + '/', crawl_delay=0, cache_table_mask_length=6, \
+                fetcher=ChainFetcher(retries=0))
+        q = Queue.Queue()
+        crawler.q = q
+
+        def crawl():
+            try:
+                crawler.crawl_concurrent(walkers=8, namespace=self.server.graph.namespace, \
+                        resource_type='sensor')
+            except Exception as e:
+                self.errors.append(e)
+
+        #switch threads as often as possible, to make races show up
+        check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        self.addCleanup(sys.setcheckinterval, check_interval)
+
+        thread = threading.Thread(target=crawl)
+        thread.daemon = True
+        thread.start()
+
+        sensors = self.server.graph.sensors()
+        self.assertTrue(wait_for(lambda: crawler.found_resources.size() == len(sensors)))
+
+        #walkers keep crawling (and colliding) after that; none of them should
+        #die on the shared cache
+        time.sleep(3)
+        self.assertTrue(thread.is_alive())
+
+        found = drain(q)
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), sensors)
+
+        #with the server gone (and our kept alive connections to it closed)
+        #every walker ends up back at the entry point, which is down, so
+        #they all stop
+        self.server.stop()
+        crawler.fetcher.close()
+        thread.join(30)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.errors, [])
+
+
+    def test_walker_error_stops_every_walker(self):
+        crawler = ChainCrawler(self.server.base + '/', crawl_delay=10)
+        crawler.q = Queue.Queue()
+
+        crawl_node = ChainCrawler.crawl_node
+        calls = []
+
+        def failing_crawl_node(walker):
+            calls.append(walker)
+            if len(calls) == 20:
+                raise RuntimeError('walker failed')
+            return crawl_node(walker)
+
+        ChainCrawler.crawl_node = failing_crawl_node
+        try:
+            thread = threading.Thread(target=crawler.crawl_concurrent, \
+                    kwargs={'walkers':4, 'namespace':self.server.graph.namespace, \
+                    'resource_type':'sensor'})
+            thread.daemon = True
+            thread.start()
+            thread.join(20)
+        finally:
+            ChainCrawler.crawl_node = crawl_node
+
+        self.assertFalse(thread.is_alive())
+
+
+
+class TestFoundSetRestart(unittest.TestCase):
+
+
+    def setUp(self):
+        self.server = HalServer(sites=3, devices_per_site=4, sensors_per_device=6).start()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'found.sqlite')
+
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+
+    def interrupted_crawl(self, condition):
+        '''crawl for sensors with a found set in self.path until condition(q)
+        holds, then ^C.  Returns every URI emitted.'''
+
+        crawler = ChainCrawler(self.server.base + '/', crawl_delay=0, found_set_path=self.path)
+        q = Queue.Queue()
+        crawler.q = q
+
+        undo = interrupt_when(lambda: condition(q))
+        try:
+            self.assertRaises(KeyboardInterrupt, crawler.crawl, \
+                    namespace=self.server.graph.namespace, resource_type='sensor')
+        finally:
+            undo()
+
+        return drain(q)
+
+
+    def test_restart_emits_nothing_twice(self):
+        sensors = self.server.graph.sensors()
+
+        #stopped well before a batch of the found set fills (or is due)
+        first = self.interrupted_crawl(lambda q: q.qsize() >= 10)
+        self.assertTrue(len(first) >= 10)
+
+        #a new crawler on the same file picks up where the first stopped
+        second = self.interrupted_crawl(lambda q: q.qsize() >= len(sensors) - len(first))
+
+        found = first + second
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), sensors)
+
+
+
+class TestSubscriptions(unittest.TestCase):
+
+
+    def setUp(self):
+        self.server = HalServer(sites=3, devices_per_site=4, sensors_per_device=6).start()
+        self.graph = self.server.graph
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+
+    def crawler(self, **kwargs):
+        return ChainCrawler(self.server.base + '/', crawl_delay=0, **kwargs)
+
+
+    def o3_sensors(self):
+        return set(x for x in self.graph.sensors() if int(x.rsplit('/', 1)[1]) % 2)
+
+
+    def crawl_until(self, crawler, condition):
+        '''crawl_subscriptions until condition() holds, then ^C'''
+
+        undo = interrupt_when(condition)
+        try:
+            self.assertRaises(KeyboardInterrupt, crawler.crawl_subscriptions)
+        finally:
+            undo()
+
+
+    def crawl_in_thread(self, crawler, done):
+        '''crawl_subscriptions in a thread until done is set'''
+
+        def crawl():
+            undo = interrupt_when(done.is_set)
+            try:
+                crawler.crawl_subscriptions()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                undo()
+
+        thread = threading.Thread(target=crawl)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+    def subscribe_devices_and_site(self, crawler):
+        crawler.subscribe('devices', namespace=self.graph.namespace, resource_type='device')
+        crawler.subscribe('site1', namespace=self.graph.namespace, resource_title='site1')
+
+
+    def test_found_sets_use_crawler_backend(self):
+        path = os.path.join(self.directory, 'found.sqlite')
+
+        for kwargs, kind in [({}, TimeDecaySet), ({'found_set_path':path}, \
+                PersistentTimeDecaySet), ({'found_set_capacity':1000}, BloomTimeDecaySet)]:
+            crawler = self.crawler(**kwargs)
+            crawler.subscribe('a', resource_type='sensor')
+            crawler.subscribe('b', resource_type='sensor')
+
+            a, b = crawler.subscriptions.subscriptions
+            self.assertTrue(isinstance(a.found_resources, kind))
+            self.assertTrue(a.found_resources is not b.found_resources)
+            self.assertTrue(a.found_resources is not crawler.found_resources)
+
+
+    def test_routing_to_queues(self):
+        crawler = self.crawler()
+        crawler.q = Queue.Queue()
+        sensors_q = Queue.Queue()
+        o3_q = Queue.Queue()
+
+        #two subscriptions on their own queues that match the same sensors
+        crawler.subscribe('sensors', sensors_q, namespace=self.graph.namespace, \
+                resource_type='sensor')
+        crawler.subscribe('o3', o3_q, namespace=self.graph.namespace, \
+                resource_type='sensor', resource_extra={'sensor_type':'O3'})
+        #and two on the crawler's queue
+        self.subscribe_devices_and_site(crawler)
+
+        sensors, o3 = self.graph.sensors(), self.o3_sensors()
+        self.crawl_until(crawler, lambda: sensors_q.qsize() >= len(sensors) and \
+                o3_q.qsize() >= len(o3) and crawler.q.qsize() >= len(self.graph.devices()) + 1)
+
+        found = drain(sensors_q)
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), sensors)
+
+        found = drain(o3_q)
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), o3)
+
+        found = drain(crawler.q)
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), set([('devices', x) for x in self.graph.devices()] + \
+                [('site1', self.graph.uri('sites', 1))]))
+
+
+    def receive_subscriptions(self, pattern, connect):
+        '''crawl for the devices and site1 subscriptions out on a ZmqOutput of
+        pattern, received on a socket connect makes.  Returns the messages.'''
+
+        address = 'tcp://127.0.0.1:%d' % free_port()
+        crawler = self.crawler()
+        crawler.zmq = ZmqOutput(address, pattern=pattern)
+        self.addCleanup(crawler.zmq.close, 0)
+        self.subscribe_devices_and_site(crawler)
+
+        receiver = connect(zmq.Context.instance(), address)
+        self.addCleanup(receiver.close, 0)
+        #let a SUB socket's subscriptions reach the publisher first
+        time.sleep(0.3)
+
+        done = threading.Event()
+        thread = self.crawl_in_thread(crawler, done)
+
+        messages = []
+        wanted = len(self.graph.devices()) + 1
+        while len(messages) < wanted and receiver.poll(10000):
+            messages.append(receiver.recv_multipart())
+
+        done.set()
+        thread.join(10)
+
+        return messages
+
+
+    def test_routing_pub_topic(self):
+
+        def connect(context, address):
+            receiver = context.socket(zmq.SUB)
+            receiver.connect(address)
+            receiver.setsockopt(zmq.SUBSCRIBE, 'devices')
+            receiver.setsockopt(zmq.SUBSCRIBE, 'site1')
+            return receiver
+
+        messages = self.receive_subscriptions('pub', connect)
+
+        #[topic, uri], with the subscription name as topic
+        self.assertEqual(sorted(messages), sorted([['devices', x] for x in \
+                self.graph.devices()] + [['site1', self.graph.uri('sites', 1)]]))
+
+
+    def test_routing_push_label(self):
+
+        def connect(context, address):
+            receiver = context.socket(zmq.PULL)
+            receiver.connect(address)
+            return receiver
+
+        messages = self.receive_subscriptions('push', connect)
+
+        #[label, uri], with the subscription name as label
+        self.assertEqual(sorted(messages), sorted([['devices', x] for x in \
+                self.graph.devices()] + [['site1', self.graph.uri('sites', 1)]]))
+
+
+    def test_persistent_sets_survive_restart(self):
+        path = os.path.join(self.directory, 'found.sqlite')
+        sensors, o3 = self.graph.sensors(), self.o3_sensors()
+        found = {'sensors':[], 'o3':[]}
+
+        #two subscriptions matching the same sensors, kept in the same file
+        #as the crawler's own set
+        def crawler():
+            crawler = self.crawler(found_set_path=path)
+            crawler.q = Queue.Queue()
+            crawler.subscribe('sensors', namespace=self.graph.namespace, \
+                    resource_type='sensor')
+            crawler.subscribe('o3', namespace=self.graph.namespace, \
+                    resource_type='sensor', resource_extra={'sensor_type':'O3'})
+            return crawler
+
+        def collect(crawler):
+            for name, uri in drain(crawler.q):
+                found[name].append(uri)
+
+        first = crawler()
+        self.crawl_until(first, lambda: first.q.qsize() >= 10)
+        collect(first)
+
+        second = crawler()
+        self.crawl_until(second, lambda: second.q.qsize() >= len(sensors) + len(o3) - \
+                len(found['sensors']) - len(found['o3']))
+        collect(second)
+
+        self.assertEqual(len(found['sensors']), len(set(found['sensors'])))
+        self.assertEqual(set(found['sensors']), sensors)
+        self.assertEqual(len(found['o3']), len(set(found['o3'])))
+        self.assertEqual(set(found['o3']), o3)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+'''
+ChainSearch against the local stand-in HAL server (see halStandIn).
+
+    python -m unittest discover tests
+'''
+
+import logging
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from globalConfig import log
+from chainSearch import ChainSearch
+from halStandIn import HalServer
+
+log.setLevel(logging.WARN)
+
+
+
+class SearchTestCase(unittest.TestCase):
+
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HalServer(sites=3, devices_per_site=4, sensors_per_device=3).start()
+        cls.graph = cls.server.graph
+        cls.ns = cls.graph.namespace
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+
+    def searcher(self, concurrency=1, **kwargs):
+        return ChainSearch(self.server.base + '/', crawl_delay=0, concurrency=concurrency, \
+                **kwargs)
+
+
+    def finds(self):
+        '''(find method, kwargs) of the finds every search mode should agree on'''
+
+        ns = self.ns
+
+        return [('find_first', dict(namespace=ns, resource_type='sensor', max_degrees=6)),
+                ('find_first', dict(namespace=ns, resource_title='device7', max_degrees=6)),
+                ('find_first', dict(namespace=ns, resource_title='nothing', max_degrees=6)),
+                ('find_first', dict(namespace=ns, resource_type='sensor', max_degrees=1)),
+                ('find_degrees_all', dict(namespace=ns, resource_type='device', degrees=4)),
+                ('find_degrees_all', dict(namespace=ns, resource_type='sensor', degrees=6)),
+                ('find_degrees_all', dict(namespace=ns, resource_type='site', degrees=0)),
+                ('find_create_link', dict(namespace=ns, resource_type='site', degrees=1)),
+                ('find_create_link', dict(namespace=ns, resource_type='device', degrees=3))]
+
+
+    def run_finds(self, searcher):
+        return [getattr(searcher, method)(**kwargs) for method, kwargs in self.finds()]
+
+
+    def batch_queries(self):
+        '''finds() as find_batch queries'''
+
+        queries = []
+        for method, kwargs in self.finds():
+            query = dict(kwargs)
+            query['find'] = method[len('find_'):]
+            queries.append(query)
+        return queries
+
+
+
+class TestParallelBfs(SearchTestCase):
+
+
+    def test_results(self):
+        results = self.run_finds(self.searcher())
+
+        #every match of the first resource with any: one device's sensors
+        self.assertEqual(len(results[0]), self.graph.sensors_per_device)
+        self.assertTrue(set(results[0]) <= self.graph.sensors())
+        self.assertEqual(results[1], [self.graph.uri('devices', 7)])
+        self.assertEqual(results[2], [])
+        self.assertEqual(results[3], [])
+        self.assertEqual(set(results[4]), self.graph.devices())
+        self.assertEqual(set(results[5]), self.graph.sensors())
+        self.assertEqual(results[6], [])
+        self.assertEqual(results[7], [self.server.base + '/sites/create'])
+        self.assertEqual(results[8], [self.server.base + '/devices/create'])
+
+
+    def test_parallel_matches_sequential(self):
+        sequential = self.run_finds(self.searcher())
+
+        for concurrency in (2, 8):
+            #same results, in the same (breadth first) order
+            self.assertEqual(self.run_finds(self.searcher(concurrency)), sequential)
+
+
+    def test_find_first_is_first_in_bfs_order(self):
+        #the first sensor listed by the first device listed by the first site
+        #listed, however the downloads of a level finish
+        sequential = self.searcher().find_first(namespace=self.ns, resource_type='sensor', \
+                max_degrees=6)
+
+        for i in range(5):
+            self.assertEqual(self.searcher(8).find_first(namespace=self.ns, \
+                    resource_type='sensor', max_degrees=6), sequential)
+
+
+    def test_find_first_stops_at_shallowest_level(self):
+        #devices are found at degree 4, so sensors (degree 6) are never fetched
+        self.server.requests.clear()
+        self.searcher(8).find_first(namespace=self.ns, resource_type='device', max_degrees=6)
+
+        self.assertFalse(any(x.startswith('/sensors/') for x in self.server.requests))
+
+
+
+class TestFindBatch(SearchTestCase):
+
+
+    def test_matches_separate_finds(self):
+        separate = self.run_finds(self.searcher())
+
+        for concurrency in (1, 8):
+            self.assertEqual(self.searcher(concurrency).find_batch(self.batch_queries()), \
+                    separate)
+
+
+    def test_each_query_alone(self):
+        searcher = self.searcher()
+
+        for query, (method, kwargs) in zip(self.batch_queries(), self.finds()):
+            self.assertEqual(searcher.find_batch([query]), \
+                    [getattr(searcher, method)(**kwargs)])
+
+
+    def test_downloads_each_resource_once(self):
+        self.server.requests.clear()
+        self.searcher().find_batch(self.batch_queries())
+        batch = dict(self.server.requests)
+
+        self.server.requests.clear()
+        self.run_finds(self.searcher())
+
+        self.assertEqual(max(batch.values()), 1)
+        self.assertTrue(sum(batch.values()) < sum(self.server.requests.values()))
+
+
+    def test_searcher_reusable(self):
+        #a batch leaves the searcher as it found it
+        searcher = self.searcher()
+        searcher.find_batch(self.batch_queries())
+
+        self.assertEqual(self.run_finds(searcher), self.run_finds(self.searcher()))
+
+
+    def test_no_queries(self):
+        self.assertEqual(self.searcher().find_batch([]), [])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,346 @@
+'''
+crawlerCache replacement policies.
+
+    python -m unittest discover tests
+'''
+
+import logging
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from globalConfig import log
+from crawlerCache import CrawlerCache, SetAssociativeCrawlerCache, EpochCrawlerCache, \
+        ResizingCrawlerCache
+
+log.setLevel(logging.CRITICAL)
+
+
+def uris_in_slot(mask, slot, count):
+    '''count URIs whose hash & mask is slot'''
+
+    uris = []
+    i = 0
+    while len(uris) < count:
+        uri = 'http://example.com/sensors/%d' % i
+        if CrawlerCache.hash_uri(uri) & mask == slot:
+            uris.append(uri)
+        i += 1
+    return uris
+
+
+
+class TestSetAssociativeCrawlerCache(unittest.TestCase):
+
+
+    def setUp(self):
+        #16 slots in 4 buckets of 4
+        self.cache = SetAssociativeCrawlerCache(4, ways=4)
+        self.bucket = uris_in_slot(self.cache._bucket_mask, 0, 6)
+
+
+    def test_bucket_holds_ways_values(self):
+        for uri in self.bucket[:4]:
+            self.assertFalse(self.cache.put_and_collision(uri))
+
+        #a direct mapped cache would only have kept the last one
+        self.assertEqual([self.cache.check(x) for x in self.bucket[:4]], [True] * 4)
+
+
+    def test_lru_eviction(self):
+        a, b, c, d, e, f = self.bucket
+        for uri in (a, b, c, d):
+            self.cache.put(uri)
+
+        #putting a again makes b the least recently put
+        self.cache.put(a)
+        self.assertTrue(self.cache.put_and_collision(e))
+        self.assertEqual([self.cache.check(x) for x in (a, b, c, d, e)], \
+                [True, False, True, True, True])
+
+        #then c
+        self.assertTrue(self.cache.put_and_collision(f))
+        self.assertFalse(self.cache.check(c))
+        self.assertEqual(self.cache.stats()['collisions'], 2)
+
+
+    def test_check_does_not_refresh(self):
+        a, b, c, d, e = self.bucket[:5]
+        for uri in (a, b, c, d):
+            self.cache.put(uri)
+
+        #only putting a value (visiting it) counts as using it
+        self.cache.check(a)
+        self.cache.put(e)
+        self.assertFalse(self.cache.check(a))
+        self.assertTrue(self.cache.check(b))
+
+
+    def test_put_without_overwrite(self):
+        a, b, c, d, e = self.bucket[:5]
+
+        for uri in (a, b, c, d):
+            self.assertTrue(self.cache.put(uri, overwrite=False))
+
+        #bucket full: nothing is evicted
+        self.assertFalse(self.cache.put(e, overwrite=False))
+        self.assertFalse(self.cache.check(e))
+        self.assertEqual([self.cache.check(x) for x in (a, b, c, d)], [True] * 4)
+        self.assertEqual(self.cache.stats()['collisions'], 0)
+
+        #a value already in the bucket is just moved to the front
+        self.assertTrue(self.cache.put(a, overwrite=False))
+        self.cache.put(e)
+        self.assertTrue(self.cache.check(a))
+        self.assertFalse(self.cache.check(b))
+
+
+    def test_buckets_are_independent(self):
+        other = uris_in_slot(self.cache._bucket_mask, 1, 4)
+        for uri in other + self.bucket:
+            self.cache.put(uri)
+
+        self.assertEqual([self.cache.check(x) for x in other], [True] * 4)
+
+
+    def test_batched_calls_match_single_calls(self):
+        uris = self.bucket + uris_in_slot(self.cache._bucket_mask, 2, 3)
+        single = SetAssociativeCrawlerCache(4, ways=4)
+
+        collisions = [single.put_and_collision(x) for x in uris]
+        self.assertEqual(self.cache.put_many(uris), collisions)
+        self.assertEqual(self.cache.check_many(uris), [single.check(x) for x in uris])
+        self.assertEqual(list(self.cache._cache), list(single._cache))
+
+
+    def test_ways(self):
+        self.assertRaises(ValueError, SetAssociativeCrawlerCache, 4, ways=3)
+        self.assertRaises(ValueError, SetAssociativeCrawlerCache, 2, ways=8)
+
+        #one way is direct mapped
+        cache = SetAssociativeCrawlerCache(4, ways=1)
+        a, b = uris_in_slot(15, 0, 2)
+        cache.put(a)
+        self.assertTrue(cache.put_and_collision(b))
+        self.assertFalse(cache.check(a))
+
+
+
+class TestEpochCrawlerCache(unittest.TestCase):
+
+
+    def setUp(self):
+        self.cache = EpochCrawlerCache(4)
+        #one URI per slot, so nothing here collides
+        self.uris = [uris_in_slot(15, x, 1)[0] for x in range(4)]
+
+
+    def test_clear(self):
+        for uri in self.uris:
+            self.cache.put(uri)
+        self.cache.clear()
+
+        self.assertEqual(self.cache.check_many(self.uris), [False] * 4)
+        self.assertEqual(self.cache.occupancy(), 0)
+        self.assertEqual(self.cache.stats()['clears'], 1)
+
+        #stale slots count as empty: no collisions, and overwrite=False works
+        self.assertFalse(self.cache.put_and_collision(self.uris[0]))
+        self.assertTrue(self.cache.put(uris_in_slot(15, 1, 2)[1], overwrite=False))
+        self.assertEqual(self.cache.stats()['collisions'], 0)
+
+
+    def test_age_out(self):
+        a, b, c, d = self.uris
+
+        self.cache.put(a)
+        self.cache.age_out(keep=2)
+        self.cache.put(b)
+        self.cache.age_out(keep=2)
+        self.cache.put(c)
+
+        #a was written 2 generations back, still kept
+        self.assertEqual(self.cache.check_many([a, b, c]), [True] * 3)
+
+        self.cache.age_out(keep=2)
+        self.cache.put(d)
+        self.assertEqual(self.cache.check_many([a, b, c, d]), [False, True, True, True])
+
+        #putting a value again moves it to the current generation
+        self.cache.put(b)
+        self.cache.age_out(keep=1)
+        self.assertEqual(self.cache.check_many([b, c, d]), [True, False, True])
+
+        self.assertEqual(self.cache.stats()['clears'], 4)
+
+
+    def test_age_out_zero_is_clear(self):
+        self.cache.put(self.uris[0])
+        self.cache.age_out(0)
+
+        self.assertFalse(self.cache.check(self.uris[0]))
+        self.assertEqual(self.cache.occupancy(), 0)
+
+
+    def test_generation_wraparound(self):
+        a, b, c = self.uris[:3]
+
+        #two generations before the tags run out
+        self.cache._generation = 2**32 - 3
+        self.cache._oldest_generation = self.cache._generation
+        self.cache.put(a)
+        self.cache.age_out(keep=2)
+        self.cache.put(b)
+        self.assertEqual(self.cache.check_many([a, b]), [True, True])
+
+        #wrapping really wipes the table and starts the tags over
+        self.cache.age_out(keep=2)
+        self.cache.age_out(keep=2)
+        self.assertTrue(self.cache._generation < 10)
+        self.assertEqual(list(self.cache._cache), [0] * 16)
+        self.assertEqual(self.cache.check_many([a, b]), [False, False])
+
+        #and the cache works as before afterwards
+        self.cache.put(c)
+        self.cache.age_out(keep=1)
+        self.assertTrue(self.cache.check(c))
+        self.cache.clear()
+        self.assertFalse(self.cache.check(c))
+        self.assertEqual(self.cache.stats()['clears'], 5)
+
+
+
+class TestResizingCrawlerCache(unittest.TestCase):
+
+
+    def cache(self, **kwargs):
+        #16 slots, collision rate checked every 16 puts
+        return ResizingCrawlerCache(4, window=16, collision_threshold=0.25, **kwargs)
+
+
+    def colliding(self, count):
+        '''count URIs in the same slot of a 16 slot table'''
+        return uris_in_slot(15, 0, count)
+
+
+    def test_grows_after_a_window_over_threshold(self):
+        cache = self.cache()
+        uris = self.colliding(16)
+
+        for uri in uris[:15]:
+            cache.put_and_collision(uri)
+        #collisions don't count until the window is over
+        self.assertEqual(cache.size(), 16)
+
+        cache.put_and_collision(uris[15])
+        self.assertEqual(cache.size(), 32)
+        self.assertEqual(cache._cache_table_mask_length, 5)
+
+
+    def test_no_growth_under_threshold(self):
+        cache = self.cache()
+        #4 collisions in 16 puts is at the threshold, not over
+        uris = self.colliding(5) + [uris_in_slot(15, x, 1)[0] for x in range(1, 12)]
+
+        for uri in uris:
+            cache.put_and_collision(uri)
+
+        self.assertEqual(cache.stats()['collisions'], 4)
+        self.assertEqual(cache.size(), 16)
+
+
+    def test_every_put_method_counts(self):
+        for put in ('put', 'put_and_collision', 'check_and_put'):
+            cache = self.cache()
+            for uri in self.colliding(16):
+                getattr(cache, put)(uri)
+            self.assertEqual(cache.size(), 32, put)
+
+        cache = self.cache()
+        cache.put_many(self.colliding(16))
+        self.assertEqual(cache.size(), 32)
+
+
+    def test_stops_at_max_mask_length(self):
+        cache = self.cache(max_mask_length=5)
+
+        for uri in uris_in_slot(31, 0, 64):
+            cache.put_and_collision(uri)
+
+        self.assertEqual(cache.size(), 32)
+
+
+    def test_entries_survive_rehash(self):
+        cache = self.cache()
+        #one URI in each slot, all stored
+        stored = [uris_in_slot(15, x, 1)[0] for x in range(16)]
+        for uri in stored:
+            cache.put(uri)
+
+        cache.grow()
+
+        self.assertEqual(cache.size(), 32)
+        self.assertEqual(cache.check_many(stored), [True] * 16)
+        self.assertEqual(cache.occupancy(), 16)
+        #each hash moved to its slot under the bigger mask
+        for uri in stored:
+            hashed = CrawlerCache.hash_uri(uri)
+            self.assertEqual(cache._cache[hashed & 31], hashed)
+
+
+    def test_collision_history_gets_its_slot_back(self):
+        cache = self.cache()
+        #same slot of 16, different slots of 32
+        first = uris_in_slot(31, 0, 1)[0]
+        second = uris_in_slot(31, 16, 1)[0]
+
+        cache.put_and_collision(first)
+        self.assertTrue(cache.put_and_collision(second))
+        self.assertEqual(cache.collision_history_as_list(), [CrawlerCache.hash_uri(first)])
+
+        cache.grow()
+        #so checks can only hit the table
+        cache._collision_history.clear()
+
+        #both are in the table itself now, not only in the history
+        self.assertEqual(cache.check_many([first, second]), [True, True])
+        self.assertEqual(cache.stats()['history_hits'], 0)
+
+
+    def test_reset_stats_restarts_the_window(self):
+        cache = self.cache()
+        uris = self.colliding(16)
+
+        #part of a window without collisions, then reset
+        for i in range(10):
+            cache.put_and_collision(uris_in_slot(15, 1, 1)[0])
+        cache.reset_stats()
+
+        #the next window is the next 16 puts, all colliding
+        for uri in uris[:15]:
+            cache.put_and_collision(uri)
+        self.assertEqual(cache.size(), 16)
+        cache.put_and_collision(uris[15])
+        self.assertEqual(cache.size(), 32)
+
+
+    def test_reset_stats_after_a_window(self):
+        cache = self.cache()
+
+        #more puts than a window without collisions: the window moved on
+        for i in range(40):
+            cache.put_and_collision(uris_in_slot(15, 1, 1)[0])
+        cache.reset_stats()
+
+        #before the fix the window still counted from 32 puts, so this
+        #window of collisions was never looked at
+        for uri in self.colliding(16):
+            cache.put_and_collision(uri)
+        self.assertEqual(cache.size(), 32)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
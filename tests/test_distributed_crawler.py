@@ -0,0 +1,88 @@
+'''
+Distributed crawl against the local stand-in HAL server (see halStandIn),
+crawled by several local worker processes.
+
+    python -m unittest discover tests
+'''
+
+import os
+import Queue
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from distributedCrawler import ChainCrawlCoordinator, partition
+from halStandIn import HalServer, free_port
+
+
+SITES = 3
+DEVICES_PER_SITE = 4
+#more sensors per partition than a default (256 slot) CrawlerCache holds
+SENSORS_PER_DEVICE = 60
+
+
+
+class TestDistributedCrawl(unittest.TestCase):
+
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HalServer(sites=SITES, devices_per_site=DEVICES_PER_SITE, \
+                sensors_per_device=SENSORS_PER_DEVICE).start()
+        cls.base = cls.server.base
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+
+    def crawl(self, workers, rounds, **query):
+        '''crawl the stand-in server with workers local workers, returns
+        (rounds crawled, every URI reported)'''
+
+        coordinator = ChainCrawlCoordinator(entry_point=self.base + '/', workers=workers, \
+                results_address='tcp://127.0.0.1:%d' % free_port(), \
+                control_address='tcp://127.0.0.1:%d' % free_port(), \
+                rounds=rounds, check_interval=0.2)
+        coordinator.start_local_workers(base_port=free_port(), crawl_delay=0, \
+                status_interval=0.1, batch_size=20, flush_interval=0.1)
+
+        q = Queue.Queue()
+        coordinator.q = q
+        rounds_done = coordinator.crawl(namespace=self.server.graph.namespace, **query)
+
+        found = []
+        while not q.empty():
+            found.append(q.get())
+
+        return rounds_done, found
+
+
+    def test_every_sensor_reported_once(self):
+        rounds_done, found = self.crawl(3, 2, resource_type='sensor')
+
+        self.assertEqual(rounds_done, 2)
+        #found sets persist across rounds, so the second round reports nothing new
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), self.server.graph.sensors())
+
+        #the partitions should all have done some of the work
+        owners = set(partition(x, 3) for x in found)
+        self.assertEqual(owners, set(range(3)))
+
+
+    def test_node_match(self):
+        rounds_done, found = self.crawl(4, 1, resource_type='sensor', \
+                resource_extra={'sensor_type':'O3'})
+
+        self.assertEqual(rounds_done, 1)
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), set(x for x in self.server.graph.sensors() \
+                if int(x.rsplit('/', 1)[1]) % 2))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
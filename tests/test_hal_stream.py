@@ -0,0 +1,184 @@
+'''
+halStream's incremental HAL/JSON parsing, fed the same text in chunks of
+every size.
+
+    python -m unittest discover tests
+'''
+
+from collections import OrderedDict
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from halStream import JsonStreamReader, iter_hal_links
+from linkPipeline import link_pairs
+
+
+def split(text, size):
+    '''text in chunks of size characters'''
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def decoded_pairs(text):
+    '''(key, link) pairs of text decoded the usual way, in document order'''
+
+    resource = json.loads(text, object_pairs_hook=OrderedDict)
+    if '_links' not in resource:
+        return []
+    return list(link_pairs(resource['_links']))
+
+
+CURIES = [{'name':'ch', 'href':'http://example.com/rels/{rel}', 'templated':True}]
+
+
+
+class HalStreamTestCase(unittest.TestCase):
+
+
+    def assertStreamsAsDecoded(self, text):
+        '''iter_hal_links gives the same pairs as decoding text, however it
+        is split into chunks'''
+
+        expected = decoded_pairs(text)
+
+        for size in range(1, len(text) + 1):
+            self.assertEqual(list(iter_hal_links(split(text, size))), expected, \
+                    'chunks of %d' % size)
+
+
+
+class TestIterHalLinks(HalStreamTestCase):
+
+
+    def test_links_and_items(self):
+        self.assertStreamsAsDecoded(json.dumps(OrderedDict([('name', 'device1'), \
+                ('_links', OrderedDict([('self', {'href':'http://example.com/devices/1'}), \
+                ('curies', CURIES), ('items', [{'href':'http://example.com/sensors/%d' % x, \
+                'title':'sensor%d' % x} for x in range(3)]), \
+                ('ch:site', {'href':'http://example.com/sites/1', 'title':'site1'})]))])))
+
+
+    def test_escapes_at_chunk_edges(self):
+        #every escape lands on a chunk edge for some chunk size
+        self.assertStreamsAsDecoded(json.dumps(OrderedDict([('note', 'a "quoted" \\ note'), \
+                ('_links', OrderedDict([('self', {'href':'http://example.com/a\\b', \
+                'title':'\\"'}), ('items', [{'href':'http://example.com/"x"', \
+                'title':'ends in a backslash \\'}, {'href':u'caf\u00e9\\', \
+                'title':'\\\\\\'}])]))])))
+
+
+    def test_nested_items(self):
+        #containers inside links (and braces/brackets inside strings) are
+        #read as part of the link
+        self.assertStreamsAsDecoded(json.dumps(OrderedDict([('_links', OrderedDict([ \
+                ('items', [{'href':'http://example.com/1', 'extra':{'tags':['a', {'b':[1, 2]}], \
+                'text':'} ] { ['}}, {'href':'http://example.com/2', 'nested':[[[]], {}]}]), \
+                ('ch:empty', {'href':'http://example.com/3', 'list':[]})]))])))
+
+
+    def test_links_after_large_fields(self):
+        #big values before '_links' are skipped, not decoded
+        data = ['%d.5' % x for x in range(2000)]
+        text = json.dumps(OrderedDict([('data', data), ('description', 'x' * 50000), \
+                ('nested', {'a':{'b':['"', '\\', '}']}}), ('count', 2000), ('ok', True), \
+                ('_links', OrderedDict([('self', {'href':'http://example.com/1'}), \
+                ('curies', CURIES)]))]))
+
+        expected = decoded_pairs(text)
+        for size in (1, 7, 100, 4096, 16384, len(text)):
+            self.assertEqual(list(iter_hal_links(split(text, size))), expected)
+
+
+    def test_stops_reading_after_links(self):
+        text = '{"_links": {"self": {"href": "http://example.com/1"}}, "data": [1, 2, 3]}'
+        read = []
+
+        def chunks():
+            for chunk in split(text, 5):
+                read.append(chunk)
+                yield chunk
+
+        self.assertEqual(list(iter_hal_links(chunks())), \
+                [('self', {'href':'http://example.com/1'})])
+        #the chunks after '_links' closed were never asked for
+        self.assertTrue(len(read) < len(split(text, 5)))
+
+
+    def test_empty_links(self):
+        self.assertStreamsAsDecoded('{"name": "a", "_links": {}, "data": [1]}')
+        self.assertStreamsAsDecoded('{"_links": {"items": []}}')
+        self.assertStreamsAsDecoded('{"_links" : { "items" : [ ] , "self" : {"href": "a"} } }')
+
+
+    def test_no_links(self):
+        self.assertStreamsAsDecoded('{}')
+        self.assertStreamsAsDecoded('{"name": "a", "data": [1, {"b": null}], "n": -1.5e3}')
+        #a '_links' that isn't an object is skipped like any other value
+        self.assertEqual(list(iter_hal_links(['{"_links": [1], "a": 1}'])), [])
+
+
+    def test_body_closed_early(self):
+        text = json.dumps(OrderedDict([('data', 'x' * 100), ('_links', OrderedDict([ \
+                ('self', {'href':'http://example.com/1'}), \
+                ('items', [{'href':'http://example.com/%d' % x} for x in range(5)])]))]))
+
+        for end in range(len(text) - 1):
+            for size in (1, 3, 16):
+                chunks = split(text[:end], size)
+                links = []
+                try:
+                    for link in iter_hal_links(chunks):
+                        links.append(link)
+                except ValueError:
+                    pass
+                else:
+                    self.fail('no error for a body closed after %d characters' % end)
+
+                #the links read before the body ended are all complete
+                self.assertEqual(links, decoded_pairs(text)[:len(links)])
+
+
+    def test_not_an_object(self):
+        self.assertRaises(ValueError, list, iter_hal_links(['[1, 2]']))
+        self.assertRaises(ValueError, list, iter_hal_links([]))
+
+
+
+class TestJsonStreamReader(HalStreamTestCase):
+
+
+    def test_read_values_across_chunks(self):
+        values = ['a "b" \\ c', 12.5, -3, True, False, None, {'a':[1, '}']}, [], '']
+        text = ' , '.join(json.dumps(x) for x in values)
+
+        for size in range(1, len(text) + 1):
+            reader = JsonStreamReader(split(text, size))
+            for i, value in enumerate(values):
+                if i:
+                    reader.expect(',')
+                self.assertEqual(reader.read_value(), value)
+            self.assertEqual(reader.peek(), '')
+
+
+    def test_skip_value_keeps_nothing(self):
+        text = '["' + 'x' * 10000 + '"] 1'
+        reader = JsonStreamReader(split(text, 100))
+        reader.skip_value()
+
+        #only what hasn't been read is buffered
+        self.assertTrue(len(reader._buf) - reader._pos <= 100)
+        self.assertEqual(reader.read_value(), 1)
+
+
+    def test_expect(self):
+        reader = JsonStreamReader(['  ', ' :', ''])
+        self.assertEqual(reader.expect(':,'), ':')
+        self.assertRaises(ValueError, reader.expect, ':')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
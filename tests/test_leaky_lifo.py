@@ -0,0 +1,152 @@
+'''
+LeakyLIFO and IndexedLeakyLIFO.
+
+    python -m unittest discover tests
+'''
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from leakyLIFO import LeakyLIFO, IndexedLeakyLIFO
+
+
+
+class TestLeakyLIFO(unittest.TestCase):
+
+
+    def test_push_past_max_size_drops_oldest(self):
+        lifo = LeakyLIFO(3)
+        for x in range(5):
+            lifo.push(x)
+
+        self.assertEqual(lifo.asList(), [2, 3, 4])
+        self.assertEqual(lifo.peek(0), 2)
+        self.assertEqual(lifo.peek(-1), 4)
+        self.assertEqual(lifo.pop(), 4)
+        self.assertEqual(lifo.asList(), [2, 3])
+
+
+    def test_pop_empty(self):
+        lifo = LeakyLIFO(2)
+        self.assertEqual(lifo.pop(), None)
+        self.assertRaises(IndexError, lifo.peek, 0)
+
+
+    def test_zero_size_holds_nothing(self):
+        lifo = IndexedLeakyLIFO(0)
+        lifo.push(1)
+
+        self.assertEqual(lifo.size(), 0)
+        self.assertFalse(lifo.contains(1))
+
+
+
+class TestIndexedLeakyLIFO(unittest.TestCase):
+
+
+    def test_evicting_one_duplicate_keeps_the_others(self):
+        lifo = IndexedLeakyLIFO(3)
+        for x in ['a', 'a', 'b']:
+            lifo.push(x)
+
+        #pushes the first 'a' out, one is still queued
+        lifo.push('c')
+        self.assertEqual(lifo.asList(), ['a', 'b', 'c'])
+        self.assertTrue(lifo.contains('a'))
+
+        #and the last one
+        lifo.push('d')
+        self.assertEqual(lifo.asList(), ['b', 'c', 'd'])
+        self.assertFalse(lifo.contains('a'))
+
+
+    def test_buffer_full_of_one_value(self):
+        lifo = IndexedLeakyLIFO(4)
+        for i in range(10):
+            lifo.push('a')
+
+        self.assertEqual(lifo._index, {'a':4})
+
+        for i in range(3):
+            lifo.push('b')
+        self.assertEqual(lifo._index, {'a':1, 'b':3})
+
+        lifo.push('b')
+        self.assertFalse(lifo.contains('a'))
+        self.assertEqual(lifo._index, {'b':4})
+
+
+    def test_pop_duplicate(self):
+        lifo = IndexedLeakyLIFO(4)
+        for x in ['a', 'b', 'a']:
+            lifo.push(x)
+
+        self.assertEqual(lifo.pop(), 'a')
+        self.assertTrue(lifo.contains('a'))
+        self.assertEqual(lifo.pop(), 'b')
+        self.assertEqual(lifo.pop(), 'a')
+        self.assertFalse(lifo.contains('a'))
+        self.assertEqual(lifo._index, {})
+
+
+    def test_key_function(self):
+        lifo = IndexedLeakyLIFO(2, key=lambda x: x['href'])
+        lifo.push({'href':'a', 'title':'first'})
+        lifo.push({'href':'a', 'title':'second'})
+        lifo.push({'href':'b'})
+
+        self.assertTrue(lifo.contains('a'))
+        lifo.push({'href':'c'})
+        self.assertFalse(lifo.contains('a'))
+
+
+    def test_clear(self):
+        lifo = IndexedLeakyLIFO(2)
+        lifo.push('a')
+        lifo.clear()
+
+        self.assertFalse(lifo.contains('a'))
+        self.assertEqual(lifo.asList(), [])
+
+
+    def test_threads_sharing_a_queue(self):
+        #small buffer full of duplicates, so pushes evict all the time
+        lifo = IndexedLeakyLIFO(8)
+        errors = []
+
+        check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        self.addCleanup(sys.setcheckinterval, check_interval)
+
+        def push(offset):
+            try:
+                for i in range(5000):
+                    lifo.push((i + offset) % 5)
+                    lifo.contains(i % 5)
+                    if i % 7 == 0:
+                        lifo.pop()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=push, args=(x,)) for x in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+        #the index still counts exactly what is in the buffer
+        counts = {}
+        for x in lifo.asList():
+            counts[x] = counts.get(x, 0) + 1
+        self.assertEqual(lifo._index, counts)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+'''
+ZmqOutput batching and overflow policies, over local TCP sockets.
+
+    python -m unittest discover tests
+'''
+
+import logging
+import os
+import sys
+import time
+import unittest
+import zmq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from globalConfig import log
+from halStandIn import free_port
+from zmqOutput import ZmqOutput, load_resource
+
+log.setLevel(logging.ERROR)
+
+
+
+class ZmqTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+        self.address = 'tcp://127.0.0.1:%d' % free_port()
+        self.context = zmq.Context.instance()
+
+
+    def output(self, **kwargs):
+        output = ZmqOutput(self.address, **kwargs)
+        self.addCleanup(output.close, 0)
+        return output
+
+
+    def receiver(self, socket_type=zmq.PULL, topics=()):
+        receiver = self.context.socket(socket_type)
+        receiver.connect(self.address)
+        for topic in topics:
+            receiver.setsockopt(zmq.SUBSCRIBE, topic)
+        self.addCleanup(receiver.close, 0)
+        return receiver
+
+
+    def receive(self, receiver, timeout=2000):
+        '''the next message, or None if nothing comes within timeout ms'''
+
+        if receiver.poll(timeout):
+            return receiver.recv_multipart()
+        return None
+
+
+    def uris(self, count):
+        return ['http://example.com/sensors/%d' % x for x in range(count)]
+
+
+    def wait_until_connected(self, output, receiver):
+        '''send a probe through, so the next sends don't race the connection'''
+
+        #a blocking send on a PUSH socket waits for a consumer
+        output.socket.send_multipart(['probe'])
+        self.assertEqual(self.receive(receiver), ['probe'])
+
+
+
+class TestBatching(ZmqTestCase):
+
+
+    def test_unbatched(self):
+        output = self.output()
+        receiver = self.receiver()
+
+        for uri in self.uris(3):
+            output.send(uri)
+
+        self.assertEqual([self.receive(receiver) for i in range(3)], \
+                [[x] for x in self.uris(3)])
+
+
+    def test_batch_by_size(self):
+        #no flush_interval, batches only go out when full (or on flush)
+        output = self.output(batch_size=3, flush_interval=0)
+        receiver = self.receiver()
+        uris = self.uris(7)
+
+        for uri in uris:
+            output.send(uri)
+
+        self.assertEqual(self.receive(receiver), uris[0:3])
+        self.assertEqual(self.receive(receiver), uris[3:6])
+        self.assertEqual(self.receive(receiver, 200), None)
+        self.assertEqual(output.stats()['waiting'], 1)
+
+        output.flush()
+        self.assertEqual(self.receive(receiver), uris[6:])
+        self.assertEqual(output.stats(), {'sent':7, 'dropped':0, 'waiting':0, 'buffered':0})
+
+
+    def test_batch_by_age(self):
+        output = self.output(batch_size=100, flush_interval=0.5)
+        receiver = self.receiver()
+        uris = self.uris(2)
+
+        start = time.time()
+        for uri in uris:
+            output.send(uri)
+
+        #held until the oldest has waited flush_interval, then sent together
+        self.assertEqual(self.receive(receiver, 200), None)
+        self.assertEqual(self.receive(receiver), uris)
+        self.assertTrue(time.time() - start >= 0.5)
+
+
+    def test_pub_batches_by_topic(self):
+        output = self.output(pattern='pub', batch_size=2, flush_interval=0)
+        receiver = self.receiver(zmq.SUB, ['a', 'b'])
+        #let the subscriptions reach the publisher
+        time.sleep(0.3)
+
+        output.send('1', 'a')
+        output.send('2', 'b')
+        output.send('3', 'a')
+        output.send('4', 'b')
+
+        self.assertEqual(self.receive(receiver), ['a', '1', '3'])
+        self.assertEqual(self.receive(receiver), ['b', '2', '4'])
+
+
+    def test_label_and_resource_frames(self):
+        output = self.output(batch_size=2, flush_interval=0, resources=True, compress=True)
+        receiver = self.receiver()
+
+        output.send('http://example.com/1', resource={'name':'a'}, label='sub1')
+        output.send('http://example.com/2', resource=None)
+
+        frames = self.receive(receiver)
+        self.assertEqual(frames[:2], ['sub1', 'http://example.com/1'])
+        self.assertEqual(load_resource(frames[2]), {'name':'a'})
+        self.assertEqual(frames[3], 'http://example.com/2')
+        self.assertEqual(load_resource(frames[4]), None)
+
+
+
+class TestOverflow(ZmqTestCase):
+
+
+    def test_drop(self):
+        #nobody connected, so a PUSH socket has no room for anything
+        output = self.output(batch_size=2, flush_interval=0, overflow='drop')
+
+        for uri in self.uris(5):
+            output.send(uri)
+
+        self.assertEqual(output.stats(), {'sent':0, 'dropped':4, 'waiting':1, 'buffered':0})
+
+        #once a consumer is there, new messages go out
+        receiver = self.receiver()
+        self.wait_until_connected(output, receiver)
+        output.flush()
+
+        self.assertEqual(self.receive(receiver), self.uris(5)[4:])
+        self.assertEqual(output.stats()['sent'], 1)
+
+
+    def test_buffer(self):
+        output = self.output(overflow='buffer', max_buffered=3)
+        uris = self.uris(5)
+
+        for uri in uris:
+            output.send(uri)
+
+        #the oldest are dropped once the backlog is full
+        self.assertEqual(output.stats(), {'sent':0, 'dropped':2, 'waiting':0, 'buffered':3})
+
+        receiver = self.receiver()
+        self.wait_until_connected(output, receiver)
+
+        #the backlog goes out first, in order, before anything new
+        output.send('new')
+        self.assertEqual([self.receive(receiver) for i in range(4)], \
+                [[x] for x in uris[2:]] + [['new']])
+        self.assertEqual(output.stats(), {'sent':4, 'dropped':2, 'waiting':0, 'buffered':0})
+
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, ZmqOutput, self.address, overflow='wait')
+        self.assertRaises(ValueError, ZmqOutput, self.address, pattern='req')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
-from datetime import datetime
+from collections import deque
 import time
 
+#monotonic clock where available (python 3), so expiry isn't thrown off by
+#changes to the system clock
+clock = getattr(time, 'monotonic', time.time)
+
 
 class TimeDecaySet(object):
     #a simple set that you initiate with a minutes value,
@@ -9,9 +13,16 @@ class TimeDecaySet(object):
 
     #set minute_decay = 0 for infinite persistence
 
+    #values are kept in a dict (for constant time membership) and in a queue
+    #in the order they were added (for expiry, which only ever has to look at
+    #the oldest values).  Each queue entry is a (timestamp, value) tuple, and
+    #the dict maps a value to its live entry; removed values are dropped from
+    #the dict right away and from the queue when they reach the front.
+
     def __init__(self, minute_decay=1):
         self._minute_decay = minute_decay
-        self._list = []
+        self._index = {}
+        self._queue = deque()
 
 
     def add(self, value):
@@ -19,45 +30,54 @@ class TimeDecaySet(object):
         if self.in_set(value):
             return False
         else:
-            #push value with unix timestamp
-            self._list.append({'val':value, \
-                    'timestamp':time.mktime(datetime.now().timetuple())})
+            #push value with timestamp
+            entry = (clock(), value)
+            self._queue.append(entry)
+            self._index[value] = entry
             return True
 
 
     def in_set(self, value):
         self.remove_timed_out_values()
-        if (value in (x['val'] for x in self._list)):
-            return True
-        else:
-            return False
+        return value in self._index
 
 
     def remove_from_set(self, value):
-        self._list = [x for x in self._list if not x['val']==value]
+        self._index.pop(value, None)
+
+        #drop the queue entries of removed values once they are the majority,
+        #so they can't pile up (i.e. with infinite persistence)
+        if (len(self._queue) > 2 * len(self._index) + 64):
+            index = self._index
+            self._queue = deque(entry for entry in self._queue if index.get(entry[1]) is entry)
 
 
     def remove_timed_out_values(self):
         #remove all expired values - internal function
 
-        #since they are appended chronologically, we can simply find
-        #the index where now-time>minutes and remove everything before that
-        index = 0
-        now = time.mktime(datetime.now().timetuple())
+        #only remove values if our minute_decay value has been set to a positive value
+        if (self._minute_decay <= 0):
+            return
 
-        while (index<len(self._list) and ((now - self._list[index]['timestamp'])/60 > self._minute_decay)):
-            index = index + 1
+        #since they are appended chronologically, we only pop from the front
+        #until we reach a value that is still young enough
+        oldest_allowed = clock() - self._minute_decay * 60
+        queue = self._queue
+        index = self._index
 
-        #only remove values if our minute_decay value has been set to a positive value
-        if (self._minute_decay > 0):
-            self._list = self._list[index:]
+        while (queue and queue[0][0] < oldest_allowed):
+            entry = queue.popleft()
+            #skip entries of values that were removed (or removed and re-added)
+            if index.get(entry[1]) is entry:
+                del index[entry[1]]
 
 
     def asList(self):
         self.remove_timed_out_values()
-        return [x['val'] for x in self._list]
+        index = self._index
+        return [entry[1] for entry in self._queue if index.get(entry[1]) is entry]
 
 
     def size(self):
         self.remove_timed_out_values()
-        return len(self._list)
+        return len(self._index)
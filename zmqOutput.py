@@ -0,0 +1,259 @@
+'''
+ZMQ output for crawlers: found resource URIs go out on a bound ZMQ socket,
+optionally in batches, without letting a slow consumer stall the crawl.
+
+pattern='push' (the default) load balances URIs over every connected PULL
+consumer (see testZMQ.py).  pattern='pub' publishes them with a topic, the
+resource type by default (i.e. 'http://learnair.media.mit.edu:8000/rels/sensor'),
+so a SUB consumer only gets the types it subscribes to (see testZMQ.py pub).
+ZMQ topics match on prefix, so subscribing to a type also gets its plural
+('.../rels/sensors').
+
+Messages are multipart.  With push, each message is just URI frames; with
+pub, the first frame is the topic and the rest are URIs of that topic.
+A URI can also carry a label frame just before it (with push, crawl
+subscriptions label each URI with its subscription's name).
+With batch_size=1 (the default) every URI is its own message, which is a
+plain string message with push, as before.  With batch_size > 1, URIs are
+held until batch_size of them (of one topic) are waiting, or the oldest has
+waited flush_interval seconds, and then go out as one message.
+
+hwm is the socket's send high water mark: how many messages ZMQ will queue
+for a consumer.  What happens when a consumer is that far behind depends on
+overflow:
+    'block'  - wait for the consumer to catch up, stalling the crawl (this is
+               what a plain PUSH socket does)
+    'drop'   - drop the message
+    'buffer' - keep the message locally and retry it before sending anything
+               else, keeping at most max_buffered messages (the oldest are
+               dropped past that)
+A PUB socket never waits; ZMQ itself drops messages to a subscriber that is
+hwm messages behind, whatever the overflow policy.
+
+With resources=True every URI frame is followed by a frame with the resource
+itself (see ChainCrawler's emit_resources), so consumers don't have to
+download it again: compact JSON, zlib compressed if compress=True.
+load_resource turns that frame back into the resource (None if the crawler
+couldn't download it).
+'''
+
+from timeDecaySet import clock
+from globalConfig import log
+from collections import deque
+import threading
+import json
+import zlib
+import zmq
+
+
+def dump_resource(resource, compress=False):
+    '''serialize a resource for a resource frame'''
+
+    body = json.dumps(resource, separators=(',', ':'))
+    if compress:
+        return zlib.compress(body)
+    return body
+
+
+def load_resource(body):
+    '''the resource from a resource frame, compressed or not (zlib data
+    starts with 'x', which JSON never does)'''
+
+    if body[:1] == 'x':
+        body = zlib.decompress(body)
+    return json.loads(body)
+
+
+
+class ZmqOutput(object):
+
+
+    def __init__(self, socket="tcp://127.0.0.1:5557", pattern='push', batch_size=1, \
+            flush_interval=1, hwm=1000, overflow='block', max_buffered=10000, \
+            resources=False, compress=False):
+        #socket = address to bind to
+        #pattern = 'push' or 'pub', see above
+        #batch_size = how many URIs to send in one message
+        #flush_interval = longest time, in s, a URI waits for its batch to fill
+        #hwm = ZMQ send high water mark, in messages
+        #overflow = 'block', 'drop' or 'buffer', what to do with a message
+        #       when the consumer is hwm messages behind
+        #max_buffered = how many messages the 'buffer' policy keeps
+        #resources = send each URI's resource in the frame after it
+        #compress = zlib compress resource frames
+
+        if pattern not in ('push', 'pub'):
+            raise ValueError('ZMQ OUTPUT: unknown pattern "%s"' % pattern)
+        if overflow not in ('block', 'drop', 'buffer'):
+            raise ValueError('ZMQ OUTPUT: unknown overflow policy "%s"' % overflow)
+
+        self.pattern = pattern
+        self.topics = (pattern == 'pub')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.resources = resources
+        self.compress = compress
+
+        context = zmq.Context.instance()
+        if self.topics:
+            self.socket = context.socket(zmq.PUB)
+        else:
+            self.socket = context.socket(zmq.PUSH)
+        self.socket.setsockopt(zmq.SNDHWM, hwm)
+        self.socket.bind(socket)
+
+        if overflow == 'block':
+            self._flags = 0
+        else:
+            self._flags = zmq.NOBLOCK
+
+        #topic -> (time the oldest was added, [frames of each uri]) waiting for
+        #their batch
+        self._pending = {}
+        #messages the consumer had no room for, with 'buffer'
+        self._backlog = deque(maxlen=max_buffered)
+        #ZMQ sockets aren't thread safe, everything that touches it holds this
+        self._lock = threading.RLock()
+
+        self.sent = 0
+        self.dropped = 0
+
+        #flush batches that have waited too long, even if nothing else is sent
+        self._stop = threading.Event()
+        self._flusher = None
+        if batch_size > 1 and flush_interval > 0:
+            self._flusher = threading.Thread(target=self.flush_loop)
+            self._flusher.daemon = True
+            self._flusher.start()
+
+        log.info( 'ZMQ OUTPUT: %s on %s, batches of %s, hwm %s, overflow %s', \
+                pattern, socket, batch_size, hwm, overflow )
+
+
+    def send(self, uri, topic=None, resource=None, label=None):
+        '''send uri (with topic, for pub, and its resource, with resources),
+        or add it to its batch.  label, if given, is sent as a frame of its
+        own just before the uri, with either pattern.'''
+
+        if not self.topics:
+            topic = None
+        elif topic is None:
+            topic = ''
+
+        frames = [uri.encode('utf-8')]
+        if label is not None:
+            frames.insert(0, label.encode('utf-8'))
+        if self.resources:
+            frames.append(dump_resource(resource, self.compress))
+
+        with self._lock:
+
+            if self.batch_size <= 1:
+                self.send_message(topic, [frames])
+                return
+
+            batch = self._pending.get(topic)
+            if batch is None:
+                batch = (clock(), [])
+                self._pending[topic] = batch
+            batch[1].append(frames)
+
+            if len(batch[1]) >= self.batch_size:
+                del self._pending[topic]
+                self.send_message(topic, batch[1])
+
+
+    def send_message(self, topic, batch):
+        '''send one multipart message of a batch of URIs (each a list of its
+        frames), after any backlog'''
+
+        uris = len(batch)
+        frames = [x for uri_frames in batch for x in uri_frames]
+        if topic is not None:
+            frames.insert(0, topic.encode('utf-8'))
+
+        with self._lock:
+
+            #keep messages in order: nothing new goes out before the backlog
+            if len(self._backlog):
+                self.send_backlog()
+                if len(self._backlog):
+                    self.buffer_message(frames, uris)
+                    return
+
+            try:
+                self.socket.send_multipart(frames, self._flags)
+                self.sent += uris
+
+            except zmq.Again:
+                if self.overflow == 'buffer':
+                    self.buffer_message(frames, uris)
+                else:
+                    self.dropped += uris
+                    log.warn( 'ZMQ OUTPUT: consumer too slow, dropped %s URIs (%s so far)', \
+                            uris, self.dropped )
+
+
+    def buffer_message(self, frames, count):
+
+        if len(self._backlog) == self._backlog.maxlen:
+            self.dropped += self._backlog[0][1]
+            log.warn( 'ZMQ OUTPUT: backlog full, dropped %s URIs (%s so far)', \
+                    self._backlog[0][1], self.dropped )
+        self._backlog.append((frames, count))
+
+
+    def send_backlog(self):
+        '''send as much of the backlog as the consumer has room for'''
+
+        with self._lock:
+            while len(self._backlog):
+                frames, count = self._backlog[0]
+                try:
+                    self.socket.send_multipart(frames, self._flags)
+                except zmq.Again:
+                    return
+                self._backlog.popleft()
+                self.sent += count
+
+
+    def flush(self, older_than=None):
+        '''send every waiting batch now, or only those whose oldest URI has
+        waited at least older_than seconds'''
+
+        with self._lock:
+            now = clock()
+            for topic, batch in self._pending.items():
+                if older_than is None or now - batch[0] >= older_than:
+                    del self._pending[topic]
+                    self.send_message(topic, batch[1])
+            self.send_backlog()
+
+
+    def flush_loop(self):
+        while not self._stop.wait(self.flush_interval / 2.0):
+            self.flush(self.flush_interval)
+
+
+    def stats(self):
+        with self._lock:
+            return {'sent':self.sent, 'dropped':self.dropped, \
+                    'waiting':sum(len(x[1]) for x in self._pending.values()), \
+                    'buffered':sum(x[1] for x in self._backlog)}
+
+
+    def close(self, linger=1000):
+        '''flush, then close the socket, waiting up to linger ms for queued
+        messages to go out'''
+
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+
+        with self._lock:
+            self.flush()
+            if len(self._backlog):
+                log.warn( 'ZMQ OUTPUT: closing with %s messages unsent', len(self._backlog) )
+            log.info( 'ZMQ OUTPUT: closed, %s', self.stats() )
+            self.socket.close(linger)